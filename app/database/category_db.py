@@ -1,8 +1,16 @@
 from bson import ObjectId
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
+from pymongo import ReturnDocument
 from app.database.connection import categories_collection
 from app.schemas.category import CategoryCreate, CategoryUpdate, CategoryInDB
+from app.utils.dataloader import DataLoader
+
+
+def _invalidate_name_index() -> None:
+    # category_index imports this module, so it is imported here
+    from app.utils import category_index
+    category_index.invalidate()
 
 
 async def create_category(category: CategoryCreate) -> CategoryInDB:
@@ -14,6 +22,7 @@ async def create_category(category: CategoryCreate) -> CategoryInDB:
     category_dict["updated_at"] = datetime.utcnow()
     
     result = await categories_collection.insert_one(category_dict)
+    _invalidate_name_index()
     
     created_category = await categories_collection.find_one({"_id": result.inserted_id})
     created_category["_id"] = str(created_category["_id"])
@@ -21,24 +30,67 @@ async def create_category(category: CategoryCreate) -> CategoryInDB:
     return CategoryInDB(**created_category)
 
 
+async def _load_categories(category_ids: List[str]) -> Dict[str, CategoryInDB]:
+    """
+    Batch function of category_loader: every requested category in one $in query.
+    """
+    keys_by_object_id: Dict[ObjectId, List[str]] = {}
+    for category_id in category_ids:
+        try:
+            keys_by_object_id.setdefault(ObjectId(category_id), []).append(category_id)
+        except Exception:
+            continue
+    if not keys_by_object_id:
+        return {}
+
+    categories = {}
+    async for category in categories_collection.find({"_id": {"$in": list(keys_by_object_id)}}):
+        object_id = category["_id"]
+        category["_id"] = str(object_id)
+        for key in keys_by_object_id[object_id]:
+            categories[key] = CategoryInDB(**category)
+    return categories
+
+
+category_loader = DataLoader("categories", _load_categories)
+
+
 async def get_category(category_id: str) -> Optional[CategoryInDB]:
     """
     Get a category by ID.
+    Lookups made at the same time are batched into one query (see category_loader).
     """
     try:
-        category = await categories_collection.find_one({"_id": ObjectId(category_id)})
-        if category:
-            category["_id"] = str(category["_id"])
-            return CategoryInDB(**category)
+        return await category_loader.load(category_id)
     except Exception:
         return None
-    return None
+
+
+async def get_categories_by_ids(category_ids: List[str]) -> Dict[str, CategoryInDB]:
+    """
+    Get several categories in one query, keyed by ID. Invalid or unknown IDs are left out.
+    """
+    object_ids = []
+    for category_id in set(category_ids):
+        try:
+            object_ids.append(ObjectId(category_id))
+        except Exception:
+            continue
+    if not object_ids:
+        return {}
+
+    categories = {}
+    async for category in categories_collection.find({"_id": {"$in": object_ids}}):
+        category["_id"] = str(category["_id"])
+        categories[category["_id"]] = CategoryInDB(**category)
+    return categories
 
 
 async def update_category(category_id: str, category_update: CategoryUpdate) -> Optional[CategoryInDB]:
     """
     Update a category by ID.
     """
+    category_loader.clear(category_id)
     try:
         category_dict = category_update.model_dump(exclude_unset=True)
         category_dict["updated_at"] = datetime.utcnow()
@@ -47,6 +99,7 @@ async def update_category(category_id: str, category_update: CategoryUpdate) ->
             {"_id": ObjectId(category_id)},
             {"$set": category_dict}
         )
+        _invalidate_name_index()
         
         updated_category = await categories_collection.find_one({"_id": ObjectId(category_id)})
         if updated_category:
@@ -71,12 +124,46 @@ async def get_all_categories() -> List[CategoryInDB]:
     return categories
 
 
+async def get_ranking_version(category_id: str) -> int:
+    """
+    Get the ranking version of a category (bumped whenever its ratings change).
+    """
+    try:
+        category = await categories_collection.find_one(
+            {"_id": ObjectId(category_id)},
+            {"ranking_version": 1}
+        )
+        if category:
+            return category.get("ranking_version", 0)
+    except Exception:
+        return 0
+    return 0
+
+
+async def bump_ranking_version(category_id: str) -> int:
+    """
+    Increment the ranking version of a category and return the new value.
+    """
+    category_loader.clear(category_id)
+    category = await categories_collection.find_one_and_update(
+        {"_id": ObjectId(category_id)},
+        {"$inc": {"ranking_version": 1}},
+        projection={"ranking_version": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if category:
+        return category["ranking_version"]
+    return 0
+
+
 async def delete_category(category_id: str) -> bool:
     """
     Delete a category by ID.
     """
+    category_loader.clear(category_id)
     try:
         result = await categories_collection.delete_one({"_id": ObjectId(category_id)})
+        _invalidate_name_index()
         return result.deleted_count > 0
     except Exception:
         return False
@@ -22,6 +22,7 @@ database = client[DB_NAME]
 users_collection: Collection = database.users
 categories_collection: Collection = database.categories
 ratings_collection: Collection = database.ratings
+current_ratings_collection: Collection = database.current_ratings
 matches_collection: Collection = database.matches
 
 async def get_database() -> Database:
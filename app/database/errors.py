@@ -0,0 +1,10 @@
+class ClaimConflict(Exception):
+    """
+    Rating states are claimed by another result, or the claim expired before the commit.
+    """
+
+
+class InvalidCursor(ValueError):
+    """
+    A paging cursor that cannot be decoded.
+    """
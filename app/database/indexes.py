@@ -0,0 +1,191 @@
+"""
+Indexes of every collection the db layer queries.
+
+    python -m app.database.indexes           # create missing indexes
+    python -m app.database.indexes --check   # ... then fail if a query shape needs a COLLSCAN
+
+create_indexes is idempotent, so the registry is applied on every startup.
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from typing import Any, Dict, Iterable, List, Optional
+from bson import ObjectId
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from app.database.connection import database
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        # create_user / update_user / login の重複チェック
+        IndexModel([("email", ASCENDING)], unique=True),
+        IndexModel([("intra_name", ASCENDING)], unique=True),
+        # search_users: anchored prefix regex on the normalized terms
+        IndexModel([("search_terms", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    "matches": [
+        # get_user_matches: $or on winner_id / loser_id, newest first
+        IndexModel([("winner_id", ASCENDING), ("date", DESCENDING)]),
+        IndexModel([("loser_id", ASCENDING), ("date", DESCENDING)]),
+        # get_category_matches and the rating replay
+        IndexModel([("category_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    "ratings": [
+        # get_user_rating_history (keyset pages in (date, _id) order) and get_user_rating_daily
+        IndexModel([("user_id", ASCENDING), ("category_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)]),
+        # rating replay: a category's history from a date on
+        IndexModel([("category_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    "current_ratings": [
+        # one state per player and category (also the $merge key of rebuild_current_ratings)
+        IndexModel([("user_id", ASCENDING), ("category_id", ASCENDING)], unique=True),
+        # category rankings
+        IndexModel([("category_id", ASCENDING), ("rate", DESCENDING), ("user_id", ASCENDING)]),
+    ],
+}
+
+
+def _find(collection: str, query: dict, sort: Optional[list] = None, **options: Any) -> Dict[str, Any]:
+    command = {"find": collection, "filter": query, **options}
+    if sort:
+        command["sort"] = dict(sort)
+    return command
+
+
+def _aggregate(collection: str, pipeline: List[dict]) -> Dict[str, Any]:
+    return {"aggregate": collection, "pipeline": pipeline, "cursor": {}}
+
+
+def query_shapes() -> Dict[str, Dict[str, Any]]:
+    """
+    The filter/sort shapes the db layer sends, as explain-able commands.
+    They are built with the db modules' own query builders, so they follow the real queries.
+    Full-collection reads (get_all_categories, leaderboard loading, rebuilds) are left out.
+    """
+    # rating_db imports this module, so the db modules are imported here
+    from app.database import match_db, rating_db, replay_db, user_db
+
+    user_id, other_id, category_id, now = ObjectId(), ObjectId(), ObjectId(), datetime.utcnow()
+    user, other, category = str(user_id), str(other_id), str(category_id)
+
+    def search(key: str, after: Optional[tuple] = None) -> Dict[str, Any]:
+        query = user_db.search_query(key, after)
+        options = {"hint": dict(query["hint"]), "min": dict(query["min"])}
+        if "max" in query:
+            options["max"] = dict(query["max"])
+        return _find("users", query["filter"], limit=user_db.SEARCH_LIMIT + 1, **options)
+
+    history = rating_db._history_query(user, category, now)
+    return {
+        "user_db.get_user_by_email": _find("users", {"email": "someone@example.com"}),
+        "user_db.create_user": _find("users", user_db._existing_user_query("someone@example.com", "someone")),
+        "user_db.search_users": search("someone"),
+        "user_db.search_users (next page)": search("someone", ("someone", user_id)),
+        "match_db.get_user_matches": _find("matches", match_db._user_matches_query(user), [("date", -1)]),
+        "match_db.get_category_matches": _find("matches", {"category_id": category_id}, [("date", -1)]),
+        "replay_db.replay_ratings (matches)": _find(
+            "matches", replay_db._replayed_query([category_id], now), replay_db.REPLAY_SORT
+        ),
+        "replay_db.replay_ratings (history)": _aggregate(
+            "ratings", replay_db._states_before_pipeline([category_id], now)
+        ),
+        "replay_db.replay_ratings (replaced players)": _aggregate(
+            "ratings", replay_db._replaced_players_pipeline([category_id], now)
+        ),
+        "rating_db.get_user_rating_history": _find("ratings", history, rating_db.HISTORY_SORT),
+        "rating_db.get_user_rating_history (next page)": _find(
+            "ratings", rating_db._history_after(history, now, ObjectId()), rating_db.HISTORY_SORT
+        ),
+        "rating_db.get_user_rating_daily": _aggregate(
+            "ratings", rating_db._rating_daily_pipeline(user, category)
+        ),
+        "rating_db.get_user_current_rating": _find(
+            "current_ratings", rating_db._user_current_rating_query(user, category)
+        ),
+        "rating_db.get_current_ratings (category)": _find(
+            "current_ratings", rating_db._current_ratings_query(category)
+        ),
+        "rating_db.claim_current_ratings": _find(
+            "current_ratings", rating_db._claimed_filter([(user, category), (other, category)], ObjectId())
+        ),
+        "rating_db.get_category_rankings": _aggregate(
+            "current_ratings", rating_db._category_rankings_pipeline(category, 0, 10)
+        ),
+    }
+
+
+async def ensure_indexes(collections: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Create the registered indexes (of the given collections, or all of them).
+    Returns the errors of indexes that could not be built, e.g. a unique index over duplicate data.
+    """
+    errors = []
+    for name in collections or INDEXES:
+        for index in INDEXES[name]:
+            try:
+                await database[name].create_indexes([index])
+            except OperationFailure as e:
+                errors.append(f"{name}.{index.document['name']}: {e}")
+    for error in errors:
+        logger.error("Index not created: %s", error)
+    return errors
+
+
+def find_collscans(explain: Any) -> List[dict]:
+    """
+    COLLSCAN stages of the winning plan(s) in an explain() result.
+    """
+    found = []
+    if isinstance(explain, dict):
+        if explain.get("stage") == "COLLSCAN":
+            found.append(explain)
+        for key, value in explain.items():
+            # 採用されなかったプランは見ない
+            if key != "rejectedPlans":
+                found.extend(find_collscans(value))
+    elif isinstance(explain, list):
+        for value in explain:
+            found.extend(find_collscans(value))
+    return found
+
+
+async def check_query_plans() -> List[str]:
+    """
+    explain() every registered query shape and list those that fall back to a COLLSCAN.
+    """
+    failures = []
+    for name, command in query_shapes().items():
+        explain = await database.command("explain", command, verbosity="queryPlanner")
+        if find_collscans(explain):
+            failures.append(name)
+    return failures
+
+
+async def _main(check: bool) -> int:
+    errors = await ensure_indexes()
+    for error in errors:
+        print(f"index error: {error}")
+    if not check:
+        return 1 if errors else 0
+
+    failures = await check_query_plans()
+    for name in failures:
+        print(f"COLLSCAN: {name}")
+    print(f"{len(query_shapes()) - len(failures)} of {len(query_shapes())} query shapes use an index")
+    return 1 if errors or failures else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create the registered MongoDB indexes.")
+    parser.add_argument("--check", action="store_true",
+                        help="also explain() every db-layer query shape and fail on a COLLSCAN")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(_main(args.check)))
+
+
+if __name__ == "__main__":
+    main()
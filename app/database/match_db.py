@@ -5,11 +5,12 @@ from app.database.connection import matches_collection
 from app.schemas.match import MatchCreate, MatchUpdate, MatchInDB
 
 
-async def create_match(match: MatchCreate) -> MatchInDB:
+def build_match_document(match: MatchCreate) -> dict:
     """
-    Create a new match in the database.
+    Build the stored form of a match, with its _id assigned up front.
     """
     match_dict = match.model_dump()
+    match_dict["_id"] = ObjectId()
     match_dict["created_at"] = datetime.utcnow()
     match_dict["updated_at"] = datetime.utcnow()
     
@@ -18,9 +19,33 @@ async def create_match(match: MatchCreate) -> MatchInDB:
     match_dict["loser_id"] = ObjectId(match_dict["loser_id"])
     match_dict["category_id"] = ObjectId(match_dict["category_id"])
     
-    result = await matches_collection.insert_one(match_dict)
+    return match_dict
+
+
+async def insert_match_document(match_dict: dict, session=None) -> None:
+    """
+    Insert a match built by build_match_document.
+    """
+    await matches_collection.insert_one(match_dict, session=session)
+
+
+async def insert_match_documents(match_dicts: List[dict], session=None) -> None:
+    """
+    Insert several matches built by build_match_document in one round trip.
+    """
+    if match_dicts:
+        await matches_collection.insert_many(match_dicts, ordered=False, session=session)
+
+
+async def create_match(match: MatchCreate) -> MatchInDB:
+    """
+    Create a new match in the database.
+    """
+    match_dict = build_match_document(match)
+    
+    await matches_collection.insert_one(match_dict)
     
-    created_match = await matches_collection.find_one({"_id": result.inserted_id})
+    created_match = dict(match_dict)
     
     # Convert ObjectId back to string for response
     created_match["_id"] = str(created_match["_id"])
@@ -48,17 +73,21 @@ async def get_match(match_id: str) -> Optional[MatchInDB]:
     return None
 
 
+def _user_matches_query(user_id: str) -> dict:
+    return {
+        "$or": [
+            {"winner_id": ObjectId(user_id)},
+            {"loser_id": ObjectId(user_id)}
+        ]
+    }
+
+
 async def get_user_matches(user_id: str) -> List[MatchInDB]:
     """
     Get all matches for a user (either as winner or loser).
     """
     try:
-        cursor = matches_collection.find({
-            "$or": [
-                {"winner_id": ObjectId(user_id)},
-                {"loser_id": ObjectId(user_id)}
-            ]
-        }).sort("date", -1)
+        cursor = matches_collection.find(_user_matches_query(user_id)).sort("date", -1)
         
         matches = []
         async for match in cursor:
@@ -96,6 +125,8 @@ async def get_category_matches(category_id: str) -> List[MatchInDB]:
 async def update_match(match_id: str, match_update: MatchUpdate) -> Optional[MatchInDB]:
     """
     Update a match by ID.
+    Ratings are not recomputed here: after moving a match to another date, replay its
+    category from the earlier of the two dates (python -m app.database.replay_db --since ...).
     """
     try:
         match_dict = match_update.model_dump(exclude_unset=True)
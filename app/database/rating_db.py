@@ -1,17 +1,247 @@
+import asyncio
+import base64
+import random
+import weakref
+from contextlib import asynccontextmanager
 from bson import ObjectId
-from datetime import datetime
-from typing import List, Optional
-from app.database.connection import ratings_collection
-from app.schemas.rating import RatingCreate, RatingInDB
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.database.connection import ratings_collection, current_ratings_collection
+from app.database import indexes
+from app.database.errors import ClaimConflict, InvalidCursor
+from app.schemas.rating import RatingCreate, RatingInDB, RatingOHLC, CurrentRatingInDB, RankedRatingInDB
+from app.utils.rating_calculator import get_initial_rating
 
-from collections import defaultdict
+# Rating state claims (compare-and-swap on current_ratings.claim)
+CLAIM_SECONDS = 10
+CLAIM_MAX_ATTEMPTS = 50
+CLAIM_BACKOFF = 0.002
+CLAIM_BACKOFF_MAX = 0.05
 
+# Order of a user's rating history (also the keyset of its pages)
+HISTORY_SORT = [("date", 1), ("_id", 1)]
 
-async def create_rating(rating: RatingCreate) -> RatingInDB:
+
+def _current_rating_from_doc(doc: dict) -> CurrentRatingInDB:
     """
-    Create a new rating in the database (履歴として追加).
+    Convert a current_ratings document into a CurrentRatingInDB.
+    """
+    doc["_id"] = str(doc["_id"])
+    doc["user_id"] = str(doc["user_id"])
+    doc["category_id"] = str(doc["category_id"])
+    doc["rating_id"] = str(doc["rating_id"])
+    return CurrentRatingInDB(**doc)
+
+
+def _current_rating_update(rating: dict) -> dict:
+    """
+    Build the current_ratings update applying a newly inserted rating history document.
+
+    The state follows the order in which results are recorded: rate and rating_id are those
+    of the last rating applied, even if a result arrives with an earlier date than one already
+    recorded. last_match_date only moves forward. rebuild_current_ratings and replay_db go
+    through the history in date order instead, so they agree with the live state as long as
+    results are recorded in date order.
+    """
+    now = datetime.utcnow()
+    return {
+        "$set": {
+            "rate": rating["rate"],
+            "rating_id": rating["_id"],
+            "updated_at": now
+        },
+        "$inc": {"games_played": 1, "version": 1},
+        "$max": {"peak_rating": rating["rate"], "last_match_date": rating["date"]},
+        "$setOnInsert": {"created_at": now}
+    }
+
+
+async def upsert_current_rating(rating: dict) -> None:
+    """
+    Apply a newly inserted rating history document to the current_ratings read model.
+    """
+    await current_ratings_collection.update_one(
+        {
+            "user_id": rating["user_id"],
+            "category_id": rating["category_id"]
+        },
+        _current_rating_update(rating),
+        upsert=True
+    )
+
+
+class RatingClaim:
+    """
+    Rating states claimed for Elo updates, keyed by (user_id, category_id).
+    """
+
+    def __init__(self):
+        self.token = ObjectId()
+        self.states: Dict[Tuple[str, str], dict] = {}
+        self.committed = False
+
+
+# ワーカー内の同じ(ユーザー, カテゴリ)への更新はここで順番待ちする
+_local_locks: "weakref.WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _state_filter(keys: List[Tuple[str, str]]) -> dict:
+    """
+    Query matching the rating states of several (user_id, category_id) keys.
+    """
+    return {"$or": [
+        {"user_id": ObjectId(user_id), "category_id": ObjectId(category_id)}
+        for user_id, category_id in keys
+    ]}
+
+
+def _claimed_filter(keys: List[Tuple[str, str]], token: ObjectId) -> dict:
+    """
+    Query matching the states of keys that are claimed with token.
+    """
+    query = _state_filter(keys)
+    query["claim"] = token
+    return query
+
+
+async def _try_claim(keys: List[Tuple[str, str]], token: ObjectId) -> Dict[Tuple[str, str], dict]:
+    """
+    Try once to claim every state with a compare-and-swap on its claim field.
+    Returns the states that were claimed.
+    """
+    now = datetime.utcnow()
+    operations = [
+        # 未取得（または期限切れ）の場合だけ取得できる。未作成なら初期レートで作る
+        UpdateOne(
+            {
+                "user_id": ObjectId(user_id),
+                "category_id": ObjectId(category_id),
+                "$or": [{"claim": None}, {"claim_expires": {"$lt": now}}]
+            },
+            {
+                "$set": {"claim": token, "claim_expires": now + timedelta(seconds=CLAIM_SECONDS)},
+                "$setOnInsert": {
+                    "rate": get_initial_rating(),
+                    "games_played": 0,
+                    "version": 0,
+                    "created_at": now
+                }
+            },
+            upsert=True
+        )
+        for user_id, category_id in keys
+    ]
+    try:
+        await current_ratings_collection.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # A duplicate key means the state exists and is claimed by another result
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+    claimed = {}
+    async for state in current_ratings_collection.find(_claimed_filter(keys, token)):
+        claimed[(str(state["user_id"]), str(state["category_id"]))] = state
+    return claimed
+
+
+async def _release(keys: List[Tuple[str, str]], token: ObjectId) -> None:
+    """
+    Release claimed rating states without changing them.
+    """
+    await current_ratings_collection.update_many(
+        _claimed_filter(keys, token),
+        {"$unset": {"claim": "", "claim_expires": ""}}
+    )
+
+
+@asynccontextmanager
+async def claim_current_ratings(keys: List[Tuple[str, str]]) -> AsyncIterator[RatingClaim]:
+    """
+    Claim the rating states of (user_id, category_id) keys for Elo updates.
+    Either every state is claimed or, after releasing them all, the claim is
+    retried with backoff, so two results sharing a player are applied one
+    after the other instead of overwriting each other's update.
+    Results in the same worker wait on local locks (taken in key order) first,
+    so the database compare-and-swap only arbitrates between workers.
+    Claims that were not committed are released on exit.
+    Raises ClaimConflict when the states stay claimed by others.
+    """
+    keys = sorted(set(keys))
+    claim = RatingClaim()
+    locks = []
+    try:
+        for key in keys:
+            lock = _local_locks.setdefault(key, asyncio.Lock())
+            await lock.acquire()
+            locks.append(lock)
+
+        for attempt in range(CLAIM_MAX_ATTEMPTS):
+            claim.states = await _try_claim(keys, claim.token)
+            if len(claim.states) == len(keys):
+                break
+            # 一部しか取れなければ全部手放してやり直す（デッドロック防止）
+            if claim.states:
+                await _release(list(claim.states), claim.token)
+                claim.states = {}
+            await asyncio.sleep(random.uniform(0, min(CLAIM_BACKOFF_MAX, CLAIM_BACKOFF * 2 ** attempt)))
+        else:
+            raise ClaimConflict("Rating is being updated by another result, please retry")
+
+        yield claim
+    finally:
+        try:
+            if claim.states and not claim.committed:
+                await _release(list(claim.states), claim.token)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+async def commit_current_ratings(claim: RatingClaim, rating_dicts: List[dict], session=None) -> None:
+    """
+    Apply new ratings (in order) to the claimed states and release them, in one bulk write.
+    Raises ClaimConflict if a claim expired and was taken over in the meantime.
+    """
+    # 同じ状態への複数のレーティングは1つの更新にまとめる
+    updates: Dict[Tuple[ObjectId, ObjectId], dict] = {}
+    for rating_dict in rating_dicts:
+        key = (rating_dict["user_id"], rating_dict["category_id"])
+        update = updates.get(key)
+        if update is None:
+            update = _current_rating_update(rating_dict)
+            del update["$setOnInsert"]
+            update["$unset"] = {"claim": "", "claim_expires": ""}
+            updates[key] = update
+            continue
+        update["$set"].update({
+            "rate": rating_dict["rate"],
+            "rating_id": rating_dict["_id"]
+        })
+        update["$inc"]["games_played"] += 1
+        update["$inc"]["version"] += 1
+        update["$max"]["peak_rating"] = max(update["$max"]["peak_rating"], rating_dict["rate"])
+        update["$max"]["last_match_date"] = max(update["$max"]["last_match_date"], rating_dict["date"])
+
+    operations = [
+        UpdateOne({"user_id": user_id, "category_id": category_id, "claim": claim.token}, update)
+        for (user_id, category_id), update in updates.items()
+    ]
+    result = await current_ratings_collection.bulk_write(operations, ordered=False, session=session)
+    if result.matched_count != len(operations):
+        # 期限切れで他の結果に取られた
+        raise ClaimConflict("Rating claim expired before the result was saved")
+    claim.committed = True
+
+
+def build_rating_document(rating: RatingCreate, match_id: Optional[ObjectId] = None, version: Optional[int] = None) -> dict:
+    """
+    Build the stored form of a rating, with its _id assigned up front.
+    match_id and version link the rating to the match and rating state version that produced it.
     """
     rating_dict = rating.model_dump()
+    rating_dict["_id"] = ObjectId()
     rating_dict["created_at"] = datetime.utcnow()
     rating_dict["updated_at"] = datetime.utcnow()
 
@@ -19,10 +249,35 @@ async def create_rating(rating: RatingCreate) -> RatingInDB:
     rating_dict["user_id"] = ObjectId(rating_dict["user_id"])
     rating_dict["category_id"] = ObjectId(rating_dict["category_id"])
 
-    result = await ratings_collection.insert_one(rating_dict)
-    created_rating = await ratings_collection.find_one({"_id": result.inserted_id})
+    if match_id is not None:
+        rating_dict["match_id"] = match_id
+    if version is not None:
+        rating_dict["version"] = version
+
+    return rating_dict
+
+
+async def insert_rating_documents(rating_dicts: List[dict], session=None) -> None:
+    """
+    Insert ratings built by build_rating_document into the history with one write.
+    """
+    await ratings_collection.insert_many(rating_dicts, ordered=True, session=session)
+
+
+async def create_rating(rating: RatingCreate) -> RatingInDB:
+    """
+    Create a new rating in the database (履歴として追加).
+    The current_ratings read model is updated in the same step.
+    """
+    rating_dict = build_rating_document(rating)
+
+    await ratings_collection.insert_one(rating_dict)
+
+    # 現在のレーティングを更新
+    await upsert_current_rating(rating_dict)
 
     # Convert ObjectId back to string for response
+    created_rating = dict(rating_dict)
     created_rating["_id"] = str(created_rating["_id"])
     created_rating["user_id"] = str(created_rating["user_id"])
     created_rating["category_id"] = str(created_rating["category_id"])
@@ -46,37 +301,110 @@ async def get_rating(rating_id: str) -> Optional[RatingInDB]:
     return None
 
 
-async def get_user_category_rating(user_id: str, category_id: str) -> Optional[RatingInDB]:
+def _user_current_rating_query(user_id: str, category_id: str) -> dict:
+    return {
+        "user_id": ObjectId(user_id),
+        "category_id": ObjectId(category_id),
+        "games_played": {"$gt": 0}
+    }
+
+
+async def get_user_current_rating(user_id: str, category_id: str) -> Optional[CurrentRatingInDB]:
     """
-    Get the latest rating for a user and category.
+    Get the current rating state (games played, peak rating, ...) for a user and category.
     """
     try:
-        rating = await ratings_collection.find_one(
-            {
-                "user_id": ObjectId(user_id),
-                "category_id": ObjectId(category_id)
-            },
-            sort=[("date", -1)]  # 最新のレーティングを取得
-        )
-        if rating:
-            rating["_id"] = str(rating["_id"])
-            rating["user_id"] = str(rating["user_id"])
-            rating["category_id"] = str(rating["category_id"])
-            return RatingInDB(**rating)
+        current = await current_ratings_collection.find_one(_user_current_rating_query(user_id, category_id))
+        if current:
+            return _current_rating_from_doc(current)
     except Exception:
         return None
     return None
 
 
-async def get_user_rating_history(user_id: str, category_id: str) -> List[RatingInDB]:
+async def get_user_category_rating(user_id: str, category_id: str) -> Optional[RatingInDB]:
     """
-    Get full rating history for a user in a category.
+    Get the latest rating for a user and category.
     """
+    current = await get_user_current_rating(user_id, category_id)
+    if not current:
+        return None
+
+    # 最新の履歴ドキュメントと同じ形で返す
+    return RatingInDB(
+        _id=current.rating_id,
+        user_id=current.user_id,
+        category_id=current.category_id,
+        rate=current.rate,
+        date=current.last_match_date,
+        created_at=current.created_at,
+        updated_at=current.updated_at
+    )
+
+
+def encode_history_cursor(rating: RatingInDB) -> str:
+    """
+    Opaque keyset cursor pointing just after a rating history document.
+    """
+    raw = f"{rating.date.isoformat()}|{rating.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_history_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
     try:
-        cursor = ratings_collection.find({
-            "user_id": ObjectId(user_id),
-            "category_id": ObjectId(category_id)
-        }).sort("date", 1)
+        date, rating_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(date), ObjectId(rating_id)
+    except Exception:
+        raise InvalidCursor(cursor)
+
+
+def _history_query(
+    user_id: str,
+    category_id: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+) -> dict:
+    query = {"user_id": ObjectId(user_id), "category_id": ObjectId(category_id)}
+    date_range = {}
+    if date_from is not None:
+        date_range["$gte"] = date_from
+    if date_to is not None:
+        date_range["$lte"] = date_to
+    if date_range:
+        query["date"] = date_range
+    return query
+
+
+def _history_after(query: dict, date: datetime, rating_id: ObjectId) -> dict:
+    # キーセットページング: (date, _id) が cursor より後のもの
+    return {"$and": [query, {"$or": [
+        {"date": {"$gt": date}},
+        {"date": date, "_id": {"$gt": rating_id}}
+    ]}]}
+
+
+async def get_user_rating_history(
+    user_id: str,
+    category_id: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = None
+) -> List[RatingInDB]:
+    """
+    Get the rating history for a user in a category, oldest first.
+    date_from / date_to bound the dates (inclusive); after (a cursor from
+    encode_history_cursor) and limit page through it in (date, _id) order.
+    Raises InvalidCursor when after cannot be decoded.
+    """
+    query = _history_query(user_id, category_id, date_from, date_to)
+    if after is not None:
+        query = _history_after(query, *_decode_history_cursor(after))
+
+    try:
+        cursor = ratings_collection.find(query).sort(HISTORY_SORT)
+        if limit is not None:
+            cursor = cursor.limit(limit)
 
         ratings = []
         async for rating in cursor:
@@ -90,35 +418,168 @@ async def get_user_rating_history(user_id: str, category_id: str) -> List[Rating
         return []
 
 
+def _rating_daily_pipeline(
+    user_id: str,
+    category_id: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+) -> List[dict]:
+    return [
+        {"$match": _history_query(user_id, category_id, date_from, date_to)},
+        {"$sort": {"date": 1, "_id": 1}},
+        {"$group": {
+            # $dateTrunc は MongoDB 5.0 以降なので日付の部品から組み立てる
+            "_id": {"$dateFromParts": {
+                "year": {"$year": "$date"},
+                "month": {"$month": "$date"},
+                "day": {"$dayOfMonth": "$date"}
+            }},
+            "open": {"$first": "$rate"},
+            "high": {"$max": "$rate"},
+            "low": {"$min": "$rate"},
+            "close": {"$last": "$rate"},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
 
 
-async def get_category_rankings(category_id: str) -> List[RatingInDB]:
+async def get_user_rating_daily(
+    user_id: str,
+    category_id: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+) -> List[RatingOHLC]:
     """
-    Get latest ratings for a category, sorted by rate descending, with duplicates (by user) removed.
+    Aggregate the rating history into daily (UTC) open/high/low/close buckets.
     """
+    pipeline = _rating_daily_pipeline(user_id, category_id, date_from, date_to)
     try:
-        cursor = ratings_collection.find(
-            {"category_id": ObjectId(category_id)}
-        ).sort("rate", -1)
+        buckets = []
+        async for bucket in ratings_collection.aggregate(pipeline):
+            bucket["date"] = bucket.pop("_id")
+            buckets.append(RatingOHLC(**bucket))
+        return buckets
+    except Exception:
+        return []
 
-        # ユーザーごとの最新評価を格納するための辞書
-        user_ratings = defaultdict(lambda: None)
-        
-        async for rating in cursor:
-            user_id = str(rating["user_id"])
-            # 最新の評価のみを保持
-            if user_ratings[user_id] is None or rating["rate"] > user_ratings[user_id]["rate"]:
-                rating["_id"] = str(rating["_id"])
-                rating["user_id"] = user_id
-                rating["category_id"] = str(rating["category_id"])
-                user_ratings[user_id] = rating
-        
-        # 辞書に格納された評価をリストに変換
-        ratings = [RatingInDB(**rating) for rating in user_ratings.values()]
-        
-        # レートで降順にソート
-        ratings.sort(key=lambda r: r.rate, reverse=True)
+
+def _current_ratings_query(category_id: Optional[str] = None) -> dict:
+    # 初回対戦中の仮ドキュメントは除外
+    query = {"games_played": {"$gt": 0}}
+    if category_id is not None:
+        query["category_id"] = ObjectId(category_id)
+    return query
+
+
+async def get_current_ratings(category_id: Optional[str] = None) -> List[CurrentRatingInDB]:
+    """
+    Get every current rating, optionally limited to one category.
+    """
+    ratings = []
+    async for current in current_ratings_collection.find(_current_ratings_query(category_id)):
+        ratings.append(_current_rating_from_doc(current))
+
+    return ratings
+
+
+def _category_rankings_pipeline(category_id: str, offset: int, limit: Optional[int]) -> List[dict]:
+    """
+    Build the ranking pipeline for a category.
+    Ties share a competition rank (1, 1, 3) and a dense rank (1, 1, 2).
+    """
+    pipeline = [
+        {"$match": {"category_id": ObjectId(category_id), "games_played": {"$gt": 0}}},
+        {"$setWindowFields": {
+            "partitionBy": "$category_id",
+            "sortBy": {"rate": -1},
+            "output": {
+                "rank": {"$rank": {}},
+                "dense_rank": {"$denseRank": {}}
+            }
+        }},
+        # 同順位はuser_id順で並べてページングを安定させる
+        {"$sort": {"rank": 1, "user_id": 1}},
+        {"$skip": offset}
+    ]
+    if limit is not None:
+        pipeline.append({"$limit": limit})
+    return pipeline
+
+
+async def get_category_rankings(
+    category_id: str,
+    limit: Optional[int] = None,
+    offset: int = 0
+) -> List[RankedRatingInDB]:
+    """
+    Get a page of current ratings for a category, ranked by rate descending (one entry per user).
+    """
+    try:
+        cursor = current_ratings_collection.aggregate(
+            _category_rankings_pipeline(category_id, offset, limit)
+        )
+
+        ratings = []
+        async for current in cursor:
+            current["_id"] = str(current["_id"])
+            current["user_id"] = str(current["user_id"])
+            current["category_id"] = str(current["category_id"])
+            current["rating_id"] = str(current["rating_id"])
+            ratings.append(RankedRatingInDB(**current))
 
         return ratings
     except Exception:
         return []
+
+
+async def rebuild_current_ratings() -> None:
+    """
+    Rebuild the current_ratings read model from the ratings history.
+    """
+    await indexes.ensure_indexes(["current_ratings"])
+    pipeline = [
+        {"$sort": {"date": 1, "_id": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "category_id": "$category_id"},
+            "rate": {"$last": "$rate"},
+            "rating_id": {"$last": "$_id"},
+            "last_match_date": {"$last": "$date"},
+            "games_played": {"$sum": 1},
+            "peak_rating": {"$max": "$rate"},
+            "created_at": {"$first": "$created_at"},
+            "updated_at": {"$last": "$updated_at"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "category_id": "$_id.category_id",
+            "rate": 1,
+            "rating_id": 1,
+            "last_match_date": 1,
+            "games_played": 1,
+            "version": "$games_played",
+            "peak_rating": 1,
+            "created_at": 1,
+            "updated_at": 1
+        }},
+        {"$merge": {
+            "into": current_ratings_collection.name,
+            "on": ["user_id", "category_id"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+    await ratings_collection.aggregate(pipeline).to_list(length=None)
+
+
+async def ensure_current_ratings() -> None:
+    """
+    Backfill current_ratings from the history if it has never been built.
+    """
+    await indexes.ensure_indexes(["current_ratings"])
+    if await current_ratings_collection.find_one({}) is not None:
+        return
+    if await ratings_collection.find_one({}) is None:
+        return
+    await rebuild_current_ratings()
@@ -0,0 +1,299 @@
+"""
+Recompute ratings from the match history.
+
+    python -m app.database.replay_db [--since 2024-01-01T00:00:00] [CATEGORY_ID ...]
+
+Without category IDs every category is replayed. With --since only matches on
+or after that date are replayed, starting from each player's rating just before it.
+"""
+import argparse
+import asyncio
+import time
+from bson import ObjectId
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from pymongo import DeleteOne, UpdateOne
+from decouple import config
+from app.database.connection import (
+    categories_collection,
+    client,
+    current_ratings_collection,
+    database,
+    matches_collection,
+    ratings_collection,
+)
+from app.database import category_db
+from app.utils.elo_replay import replay_elo
+from app.utils.rating_calculator import DEFAULT_K_FACTOR, get_initial_rating
+
+# Documents per insert_many / bulk_write call
+WRITE_BATCH = 5000
+
+# Matches replayed at a time (the Elo state carries over from one chunk to the next)
+REPLAY_CHUNK = config("REPLAY_CHUNK", default=50000, cast=int)
+
+# Order in which matches are replayed
+REPLAY_SORT = [("date", 1), ("_id", 1)]
+
+# レプリカセット／シャードクラスタでは履歴の入れ替えをトランザクションで行う
+USE_TRANSACTIONS = config("MONGO_TRANSACTIONS", default=False, cast=bool)
+
+# Most staged ratings plus current rating writes swapped in one transaction. Larger replays
+# (e.g. a full history) would hit MongoDB's transaction time and size limits, so they use
+# the restartable insert-then-delete swap instead.
+TRANSACTION_MAX_WRITES = config("REPLAY_TRANSACTION_MAX_WRITES", default=10000, cast=int)
+
+
+def _replayed_query(category_ids: List[ObjectId], since: Optional[datetime]) -> dict:
+    """
+    Query matching the matches (and the ratings) dated since onward in the categories.
+    """
+    query = {"category_id": {"$in": category_ids}}
+    if since is not None:
+        query["date"] = {"$gte": since}
+    return query
+
+
+def _states_before_pipeline(category_ids: List[ObjectId], since: datetime) -> List[dict]:
+    return [
+        {"$match": {"category_id": {"$in": category_ids}, "date": {"$lt": since}}},
+        {"$sort": {"date": 1, "_id": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "category_id": "$category_id"},
+            "rate": {"$last": "$rate"},
+            "rating_id": {"$last": "$_id"},
+            "last_match_date": {"$last": "$date"},
+            "games_played": {"$sum": 1},
+            "peak_rating": {"$max": "$rate"}
+        }}
+    ]
+
+
+def _replaced_players_pipeline(category_ids: List[ObjectId], since: Optional[datetime]) -> List[dict]:
+    return [
+        {"$match": _replayed_query(category_ids, since)},
+        {"$group": {"_id": {"user_id": "$user_id", "category_id": "$category_id"}}}
+    ]
+
+
+async def _states_before(category_ids: List[ObjectId], since: datetime) -> Dict[Tuple[ObjectId, ObjectId], dict]:
+    """
+    Each player's rating state from the history before since.
+    """
+    states = {}
+    async for state in ratings_collection.aggregate(_states_before_pipeline(category_ids, since)):
+        states[(state["_id"]["user_id"], state["_id"]["category_id"])] = state
+    return states
+
+
+async def _replaced_players(category_ids: List[ObjectId], since: Optional[datetime]) -> List[Tuple[ObjectId, ObjectId]]:
+    """
+    Players with ratings in the part of the history that is regenerated.
+    """
+    return [
+        (doc["_id"]["user_id"], doc["_id"]["category_id"])
+        async for doc in ratings_collection.aggregate(_replaced_players_pipeline(category_ids, since))
+    ]
+
+
+async def _write_in_batches(write, documents: list) -> None:
+    for start in range(0, len(documents), WRITE_BATCH):
+        await write(documents[start:start + WRITE_BATCH])
+
+
+async def _swap_in(staging, replaced_query: dict, token: ObjectId, operations: list, session=None) -> None:
+    """
+    Move the staged history into ratings in place of the replaced ratings, and write the current ratings.
+    """
+    if session is not None:
+        # トランザクション内では古い履歴を先に消しても読み手には見えない
+        await ratings_collection.delete_many(replaced_query, session=session)
+
+    batch = []
+    async for rating in staging.find({}, session=session).batch_size(WRITE_BATCH):
+        batch.append(rating)
+        if len(batch) == WRITE_BATCH:
+            await ratings_collection.insert_many(batch, ordered=False, session=session)
+            batch = []
+    if batch:
+        await ratings_collection.insert_many(batch, ordered=False, session=session)
+
+    if session is None:
+        # 新しい履歴を入れてから古い履歴を消す（途中で止まっても履歴は空にならない）
+        await ratings_collection.delete_many({**replaced_query, "replay_id": {"$ne": token}})
+
+    await _write_in_batches(
+        lambda batch: current_ratings_collection.bulk_write(batch, ordered=False, session=session),
+        operations
+    )
+
+
+async def replay_ratings(
+    category_ids: Optional[List[str]] = None,
+    since: Optional[datetime] = None,
+    k_factor: int = DEFAULT_K_FACTOR
+) -> dict:
+    """
+    Regenerate the rating history of categories from their matches, in date order.
+
+    Ratings dated since onward (all of them when since is None) are replaced by
+    ratings replayed from the matches in that range, and the current ratings of the
+    affected players are rewritten.
+
+    Matches are read from the cursor REPLAY_CHUNK at a time; each chunk is replayed
+    from the ratings the previous one ended with and its history is written to a
+    staging collection, so nothing live changes until the whole replay is computed.
+    The staged history is then swapped in: in one transaction with MONGO_TRANSACTIONS
+    when it is at most TRANSACTION_MAX_WRITES writes (small --since replays), otherwise
+    by inserting it before deleting the replaced ratings (readers may see both for a
+    moment, never neither; running the replay again finishes an interrupted swap).
+
+    The current ratings are written without taking the claims of record_match_result,
+    so run it while results for these categories are not being recorded.
+    """
+    started = time.perf_counter()
+    if category_ids is None:
+        category_oids = [doc["_id"] async for doc in categories_collection.find({}, {"_id": 1})]
+    else:
+        category_oids = [ObjectId(category_id) for category_id in category_ids]
+
+    states = await _states_before(category_oids, since) if since is not None else {}
+    replaced = await _replaced_players(category_oids, since)
+
+    # Players are numbered per (user, category) so categories replay side by side
+    keys: List[Tuple[ObjectId, ObjectId]] = []
+    index: Dict[Tuple[ObjectId, ObjectId], int] = {}
+    rates: List[float] = []
+
+    def player(user_id: ObjectId, category_id: ObjectId) -> int:
+        key = (user_id, category_id)
+        i = index.get(key)
+        if i is None:
+            i = index[key] = len(keys)
+            keys.append(key)
+            rates.append(states[key]["rate"] if key in states else get_initial_rating())
+        return i
+
+    for key in list(states) + replaced:
+        player(*key)
+
+    # 各プレイヤーの最終状態
+    now = datetime.utcnow()
+    final = {
+        key: {
+            "rate": state["rate"],
+            "rating_id": state["rating_id"],
+            "last_match_date": state["last_match_date"],
+            "games_played": state["games_played"],
+            "peak_rating": state["peak_rating"]
+        }
+        for key, state in states.items()
+    }
+
+    token = ObjectId()
+    staging = database[f"ratings_replay_{token}"]
+    totals = {"matches": 0, "ratings": 0, "waves": 0}
+
+    async def replay_chunk(matches: List[dict], winners: List[int], losers: List[int]) -> None:
+        winner_rates, loser_rates, final_rates, waves = replay_elo(winners, losers, rates, k_factor)
+        rates[:] = final_rates.tolist()
+
+        new_ratings = []
+        for match, winner_rate, loser_rate in zip(matches, winner_rates.tolist(), loser_rates.tolist()):
+            for user_id, rate in ((match["winner_id"], winner_rate), (match["loser_id"], loser_rate)):
+                key = (user_id, match["category_id"])
+                state = final.get(key)
+                if state is None:
+                    state = final[key] = {"games_played": 0, "peak_rating": rate}
+                rating_id = ObjectId()
+                state["rate"] = rate
+                state["rating_id"] = rating_id
+                state["last_match_date"] = match["date"]
+                state["games_played"] += 1
+                state["peak_rating"] = max(state["peak_rating"], rate)
+                new_ratings.append({
+                    "_id": rating_id,
+                    "user_id": user_id,
+                    "category_id": match["category_id"],
+                    "rate": rate,
+                    "date": match["date"],
+                    "match_id": match["_id"],
+                    "version": state["games_played"],
+                    "replay_id": token,
+                    "created_at": now,
+                    "updated_at": now
+                })
+
+        await _write_in_batches(lambda batch: staging.insert_many(batch, ordered=False), new_ratings)
+        totals["matches"] += len(matches)
+        totals["ratings"] += len(new_ratings)
+        totals["waves"] += waves
+
+    query = _replayed_query(category_oids, since)
+
+    try:
+        cursor = matches_collection.find(
+            query,
+            {"winner_id": 1, "loser_id": 1, "category_id": 1, "date": 1}
+        ).sort(REPLAY_SORT).batch_size(WRITE_BATCH)
+
+        matches, winners, losers = [], [], []
+        async for match in cursor:
+            matches.append(match)
+            winners.append(player(match["winner_id"], match["category_id"]))
+            losers.append(player(match["loser_id"], match["category_id"]))
+            if len(matches) == REPLAY_CHUNK:
+                await replay_chunk(matches, winners, losers)
+                matches, winners, losers = [], [], []
+        if matches:
+            await replay_chunk(matches, winners, losers)
+
+        operations = []
+        for key in keys:
+            user_id, category_id = key
+            state = final.get(key)
+            if state is None:
+                # 再生後に履歴が残らないプレイヤー
+                operations.append(DeleteOne({"user_id": user_id, "category_id": category_id}))
+                continue
+            operations.append(UpdateOne(
+                {"user_id": user_id, "category_id": category_id},
+                {
+                    "$set": {**state, "version": state["games_played"], "updated_at": now},
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True
+            ))
+
+        if USE_TRANSACTIONS and totals["ratings"] + len(operations) <= TRANSACTION_MAX_WRITES:
+            async with await client.start_session() as session:
+                await session.with_transaction(
+                    lambda session: _swap_in(staging, query, token, operations, session=session)
+                )
+        else:
+            await _swap_in(staging, query, token, operations)
+    finally:
+        await staging.drop()
+
+    # Invalidate cached ranking pages of the replayed categories in every worker
+    await asyncio.gather(*[category_db.bump_ranking_version(str(category_id)) for category_id in category_oids])
+
+    return {
+        "categories": len(category_oids),
+        **totals,
+        "players": len(keys),
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recompute ratings from the match history.")
+    parser.add_argument("category_ids", nargs="*", help="categories to replay (default: all)")
+    parser.add_argument("--since", type=datetime.fromisoformat,
+                        help="replay only matches on or after this date")
+    args = parser.parse_args()
+    print(asyncio.run(replay_ratings(args.category_ids or None, args.since)))
+
+
+if __name__ == "__main__":
+    main()
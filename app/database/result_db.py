@@ -0,0 +1,54 @@
+import asyncio
+from typing import List
+from decouple import config
+from app.database.connection import client
+from app.database import match_db, rating_db
+
+# レプリカセット／シャードクラスタではトランザクションで書き込む
+USE_TRANSACTIONS = config("MONGO_TRANSACTIONS", default=False, cast=bool)
+
+
+async def save_match_results(match_dicts: List[dict], rating_dicts: List[dict], claim: rating_db.RatingClaim) -> None:
+    """
+    Persist a batch of matches and their ratings with one write per collection.
+    """
+    if USE_TRANSACTIONS:
+        async def write(session):
+            await match_db.insert_match_documents(match_dicts, session=session)
+            await rating_db.insert_rating_documents(rating_dicts, session=session)
+            await rating_db.commit_current_ratings(claim, rating_dicts, session=session)
+
+        async with await client.start_session() as session:
+            await session.with_transaction(write)
+        return
+
+    # 期限切れなら何も書かずに失敗させるため、状態の確定を先に行う
+    await rating_db.commit_current_ratings(claim, rating_dicts)
+    await asyncio.gather(
+        match_db.insert_match_documents(match_dicts),
+        rating_db.insert_rating_documents(rating_dicts)
+    )
+
+
+async def save_match_result(match_dict: dict, rating_dicts: List[dict], claim: rating_db.RatingClaim) -> None:
+    """
+    Persist a match, the ratings it produced, and the new claimed rating states.
+    With MONGO_TRANSACTIONS enabled the writes commit atomically. Otherwise the
+    claimed states are committed first, so a claim that expired fails the result
+    before anything is written, and the match and history are inserted after it.
+    """
+    if USE_TRANSACTIONS:
+        async def write(session):
+            await match_db.insert_match_document(match_dict, session=session)
+            await rating_db.insert_rating_documents(rating_dicts, session=session)
+            await rating_db.commit_current_ratings(claim, rating_dicts, session=session)
+
+        async with await client.start_session() as session:
+            await session.with_transaction(write)
+        return
+
+    await rating_db.commit_current_ratings(claim, rating_dicts)
+    await asyncio.gather(
+        match_db.insert_match_document(match_dict),
+        rating_db.insert_rating_documents(rating_dicts)
+    )
@@ -1,16 +1,53 @@
-from bson import ObjectId
+import asyncio
+import base64
+import re
+import sys
+import time
+from bson import MinKey, ObjectId
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from app.database.connection import users_collection
-from app.schemas.user import UserCreate, UserUpdate, UserInDB
+from app.database.errors import InvalidCursor
+from app.schemas.user import UserCreate, UserUpdate, UserInDB, UserResponse, UserSummary
 from passlib.context import CryptContext
 import jwt
 import os
 from fastapi import HTTPException, status
+from pymongo import ASCENDING, UpdateOne
 from pymongo.errors import DuplicateKeyError
+from decouple import config
+from app.utils.dataloader import DataLoader
+from app.utils.executor import BoundedExecutor
+from app.utils.normalize import SEARCH_TERMS_VERSION, normalize_name, user_search_terms
+from app.utils.singleflight import SingleFlight
+from app.utils.user_suggest import SuggestIndex, Suggestion
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt はイベントループを止めるので専用スレッドで実行する
+password_executor = BoundedExecutor(
+    max_workers=config("PASSWORD_HASH_WORKERS", default=2, cast=int),
+    name="password-hash"
+)
+
+# Fields of a public profile (no password hash or search terms)
+PUBLIC_PROJECTION = {"name": 1, "intra_name": 1, "email": 1, "user_image": 1, "created_at": 1, "updated_at": 1}
+
+# User search: default page size, and the index it pages through
+SEARCH_LIMIT = 20
+SEARCH_INDEX = [("search_terms", ASCENDING), ("_id", ASCENDING)]
+
+# Users per bulk write when recomputing stale search terms
+SEARCH_TERMS_BATCH = 1000
+
+# Typeahead index of this worker. Writes here update it directly; users changed through
+# other workers show up when it is rebuilt (at most SUGGEST_REFRESH_SECONDS later).
+SUGGEST_REFRESH_SECONDS = config("SUGGEST_REFRESH_SECONDS", default=300.0, cast=float)
+_suggest_index = SuggestIndex()
+_suggest_loaded_at: Optional[float] = None
+_suggest_changes: Optional[List[tuple]] = None
+_suggest_flight = SingleFlight()
+
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-for-jwt")
 ALGORITHM = "HS256"
@@ -48,21 +85,23 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     return encoded_jwt
 
 
+def _existing_user_query(email: str, intra_name: str) -> dict:
+    return {"$or": [{"email": email}, {"intra_name": intra_name}]}
+
+
 async def create_user(user: UserCreate) -> UserInDB:
     """
     Create a new user in the database.
     Ensures email uniqueness.
     """
-    # Check if email already exists
-    existing_user = await users_collection.find_one({"email": user.email})
-    if existing_user:
+    # Check email and intra_name in one query (both are uniquely indexed)
+    existing_user = await users_collection.find_one(_existing_user_query(user.email, user.intra_name), {"email": 1})
+    if existing_user and existing_user.get("email") == user.email:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
-    # Check if intra_name already exists
-    existing_user = await users_collection.find_one({"intra_name": user.intra_name})
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -70,7 +109,8 @@ async def create_user(user: UserCreate) -> UserInDB:
         )
     
     user_dict = user.model_dump()
-    user_dict["password"] = hash_password(user_dict["password"])
+    user_dict["password"] = await password_executor.run(hash_password, user_dict["password"])
+    user_dict.update(_search_fields(user.name, user.intra_name, user.email))
     user_dict["created_at"] = datetime.utcnow()
     user_dict["updated_at"] = datetime.utcnow()
     
@@ -80,7 +120,9 @@ async def create_user(user: UserCreate) -> UserInDB:
         created_user = await users_collection.find_one({"_id": result.inserted_id})
         created_user["_id"] = str(created_user["_id"])
         
-        return UserInDB(**created_user)
+        user_in_db = UserInDB(**created_user)
+        _suggest_update(user_in_db)
+        return user_in_db
     except DuplicateKeyError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -88,18 +130,67 @@ async def create_user(user: UserCreate) -> UserInDB:
         )
 
 
+async def _load_users(user_ids: List[str]) -> Dict[str, UserInDB]:
+    """
+    Batch function of user_loader: every requested user in one $in query.
+    """
+    keys_by_object_id: Dict[ObjectId, List[str]] = {}
+    for user_id in user_ids:
+        try:
+            keys_by_object_id.setdefault(ObjectId(user_id), []).append(user_id)
+        except Exception:
+            continue
+    if not keys_by_object_id:
+        return {}
+
+    users = {}
+    async for user in users_collection.find({"_id": {"$in": list(keys_by_object_id)}}):
+        object_id = user["_id"]
+        user["_id"] = str(object_id)
+        for key in keys_by_object_id[object_id]:
+            users[key] = UserInDB(**user)
+    return users
+
+
+user_loader = DataLoader("users", _load_users)
+
+
 async def get_user(user_id: str) -> Optional[UserInDB]:
     """
     Get a user by ID.
+    Lookups made at the same time are batched into one query (see user_loader).
     """
     try:
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
-        if user:
-            user["_id"] = str(user["_id"])
-            return UserInDB(**user)
+        return await user_loader.load(user_id)
     except Exception:
         return None
-    return None
+
+
+async def get_users_by_ids(user_ids: List[str]) -> Dict[str, UserResponse]:
+    """
+    Get public user profiles for several IDs with a single query (keyed by user ID).
+    Unknown or invalid IDs are left out of the result.
+    """
+    object_ids = []
+    for user_id in set(user_ids):
+        try:
+            object_ids.append(ObjectId(user_id))
+        except Exception:
+            continue
+    if not object_ids:
+        return {}
+
+    cursor = users_collection.find(
+        {"_id": {"$in": object_ids}},
+        PUBLIC_PROJECTION
+    )
+
+    users = {}
+    async for user in cursor:
+        user["_id"] = str(user["_id"])
+        users[user["_id"]] = UserResponse(**user)
+
+    return users
 
 
 async def update_user(user_id: str, user_update: UserUpdate) -> Optional[UserInDB]:
@@ -107,6 +198,7 @@ async def update_user(user_id: str, user_update: UserUpdate) -> Optional[UserInD
     Update a user by ID.
     Ensures email uniqueness if email is being updated.
     """
+    user_loader.clear(user_id)
     try:
         user_dict = user_update.model_dump(exclude_unset=True)
         
@@ -120,7 +212,17 @@ async def update_user(user_id: str, user_update: UserUpdate) -> Optional[UserInD
                 )
         
         if "password" in user_dict and user_dict["password"]:
-            user_dict["password"] = hash_password(user_dict["password"])
+            user_dict["password"] = await password_executor.run(hash_password, user_dict["password"])
+        
+        # Keep the search terms in step with the name and email
+        if "name" in user_dict or "email" in user_dict:
+            current = await users_collection.find_one(
+                {"_id": ObjectId(user_id)},
+                {"name": 1, "intra_name": 1, "email": 1}
+            )
+            if current:
+                current.update(user_dict)
+                user_dict.update(_search_fields(current["name"], current["intra_name"], current["email"]))
             
         user_dict["updated_at"] = datetime.utcnow()
         
@@ -132,7 +234,14 @@ async def update_user(user_id: str, user_update: UserUpdate) -> Optional[UserInD
         updated_user = await users_collection.find_one({"_id": ObjectId(user_id)})
         if updated_user:
             updated_user["_id"] = str(updated_user["_id"])
-            return UserInDB(**updated_user)
+            user_in_db = UserInDB(**updated_user)
+            _suggest_update(user_in_db)
+            return user_in_db
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email or intra_name already registered by another user"
+        )
     except Exception as e:
         if isinstance(e, HTTPException):
             raise e
@@ -140,24 +249,179 @@ async def update_user(user_id: str, user_update: UserUpdate) -> Optional[UserInD
     return None
 
 
-async def search_users(search_key: str) -> List[UserInDB]:
+def _search_fields(name: str, intra_name: str, email: str) -> Dict[str, Any]:
     """
-    Search users by name, intra_name, or email (partial match).
+    Stored search fields of a user: the terms and the version of the rules that produced them.
     """
-    cursor = users_collection.find({
-        "$or": [
-            {"name": {"$regex": search_key, "$options": "i"}},
-            {"intra_name": {"$regex": search_key, "$options": "i"}},
-            {"email": {"$regex": search_key, "$options": "i"}}
-        ]
-    })
-    
-    users = []
+    return {
+        "search_terms": user_search_terms(name, intra_name, email),
+        "search_terms_version": SEARCH_TERMS_VERSION
+    }
+
+
+def encode_search_cursor(term: str, user_id: ObjectId) -> str:
+    """
+    Opaque keyset cursor pointing just after a user found through term.
+    """
+    raw = f"{user_id}|{term}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_search_cursor(key: str, cursor: str) -> Tuple[str, ObjectId]:
+    try:
+        user_id, term = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        position = term, ObjectId(user_id)
+    except Exception:
+        raise InvalidCursor(cursor)
+    # 別のキーのカーソルは範囲外になる
+    if not term.startswith(key):
+        raise InvalidCursor(cursor)
+    return position
+
+
+def search_query(key: str, after: Optional[Tuple[str, ObjectId]] = None) -> Dict[str, Any]:
+    """
+    find arguments of one search_users scan: the part of the (search_terms, _id) index
+    holding the prefix range of the normalized key, from the position after on.
+    """
+    lower = [("search_terms", after[0]), ("_id", after[1])] if after else [("search_terms", key), ("_id", MinKey())]
+    query = {
+        "filter": {"search_terms": {"$regex": f"^{re.escape(key)}"}},
+        "hint": SEARCH_INDEX,
+        "min": lower
+    }
+    if ord(key[-1]) < sys.maxunicode:
+        # key の最後の文字を1つ進めた文字列がプレフィックス範囲の上端
+        query["max"] = [("search_terms", key[:-1] + chr(ord(key[-1]) + 1)), ("_id", MinKey())]
+    return query
+
+
+async def search_users(
+    search_key: str,
+    limit: int = SEARCH_LIMIT,
+    after: Optional[str] = None
+) -> Tuple[List[UserResponse], Optional[str]]:
+    """
+    Search users whose name, intra_name, email or one of their words starts with the key.
+    Returns a page of users and the cursor of the next page (None on the last page).
+
+    The key is normalized like the stored search_terms (case, width, kana). Users come in
+    (search_terms, _id) index order, each at the first of its terms that starts with the key,
+    and the scan starts at the cursor (min/max on the hinted index), so a short prefix reads
+    about one page of index keys instead of sorting every match in memory.
+    A user with several matching terms is met again at its later terms; users of earlier
+    pages are skipped here, so a deep page may fetch up to (matching terms - 1) extra
+    documents per earlier user that shares its prefix. Raises InvalidCursor for a bad after.
+    """
+    key = normalize_name(search_key)
+    if not key:
+        return [], None
+    position = _decode_search_cursor(key, after) if after is not None else None
+
+    query = search_query(key, position)
+    cursor = users_collection.find(query["filter"], {**PUBLIC_PROJECTION, "search_terms": 1})
+    cursor = cursor.hint(query["hint"]).min(query["min"])
+    if "max" in query:
+        cursor = cursor.max(query["max"])
+
+    users: List[UserResponse] = []
+    last = None
+    try:
+        async for user in cursor.batch_size(limit + 1):
+            user_position = (min(term for term in user.pop("search_terms") if term.startswith(key)), user["_id"])
+            if position is not None and user_position <= position:
+                # 前のページで返したユーザー（後ろの語で再び出てきたもの）
+                continue
+            if len(users) == limit:
+                return users, encode_search_cursor(*last)
+            last = user_position
+            user["_id"] = str(user["_id"])
+            users.append(UserResponse(**user))
+    finally:
+        await cursor.close()
+
+    return users, None
+
+
+async def ensure_search_terms() -> int:
+    """
+    Recompute search_terms of users stored without them or with an older SEARCH_TERMS_VERSION.
+    Returns the number of users updated.
+    """
+    cursor = users_collection.find(
+        {"search_terms_version": {"$ne": SEARCH_TERMS_VERSION}},
+        {"name": 1, "intra_name": 1, "email": 1}
+    )
+    updates = []
+    updated = 0
     async for user in cursor:
-        user["_id"] = str(user["_id"])
-        users.append(UserInDB(**user))
-    
-    return users
+        fields = _search_fields(user.get("name", ""), user.get("intra_name", ""), user.get("email", ""))
+        updates.append(UpdateOne({"_id": user["_id"]}, {"$set": fields}))
+        if len(updates) == SEARCH_TERMS_BATCH:
+            await users_collection.bulk_write(updates, ordered=False)
+            updated += len(updates)
+            updates = []
+    if updates:
+        await users_collection.bulk_write(updates, ordered=False)
+        updated += len(updates)
+    return updated
+
+
+def _suggestion(user: dict) -> Suggestion:
+    return Suggestion(str(user["_id"]), user.get("name", ""), user.get("intra_name", ""), user.get("user_image"))
+
+
+def _suggest_update(user: UserInDB) -> None:
+    suggestion = Suggestion(user.id, user.name, user.intra_name, user.user_image)
+    _suggest_index.add(suggestion)
+    if _suggest_changes is not None:
+        _suggest_changes.append(("add", suggestion))
+
+
+def _suggest_remove(user_id: str) -> None:
+    _suggest_index.remove(user_id)
+    if _suggest_changes is not None:
+        _suggest_changes.append(("remove", user_id))
+
+
+async def _build_suggest_index() -> SuggestIndex:
+    global _suggest_index, _suggest_loaded_at, _suggest_changes
+    # 構築中の書き込みは記録しておき、新しいインデックスにも反映する
+    _suggest_changes = []
+    try:
+        cursor = users_collection.find({}, {"name": 1, "intra_name": 1, "user_image": 1})
+        users = [_suggestion(user) async for user in cursor]
+        index = await asyncio.to_thread(SuggestIndex, users)
+        for change, value in _suggest_changes:
+            if change == "add":
+                index.add(value)
+            else:
+                index.remove(value)
+    finally:
+        _suggest_changes = None
+    _suggest_index = index
+    _suggest_loaded_at = time.monotonic()
+    return index
+
+
+async def load_suggest_index() -> None:
+    """
+    Build the typeahead index of this worker from the users collection.
+    """
+    await _suggest_flight.do("users", _build_suggest_index)
+
+
+async def suggest_users(key: str, limit: int = 10) -> List[UserSummary]:
+    """
+    Typeahead suggestions by name / intra_name prefix, with typo tolerance, from the in-memory index.
+    The index is rebuilt when older than SUGGEST_REFRESH_SECONDS.
+    """
+    if _suggest_loaded_at is None or time.monotonic() - _suggest_loaded_at > SUGGEST_REFRESH_SECONDS:
+        await load_suggest_index()
+    return [
+        UserSummary(_id=user.id, name=user.name, intra_name=user.intra_name, user_image=user.user_image)
+        for user in _suggest_index.suggest(key, limit)
+    ]
 
 
 async def delete_user(user_id: str) -> bool:
@@ -166,6 +430,9 @@ async def delete_user(user_id: str) -> bool:
     """
     try:
         result = await users_collection.delete_one({"_id": ObjectId(user_id)})
+        user_loader.clear(user_id)
+        if result.deleted_count > 0:
+            _suggest_remove(user_id)
         return result.deleted_count > 0
     except Exception:
         return False
@@ -189,6 +456,6 @@ async def authenticate_user(email: str, password: str) -> Optional[UserInDB]:
     user = await get_user_by_email(email)
     if not user:
         return None
-    if not verify_password(password, user.password):
+    if not await password_executor.run(verify_password, password, user.password):
         return None
     return user
@@ -107,3 +107,9 @@ async def signin(form_data: SignInRequest):
     return user
 
 
+@router.get("/password-pool/stats")
+async def get_password_pool_stats():
+    """
+    Queue depth and timing of this worker's password hashing pool.
+    """
+    return user_db.password_executor.stats()
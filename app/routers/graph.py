@@ -1,54 +1,178 @@
-import matplotlib.pyplot as plt
-import io
-from fastapi.responses import StreamingResponse
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Dict
+import asyncio
+from fastapi.responses import Response
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Dict, Optional
 from pydantic import BaseModel
 from datetime import datetime
 from app.database import rating_db, match_db, user_db, category_db
+from app.database.errors import InvalidCursor
 from app.schemas.match import MatchCreate
 from app.utils.rating_calculator import calculate_elo_rating_change, get_initial_rating
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
-from app.schemas.rating import RatingInDB
+from app.schemas.rating import RatingInDB, RatingOHLC
+from app.utils import graph_renderer
+from app.utils.cache import TTLCache
+from app.utils.downsample import lttb
+from app.utils.executor import BoundedExecutor
+from app.utils.singleflight import SingleFlight
+from decouple import config
+from functools import partial
 
 router = APIRouter(prefix="/api", tags=["graph"])
 
+# 同時に来た同じ履歴リクエストをまとめる
+history_flight = SingleFlight()
+STALE_WHILE_REVALIDATE = config("STALE_WHILE_REVALIDATE", default=False, cast=bool)
 
+# Most ratings returned by one history request (page size / downsampled points)
+MAX_HISTORY_PAGE = 1000
 
+# PNG の描画はイベントループの外（専用スレッド）で行い、画像をキャッシュする
+render_executor = BoundedExecutor(
+    max_workers=config("GRAPH_RENDER_WORKERS", default=2, cast=int),
+    name="graph-render"
+)
+graph_cache = TTLCache(
+    maxsize=config("GRAPH_CACHE_SIZE", default=128, cast=int),
+    ttl=config("GRAPH_CACHE_TTL", default=3600.0, cast=float)
+)
+render_flight = SingleFlight()
 
-@router.get("/rating-history/{user_id}/{category_id}", response_model=List[RatingInDB])
-async def get_user_rating_history(user_id: str, category_id: str):
+MEDIA_TYPES = {"svg": "image/svg+xml", "png": "image/png"}
+
+
+async def _get_rating_history(user_id: str, category_id: str, **filters) -> List[RatingInDB]:
     """
-    Get the rating history for a user in a specific category.
+    Get a rating history, sharing the query between concurrent identical requests.
+    """
+    fetch = partial(rating_db.get_user_rating_history, user_id, category_id, **filters)
+    key = (user_id, category_id, tuple(sorted(filters.items())))
+    if STALE_WHILE_REVALIDATE:
+        # The category's ranking version changes whenever one of its results is recorded
+        version = await category_db.get_ranking_version(category_id)
+        return await history_flight.do_stale(key, version, fetch)
+    return await history_flight.do(key, fetch)
+
+
+async def _check_user_and_category(
+    user_id: str,
+    category_id: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+) -> None:
+    """
+    Validate the IDs and date range, and check that the user and category exist.
     """
-    # Validate IDs
     try:
         ObjectId(user_id)
         ObjectId(category_id)
     except InvalidId:
         raise HTTPException(status_code=400, detail="Invalid ID format")
     
-    # Check if user and category exist
-    user = await user_db.get_user(user_id)
+    if date_from is not None and date_to is not None and date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    
+    user, category = await asyncio.gather(
+        user_db.get_user(user_id),
+        category_db.get_category(category_id)
+    )
     if not user:
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     
-    category = await category_db.get_category(category_id)
     if not category:
         raise HTTPException(status_code=404, detail=f"Category with ID {category_id} not found")
+
+
+def _downsample(rating_history: List[RatingInDB], points: int) -> List[RatingInDB]:
+    """
+    Keep at most points ratings, chosen by LTTB so the shape of the curve survives.
+    """
+    if len(rating_history) <= points:
+        return rating_history
+    indexes = lttb(
+        [rating.date.timestamp() for rating in rating_history],
+        [rating.rate for rating in rating_history],
+        points
+    )
+    return [rating_history[i] for i in indexes]
+
+
+@router.get("/rating-history/{user_id}/{category_id}", response_model=List[RatingInDB])
+async def get_user_rating_history(
+    user_id: str,
+    category_id: str,
+    response: Response,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_HISTORY_PAGE)
+):
+    """
+    Get the rating history for a user in a specific category.
+    from / to limit the dates (inclusive). With limit, the history is paged: when more
+    ratings follow, the X-Next-Cursor header holds the after value of the next page.
+    """
+    await _check_user_and_category(user_id, category_id, date_from, date_to)
     
-    # Get rating history
-    rating_history = await rating_db.get_user_rating_history(user_id, category_id)
+    # Get rating history (one extra rating tells whether another page follows)
+    try:
+        rating_history = await _get_rating_history(
+            user_id, category_id,
+            date_from=date_from, date_to=date_to, after=after,
+            limit=limit + 1 if limit is not None else None
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if limit is not None and len(rating_history) > limit:
+        rating_history = rating_history[:limit]
+        response.headers["X-Next-Cursor"] = rating_db.encode_history_cursor(rating_history[-1])
     return rating_history
 
 
+@router.get("/rating-history/{user_id}/{category_id}/downsampled", response_model=List[RatingInDB])
+async def get_user_rating_history_downsampled(
+    user_id: str,
+    category_id: str,
+    points: int = Query(500, ge=3, le=MAX_HISTORY_PAGE),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to")
+):
+    """
+    Get at most points ratings of a history, downsampled with LTTB (first and last ratings are kept).
+    """
+    await _check_user_and_category(user_id, category_id, date_from, date_to)
+    
+    rating_history = await _get_rating_history(user_id, category_id, date_from=date_from, date_to=date_to)
+    return _downsample(rating_history, points)
+
+
+@router.get("/rating-history/{user_id}/{category_id}/daily", response_model=List[RatingOHLC])
+async def get_user_rating_history_daily(
+    user_id: str,
+    category_id: str,
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to")
+):
+    """
+    Get the rating history as daily (UTC) open/high/low/close buckets.
+    """
+    await _check_user_and_category(user_id, category_id, date_from, date_to)
+    
+    return await rating_db.get_user_rating_daily(user_id, category_id, date_from, date_to)
+
 
 @router.get("/rating-history/{user_id}/{category_id}/graph-image")
-async def get_user_rating_history_graph_image(user_id: str, category_id: str):
+async def get_user_rating_history_graph_image(
+    user_id: str,
+    category_id: str,
+    width: int = Query(1000, ge=200, le=2000),
+    height: int = Query(600, ge=150, le=1200),
+    format: str = Query("svg", pattern="^(svg|png)$")
+):
     """
     Get the rating history for a user in a specific category as a graph image.
-    Returns a generated image of the rating history graph.
+    Returns an SVG graph by default, or a PNG (drawn with matplotlib) with format=png.
     """
     # Validate IDs
     try:
@@ -57,36 +181,60 @@ async def get_user_rating_history_graph_image(user_id: str, category_id: str):
     except InvalidId:
         raise HTTPException(status_code=400, detail="Invalid ID format")
     
-    # Check if user and category exist
-    user = await user_db.get_user(user_id)
+    # Check if user and category exist, and find the latest rating
+    user, category, current = await asyncio.gather(
+        user_db.get_user(user_id),
+        category_db.get_category(category_id),
+        rating_db.get_user_current_rating(user_id, category_id)
+    )
     if not user:
         raise HTTPException(status_code=404, detail=f"User with ID {user_id} not found")
     
-    category = await category_db.get_category(category_id)
     if not category:
         raise HTTPException(status_code=404, detail=f"Category with ID {category_id} not found")
     
-    # Get rating history
-    rating_history = await rating_db.get_user_rating_history(user_id, category_id)
+    # A new rating changes the latest rating ID, so cached images never go stale
+    key = (user_id, category_id, current.rating_id if current else None, width, height, format)
+    image = graph_cache.get(key)
+    if image is None:
+        image = await render_flight.do(key, partial(_render_graph, key))
+    
+    return Response(content=image, media_type=MEDIA_TYPES[format])
+
+
+async def _render_graph(key: tuple) -> bytes:
+    """
+    Render a rating history graph and cache it.
+    PNGs are drawn in the render pool; SVGs are cheap enough to build inline.
+    """
+    user_id, category_id, _, width, height, format = key
+    # The image is cached under the latest rating ID, so read the history itself rather than
+    # through history_flight (which may return a result from before that rating)
+    # 1 ピクセルに 1 点あれば十分
+    rating_history = _downsample(await rating_db.get_user_rating_history(user_id, category_id), width)
     
     # Create graph data
     dates = [rating.date for rating in rating_history]
     rates = [rating.rate for rating in rating_history]
+    title = f"Rating History for User {user_id} in Category {category_id}"
+    
+    if format == "png":
+        image = await render_executor.run(
+            graph_renderer.render_rating_history_png, dates, rates, title, width, height
+        )
+    else:
+        image = graph_renderer.render_rating_history_svg(dates, rates, title, width, height)
+    graph_cache.set(key, image)
+    return image
+
 
-    # Create the graph
-    plt.figure(figsize=(10, 6))
-    plt.plot(dates, rates, marker='o', linestyle='-', color='b')
-    plt.title(f"Rating History for User {user_id} in Category {category_id}")
-    plt.xlabel("Date")
-    plt.ylabel("Rating")
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    # Save the plot to a BytesIO object
-    img_io = io.BytesIO()
-    plt.savefig(img_io, format='png')
-    img_io.seek(0)
-    plt.close()
-
-    # Return the image as a streaming response
-    return StreamingResponse(img_io, media_type="image/png")
+@router.get("/graph/stats")
+async def get_graph_stats():
+    """
+    Render pool and image cache counters of this worker.
+    """
+    return {
+        "render_pool": render_executor.stats(),
+        "cache": graph_cache.stats(),
+        "single_flight": render_flight.stats()
+    }
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
-from app.schemas.match import MatchCreate, MatchUpdate, MatchResponse
-from app.database import match_db
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional, Set
+from app.schemas.match import MatchCreate, MatchUpdate, MatchResponse, MatchInDB, MatchExpandedResponse
+from app.schemas.user import UserResponse, UserSummary
+from app.schemas.category import CategorySummary
+from app.database import match_db, user_db, category_db
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
 
 router = APIRouter(prefix="/api/match", tags=["matches"])
 
+# Related documents that match listings can embed (?expand=users,category)
+EXPANDABLE_FIELDS = {"users", "category"}
+
 
 @router.post("/", response_model=MatchResponse)
 async def create_match(match: MatchCreate):
@@ -33,29 +39,97 @@ async def get_match(match_id: str):
     return match
 
 
-@router.get("/user/{user_id}", response_model=List[MatchResponse])
-async def get_user_matches(user_id: str):
+def _parse_expand(expand: Optional[str]) -> Set[str]:
+    """
+    Split the expand query parameter (e.g. "users,category") into known field names.
+    """
+    if not expand:
+        return set()
+    fields = {field.strip() for field in expand.split(",") if field.strip()}
+    unknown = fields - EXPANDABLE_FIELDS
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown expand field(s): {', '.join(sorted(unknown))}; use {', '.join(sorted(EXPANDABLE_FIELDS))}"
+        )
+    return fields
+
+
+async def _expand_matches(matches: List[MatchInDB], fields: Set[str]) -> List[MatchExpandedResponse]:
+    """
+    Embed user and/or category summaries, fetched with one query per collection for the whole list.
+    """
+    users, categories = await asyncio.gather(
+        user_db.get_users_by_ids(
+            [user_id for match in matches for user_id in (match.winner_id, match.loser_id)]
+        ) if "users" in fields else _none(),
+        category_db.get_categories_by_ids(
+            [match.category_id for match in matches]
+        ) if "category" in fields else _none()
+    )
+    
+    expanded = []
+    for match in matches:
+        extra = {}
+        if users is not None:
+            extra["winner"] = _user_summary(users.get(match.winner_id))
+            extra["loser"] = _user_summary(users.get(match.loser_id))
+        if categories is not None:
+            category = categories.get(match.category_id)
+            extra["category"] = CategorySummary(**category.model_dump(by_alias=True)) if category else None
+        expanded.append(MatchExpandedResponse(**match.model_dump(by_alias=True), **extra))
+    return expanded
+
+
+async def _none() -> None:
+    return None
+
+
+def _user_summary(user: Optional[UserResponse]) -> Optional[UserSummary]:
+    if user is None:
+        return None
+    return UserSummary(**user.model_dump(by_alias=True))
+
+
+@router.get(
+    "/user/{user_id}",
+    response_model=List[MatchExpandedResponse],
+    response_model_exclude_unset=True
+)
+async def get_user_matches(user_id: str, expand: Optional[str] = Query(None)):
     """
     Get all matches for a user (either as winner or loser).
+    expand=users,category embeds winner/loser and category summaries.
     """
     try:
         ObjectId(user_id)  # Validate ObjectId format
     except InvalidId:
         raise HTTPException(status_code=400, detail="Invalid user ID format")
     
+    fields = _parse_expand(expand)
     matches = await match_db.get_user_matches(user_id)
+    if fields:
+        return await _expand_matches(matches, fields)
     return matches
 
 
-@router.get("/category/{category_id}", response_model=List[MatchResponse])
-async def get_category_matches(category_id: str):
+@router.get(
+    "/category/{category_id}",
+    response_model=List[MatchExpandedResponse],
+    response_model_exclude_unset=True
+)
+async def get_category_matches(category_id: str, expand: Optional[str] = Query(None)):
     """
     Get all matches for a category.
+    expand=users,category embeds winner/loser and category summaries.
     """
     try:
         ObjectId(category_id)  # Validate ObjectId format
     except InvalidId:
         raise HTTPException(status_code=400, detail="Invalid category ID format")
     
+    fields = _parse_expand(expand)
     matches = await match_db.get_category_matches(category_id)
+    if fields:
+        return await _expand_matches(matches, fields)
     return matches
@@ -1,7 +1,11 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from typing import List
 from app.schemas.mcpchat import McpChat, McpChatCreate
-from app.utils.openAI import openai_api
+from app.utils.openAI import openai_api, openai_api_stream, cache_stats
+from app.utils.metrics import LatencyRecorder
+import json
+import time
 # from app.database.mcpchat_db import create_mcpchat, get_mcpchats_by_user
 
 router = APIRouter(
@@ -15,12 +19,66 @@ router = APIRouter(
 #     # In a real application, you would replace this with actual API call
 #     return f"Response to: {content}"
 
+# レイテンシ計測（ワーカーごと）
+reply_latency = LatencyRecorder()
+stream_ttfb = LatencyRecorder()
+stream_latency = LatencyRecorder()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 # Endpoint to create a new chat message
 @router.post("/", response_model=McpChat)
 async def create_mcpchat_endpoint(mcpchat: McpChatCreate):
+    started = time.perf_counter()
     mcpchat_dict = mcpchat.dict()
-    mcpchat_dict["reply"] = openai_api(mcpchat_dict["content"])
+    mcpchat_dict["reply"] = await openai_api(mcpchat_dict["content"])
+    reply_latency.record((time.perf_counter() - started) * 1000)
     return mcpchat_dict
+
+
+# Streaming variant: Server-Sent Events (token / tool / reply, then done or error)
+@router.post("/stream")
+async def create_mcpchat_stream_endpoint(mcpchat: McpChatCreate):
+    started = time.perf_counter()
+
+    async def events():
+        ttfb_ms = None
+        try:
+            async for event, data in openai_api_stream(mcpchat.content):
+                if ttfb_ms is None:
+                    ttfb_ms = (time.perf_counter() - started) * 1000
+                    stream_ttfb.record(ttfb_ms)
+                yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        total_ms = (time.perf_counter() - started) * 1000
+        stream_latency.record(total_ms)
+        yield _sse("done", {"ttfb_ms": ttfb_ms, "total_ms": total_ms})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/stats")
+async def get_mcpchat_stats():
+    """
+    Chat latency and cache hit rates of this worker: full replies, and time to first event / total for streams.
+    """
+    return {
+        "cache": cache_stats(),
+        "reply": reply_latency.stats(),
+        "stream": {
+            "ttfb": stream_ttfb.stats(),
+            "total": stream_latency.stats()
+        }
+    }
     # mcpchat_dict["user_id"] = user_id  # Adding user_id to the request body
     # return await create_mcpchat(McpChatCreate(**mcpchat_dict))
 
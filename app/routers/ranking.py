@@ -1,45 +1,164 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import List, Dict, Any
-from app.database import rating_db, user_db
+from app.database import rating_db, user_db, category_db
 from app.schemas.rating import RatingResponse
+from app.utils import leaderboard
+from app.utils.cache import TTLCache
+from app.utils.singleflight import SingleFlight
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
+from decouple import config
+from functools import partial
+import os
 
 router = APIRouter(prefix="/api/ranking", tags=["rankings"])
 
+# ランキングページのキャッシュ（ワーカーごと）
+ranking_cache = TTLCache(
+    maxsize=config("RANKING_CACHE_SIZE", default=512, cast=int),
+    ttl=config("RANKING_CACHE_TTL", default=60.0, cast=float)
+)
+
+# 同時に来た同じリクエストをまとめる
+ranking_flight = SingleFlight()
+STALE_WHILE_REVALIDATE = config("STALE_WHILE_REVALIDATE", default=False, cast=bool)
+
+
+async def _build_category_ranking(category_id: str, version: int, limit: int, offset: int) -> List[Dict[str, Any]]:
+    """
+    Build one ranking page with user details and store it in the ranking cache.
+    """
+    # Get one page of current ratings for the category, ranked on the server
+    ratings = await rating_db.get_category_rankings(category_id, limit=limit, offset=offset)
+    
+    # Fetch the users on this page in one query
+    users = await user_db.get_users_by_ids([rating.user_id for rating in ratings])
+    
+    # Prepare ranking with user details (deleted users are skipped)
+    ranking = []
+    
+    for rating in ratings:
+        user = users.get(rating.user_id)
+        if user:
+            ranking.append({
+                "rank": rating.rank,
+                "dense_rank": rating.dense_rank,
+                "user_id": rating.user_id,
+                "name": user.name,
+                "intra_name": user.intra_name,
+                "user_image": user.user_image,
+                "rating": rating.rate,
+                "games_played": rating.games_played,
+                "peak_rating": rating.peak_rating,
+                "last_updated": rating.last_match_date
+            })
+    
+    ranking_cache.set((category_id, version, limit, offset), ranking)
+    return ranking
+
 
 @router.get("/category/{category_id}")
-async def get_category_ranking(category_id: str):
+async def get_category_ranking(
+    category_id: str,
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
     """
-    Get ranking for a specific category, limited to a maximum of 10 results.
+    Get a page of the ranking for a specific category (10 results by default).
     """
     try:
         ObjectId(category_id)  # Validate ObjectId format
     except InvalidId:
         raise HTTPException(status_code=400, detail="Invalid category ID format")
     
-    # Get all ratings for the category sorted by rate
-    ratings = await rating_db.get_category_rankings(category_id)
+    # Serve the page from the cache while the category's ratings are unchanged
+    version = await category_db.get_ranking_version(category_id)
+    cached = ranking_cache.get((category_id, version, limit, offset))
+    if cached is not None:
+        return cached
     
-    # Prepare ranking with user details
-    ranking = []
-    rank = 1
+    # Concurrent requests for the same page share one computation
+    build = partial(_build_category_ranking, category_id, version, limit, offset)
+    if STALE_WHILE_REVALIDATE:
+        return await ranking_flight.do_stale((category_id, limit, offset), version, build)
+    return await ranking_flight.do((category_id, version, limit, offset), build)
+
+
+@router.get("/cache/stats")
+async def get_ranking_cache_stats():
+    """
+    Get the ranking cache counters of the worker serving this request.
+    """
+    return {
+        "pid": os.getpid(),
+        **ranking_cache.stats(),
+        "single_flight": ranking_flight.stats()
+    }
+
+
+@router.get("/category/{category_id}/user/{user_id}")
+async def get_user_rank(category_id: str, user_id: str):
+    """
+    Get the rank of a user in a specific category.
+    """
+    try:
+        ObjectId(category_id)  # Validate ObjectId format
+        ObjectId(user_id)  # Validate ObjectId format
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid ID format")
     
-    for rating in ratings:
-        if len(ranking) >= 10:  # Limit to 10 results
-            break
-        
-        user = await user_db.get_user(rating.user_id)
+    board = await leaderboard.get_leaderboard(category_id)
+    if board is None:
+        raise HTTPException(status_code=404, detail="Category not found")
+    rank = board.rank(user_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="User is not ranked in this category")
+    
+    return {
+        "rank": rank,
+        "user_id": user_id,
+        "category_id": category_id,
+        "rating": board.get_rate(user_id),
+        "total_players": len(board)
+    }
+
+
+@router.get("/category/{category_id}/around/{user_id}")
+async def get_ranking_around_user(
+    category_id: str,
+    user_id: str,
+    k: int = Query(5, ge=0, le=50)
+):
+    """
+    Get the players ranked up to k places above and below a user in a specific category.
+    """
+    try:
+        ObjectId(category_id)  # Validate ObjectId format
+        ObjectId(user_id)  # Validate ObjectId format
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid ID format")
+    
+    board = await leaderboard.get_leaderboard(category_id)
+    if board is None:
+        raise HTTPException(status_code=404, detail="Category not found")
+    entries = board.around(user_id, k)
+    if not entries:
+        raise HTTPException(status_code=404, detail="User is not ranked in this category")
+    
+    # Fetch the users around the player in one query
+    users = await user_db.get_users_by_ids([entry_user_id for _, entry_user_id, _ in entries])
+    
+    ranking = []
+    for rank, entry_user_id, rate in entries:
+        user = users.get(entry_user_id)
         if user:
             ranking.append({
                 "rank": rank,
-                "user_id": rating.user_id,
+                "user_id": entry_user_id,
                 "name": user.name,
                 "intra_name": user.intra_name,
                 "user_image": user.user_image,
-                "rating": rating.rate,
-                "last_updated": rating.date
+                "rating": rate
             })
-            rank += 1
     
     return ranking
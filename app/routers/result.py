@@ -1,13 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Body
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel, Field
 from datetime import datetime
-from app.database import rating_db, match_db, user_db, category_db
+from app.database import rating_db, match_db, user_db, category_db, result_db
+from app.database.errors import ClaimConflict
 from app.schemas.match import MatchCreate
-from app.utils.rating_calculator import calculate_elo_rating_change, get_initial_rating
+from app.utils.rating_calculator import calculate_elo_rating_change
+from app.utils import leaderboard
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
-from app.schemas.rating import RatingInDB
+from app.schemas.rating import RatingCreate
+import asyncio
+from decouple import config
 
 router = APIRouter(prefix="/api/result", tags=["results"])
 
@@ -18,7 +22,68 @@ class MatchResultCreate(BaseModel):
     category_id: str
     winner_point: int
     loser_point: int
-    date: datetime = datetime.utcnow()
+    date: datetime = Field(default_factory=datetime.utcnow)
+
+
+MAX_BATCH_RESULTS = config("MAX_BATCH_RESULTS", default=1000, cast=int)
+
+
+def _apply_result(result: MatchResultCreate, states: Dict[Tuple[str, str], dict]) -> Tuple[dict, List[dict], dict]:
+    """
+    Apply one result's Elo change to the claimed rating states (in place).
+    Returns the match document, its two rating documents, and the response entry.
+    """
+    winner_state = states[(result.winner_id, result.category_id)]
+    loser_state = states[(result.loser_id, result.category_id)]
+    
+    # Current ratings (a new player's state starts at the initial rating)
+    winner_current_rate = winner_state["rate"]
+    loser_current_rate = loser_state["rate"]
+    
+    # Calculate new ratings
+    new_winner_rate, new_loser_rate = calculate_elo_rating_change(winner_current_rate, loser_current_rate)
+    
+    match = match_db.build_match_document(
+        MatchCreate(
+            winner_id=result.winner_id,
+            loser_id=result.loser_id,
+            category_id=result.category_id,
+            winner_point=result.winner_point,
+            loser_point=result.loser_point,
+            date=result.date
+        )
+    )
+    
+    new_ratings = []
+    for user_id, state, new_rate in ((result.winner_id, winner_state, new_winner_rate),
+                                     (result.loser_id, loser_state, new_loser_rate)):
+        state["version"] += 1
+        state["rate"] = new_rate
+        new_ratings.append(rating_db.build_rating_document(
+            RatingCreate(
+                user_id=user_id,
+                category_id=result.category_id,
+                rate=new_rate,
+                date=result.date
+            ),
+            match_id=match["_id"],
+            version=state["version"]
+        ))
+    
+    entry = {
+        "match_id": str(match["_id"]),
+        "winner": {
+            "id": result.winner_id,
+            "old_rating": winner_current_rate,
+            "new_rating": new_winner_rate
+        },
+        "loser": {
+            "id": result.loser_id,
+            "old_rating": loser_current_rate,
+            "new_rating": new_loser_rate
+        }
+    }
+    return match, new_ratings, entry
 
 
 @router.post("/", status_code=201)
@@ -34,76 +99,122 @@ async def record_match_result(result: MatchResultCreate):
     except InvalidId:
         raise HTTPException(status_code=400, detail="Invalid ID format")
     
-    # Check if users and category exist
-    winner = await user_db.get_user(result.winner_id)
-    if not winner:
+    if result.winner_id == result.loser_id:
+        raise HTTPException(status_code=400, detail="Winner and loser must be different users")
+    
+    # Look up both users and the category concurrently
+    users, category = await asyncio.gather(
+        user_db.get_users_by_ids([result.winner_id, result.loser_id]),
+        category_db.get_category(result.category_id)
+    )
+    
+    if result.winner_id not in users:
         raise HTTPException(status_code=404, detail=f"Winner with ID {result.winner_id} not found")
     
-    loser = await user_db.get_user(result.loser_id)
-    if not loser:
+    if result.loser_id not in users:
         raise HTTPException(status_code=404, detail=f"Loser with ID {result.loser_id} not found")
     
-    category = await category_db.get_category(result.category_id)
     if not category:
         raise HTTPException(status_code=404, detail=f"Category with ID {result.category_id} not found")
     
-    # Create match record
-    match_data = MatchCreate(
-        winner_id=result.winner_id,
-        loser_id=result.loser_id,
-        category_id=result.category_id,
-        winner_point=result.winner_point,
-        loser_point=result.loser_point,
-        date=result.date
-    )
-    
-    match = await match_db.create_match(match_data)
-    
-    # Get current ratings or use initial rating if they don't exist
-    winner_rating = await rating_db.get_user_category_rating(result.winner_id, result.category_id)
-    loser_rating = await rating_db.get_user_category_rating(result.loser_id, result.category_id)
+    # Claim both rating states so concurrent results for the same player cannot lose an update
+    keys = [(result.winner_id, result.category_id), (result.loser_id, result.category_id)]
+    try:
+        async with rating_db.claim_current_ratings(keys) as claim:
+            match, new_ratings, entry = _apply_result(result, claim.states)
+            
+            await result_db.save_match_result(match, new_ratings, claim)
+            
+            # Keep this worker's in-memory leaderboard current (in claim order)
+            for rating in new_ratings:
+                leaderboard.record_rating(result.category_id, str(rating["user_id"]), rating["rate"])
+    except ClaimConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
-    winner_current_rate = winner_rating.rate if winner_rating else get_initial_rating()
-    loser_current_rate = loser_rating.rate if loser_rating else get_initial_rating()
+    # Invalidate cached ranking pages of this category in every worker
+    await category_db.bump_ranking_version(result.category_id)
     
-    # Calculate new ratings
-    new_winner_rate, new_loser_rate = calculate_elo_rating_change(winner_current_rate, loser_current_rate)
+    return {"message": "Match result recorded and new ratings created", **entry}
+
+
+def _validate_batch_item(result: MatchResultCreate, users: dict, categories: dict) -> Optional[Tuple[int, str]]:
+    """
+    Check one batch item against the looked-up users and categories; returns (status, detail) on error.
+    """
+    if result.winner_id == result.loser_id:
+        return 400, "Winner and loser must be different users"
+    if result.winner_id not in users:
+        return 404, f"Winner with ID {result.winner_id} not found"
+    if result.loser_id not in users:
+        return 404, f"Loser with ID {result.loser_id} not found"
+    if result.category_id not in categories:
+        return 404, f"Category with ID {result.category_id} not found"
+    return None
+
+
+@router.post("/batch")
+async def record_match_results(results: List[MatchResultCreate] = Body(..., max_length=MAX_BATCH_RESULTS)):
+    """
+    Record an ordered list of match results (e.g. an offline tournament).
+    Valid results are applied in list order and saved together; invalid ones
+    are reported per item without stopping the rest.
+    """
+    items: List[Optional[dict]] = [None] * len(results)
+    for index, result in enumerate(results):
+        try:
+            ObjectId(result.winner_id)
+            ObjectId(result.loser_id)
+            ObjectId(result.category_id)
+        except InvalidId:
+            items[index] = {"index": index, "status": 400, "detail": "Invalid ID format"}
     
-    # Create new ratings for both players
-    from app.schemas.rating import RatingCreate
+    candidates = [result for index, result in enumerate(results) if items[index] is None]
     
-    # Create new rating for winner
-    winner_new_rating = await rating_db.create_rating(
-        RatingCreate(
-            user_id=result.winner_id,
-            category_id=result.category_id,
-            rate=new_winner_rate,
-            date=result.date
-        )
+    # One query for every user and one for every category in the batch
+    users, categories = await asyncio.gather(
+        user_db.get_users_by_ids([user_id for r in candidates for user_id in (r.winner_id, r.loser_id)]),
+        category_db.get_categories_by_ids([r.category_id for r in candidates])
     )
     
-    # Create new rating for loser
-    loser_new_rating = await rating_db.create_rating(
-        RatingCreate(
-            user_id=result.loser_id,
-            category_id=result.category_id,
-            rate=new_loser_rate,
-            date=result.date
-        )
-    )
+    valid = []
+    for index, result in enumerate(results):
+        if items[index] is not None:
+            continue
+        error = _validate_batch_item(result, users, categories)
+        if error:
+            items[index] = {"index": index, "status": error[0], "detail": error[1]}
+        else:
+            valid.append(index)
+    
+    if valid:
+        keys = [(user_id, results[index].category_id)
+                for index in valid
+                for user_id in (results[index].winner_id, results[index].loser_id)]
+        try:
+            async with rating_db.claim_current_ratings(keys) as claim:
+                # 同じプレイヤーの試合はリストの順にメモリ上で適用する
+                matches, new_ratings = [], []
+                for index in valid:
+                    match, ratings, entry = _apply_result(results[index], claim.states)
+                    matches.append(match)
+                    new_ratings.extend(ratings)
+                    items[index] = {"index": index, "status": 201, **entry}
+                
+                await result_db.save_match_results(matches, new_ratings, claim)
+                
+                for (user_id, category_id), state in claim.states.items():
+                    leaderboard.record_rating(category_id, user_id, state["rate"])
+        except ClaimConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        
+        await asyncio.gather(*[
+            category_db.bump_ranking_version(category_id)
+            for category_id in {results[index].category_id for index in valid}
+        ])
     
     return {
-        "message": "Match result recorded and new ratings created",
-        "match_id": match.id,
-        "winner": {
-            "id": result.winner_id,
-            "old_rating": winner_current_rate,
-            "new_rating": new_winner_rate
-        },
-        "loser": {
-            "id": result.loser_id,
-            "old_rating": loser_current_rate,
-            "new_rating": new_loser_rate
-        }
+        "message": f"{len(valid)} of {len(results)} match results recorded",
+        "recorded": len(valid),
+        "failed": len(results) - len(valid),
+        "results": items
     }
-
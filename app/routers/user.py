@@ -1,12 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, Body
 from typing import List, Optional
-from app.schemas.user import UserCreate, UserUpdate, UserResponse
+from app.schemas.user import UserCreate, UserUpdate, UserResponse, UserSummary, UserBatchResponse
 from app.database import user_db
+from app.database.errors import InvalidCursor
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
+from decouple import config
 
 router = APIRouter(prefix="/api/user", tags=["users"])
 
+# Most IDs accepted by POST /api/user/batch
+MAX_BATCH_USERS = config("MAX_BATCH_USERS", default=100, cast=int)
+
 
 @router.post("/", response_model=UserResponse)
 async def create_user(user: UserCreate):
@@ -17,6 +22,30 @@ async def create_user(user: UserCreate):
     return created_user
 
 
+@router.post("/batch", response_model=UserBatchResponse)
+async def get_users_batch(user_ids: List[str] = Body(..., max_length=MAX_BATCH_USERS)):
+    """
+    Get the public profiles of several users with one query.
+    users follows the order of the request (null for unknown or invalid IDs, which are also listed in missing).
+    """
+    found = await user_db.get_users_by_ids(user_ids)
+    users = [found.get(user_id) for user_id in user_ids]
+    missing = list(dict.fromkeys(user_id for user_id, user in zip(user_ids, users) if user is None))
+    return UserBatchResponse(users=users, missing=missing)
+
+
+@router.get("/suggest", response_model=List[UserSummary])
+async def suggest_users(
+    key: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50)
+):
+    """
+    Typeahead suggestions for the opponent picker: users whose name or intra_name
+    (or one of their words) starts with key, then close matches for typos.
+    """
+    return await user_db.suggest_users(key, limit)
+
+
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user(user_id: str):
     """
@@ -50,12 +79,23 @@ async def update_user(user_id: str, user_update: UserUpdate):
 
 
 @router.get("/", response_model=List[UserResponse])
-async def search_users(key: Optional[str] = Query(None)):
+async def search_users(
+    response: Response,
+    key: Optional[str] = Query(None),
+    limit: int = Query(user_db.SEARCH_LIMIT, ge=1, le=100),
+    after: Optional[str] = None
+):
     """
-    Search users by name or intra_name (partial match).
+    Search users by name, intra_name or email (prefix of the whole value or of a word).
+    When more users match, the X-Next-Cursor header holds the after value of the next page.
     """
     if not key:
         raise HTTPException(status_code=400, detail="Search key is required")
     
-    users = await user_db.search_users(key)
+    try:
+        users, next_cursor = await user_db.search_users(key, limit=limit, after=after)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
     return users
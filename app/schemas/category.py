@@ -52,3 +52,12 @@ class CategoryResponse(BaseModel):
 
     class Config:
         populate_by_name = True
+
+
+class CategorySummary(BaseModel):
+    id: str = Field(alias="_id")
+    name: str
+    image: Optional[str] = None
+
+    class Config:
+        populate_by_name = True
@@ -1,6 +1,8 @@
 from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
+from app.schemas.user import UserSummary
+from app.schemas.category import CategorySummary
 
 
 class MatchBase(BaseModel):
@@ -57,3 +59,10 @@ class MatchResponse(BaseModel):
 
     class Config:
         populate_by_name = True
+
+
+class MatchExpandedResponse(MatchResponse):
+    # expand=users / expand=category のときだけ含める（見つからなければ null）
+    winner: Optional[UserSummary] = None
+    loser: Optional[UserSummary] = None
+    category: Optional[CategorySummary] = None
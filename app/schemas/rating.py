@@ -50,3 +50,61 @@ class RatingResponse(BaseModel):
 
     class Config:
         populate_by_name = True
+
+
+class RatingOHLC(BaseModel):
+    date: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    count: int
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "date": "2023-01-01T00:00:00",
+                "open": 1500.0,
+                "high": 1532.0,
+                "low": 1484.0,
+                "close": 1516.0,
+                "count": 4
+            }
+        }
+
+
+class CurrentRatingInDB(BaseModel):
+    id: str = Field(alias="_id")
+    user_id: str
+    category_id: str
+    rate: float
+    rating_id: str
+    games_played: int = 0
+    version: int = 0
+    peak_rating: float
+    last_match_date: datetime
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        populate_by_name = True
+        json_schema_extra = {
+            "example": {
+                "_id": "507f1f77bcf86cd799439011",
+                "user_id": "507f1f77bcf86cd799439022",
+                "category_id": "507f1f77bcf86cd799439033",
+                "rate": 1516.0,
+                "rating_id": "507f1f77bcf86cd799439044",
+                "games_played": 1,
+                "version": 1,
+                "peak_rating": 1516.0,
+                "last_match_date": "2023-01-01T00:00:00",
+                "created_at": "2023-01-01T00:00:00",
+                "updated_at": "2023-01-01T00:00:00"
+            }
+        }
+
+
+class RankedRatingInDB(CurrentRatingInDB):
+    rank: int
+    dense_rank: int
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -54,3 +54,37 @@ class UserResponse(BaseModel):
 
     class Config:
         populate_by_name = True
+
+
+class UserSummary(BaseModel):
+    id: str = Field(alias="_id")
+    name: str
+    intra_name: str
+    user_image: Optional[str] = None
+
+    class Config:
+        populate_by_name = True
+
+
+class UserBatchResponse(BaseModel):
+    users: List[Optional[UserResponse]]
+    missing: List[str]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "users": [
+                    {
+                        "_id": "507f1f77bcf86cd799439011",
+                        "name": "John Doe",
+                        "intra_name": "jdoe",
+                        "email": "jdoe@example.com",
+                        "user_image": "https://example.com/image.jpg",
+                        "created_at": "2023-01-01T00:00:00",
+                        "updated_at": "2023-01-01T00:00:00"
+                    },
+                    None
+                ],
+                "missing": ["507f1f77bcf86cd799439099"]
+            }
+        }
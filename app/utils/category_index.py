@@ -0,0 +1,106 @@
+import difflib
+import time
+from typing import Dict, List, Optional
+from decouple import config
+from app.database import category_db
+from app.schemas.category import CategoryInDB
+from app.utils.normalize import normalize_name
+from app.utils.singleflight import SingleFlight
+
+# Seconds before the index is rebuilt from the categories collection
+REFRESH_SECONDS = config("CATEGORY_INDEX_TTL", default=300.0, cast=float)
+
+# An unknown name triggers a rebuild at most this often (new categories show up without waiting for the TTL)
+MISS_REFRESH_SECONDS = 10.0
+
+# Minimum similarity (0-1) for a fuzzy match
+FUZZY_CUTOFF = 0.6
+
+class CategoryIndex:
+    """
+    Category lookup by loosely written name.
+    """
+
+    def __init__(self, categories: List[CategoryInDB]):
+        self._by_name: Dict[str, CategoryInDB] = {}
+        for category in categories:
+            key = normalize_name(category.name)
+            if key:
+                self._by_name.setdefault(key, category)
+
+    def __len__(self) -> int:
+        return len(self._by_name)
+
+    def resolve(self, name: str) -> Optional[CategoryInDB]:
+        """
+        Find a category by exact normalized name, then by partial name, then by similarity.
+        """
+        key = normalize_name(name)
+        if not key:
+            return None
+
+        category = self._by_name.get(key)
+        if category is not None:
+            return category
+
+        # 「バスケ」→「バスケットボール⛹️‍♀️」のような部分一致
+        partial = [candidate for candidate in self._by_name if key in candidate or candidate in key]
+        candidates = partial or list(self._by_name)
+        scored = [
+            (difflib.SequenceMatcher(None, key, candidate).ratio(), candidate)
+            for candidate in candidates
+        ]
+        scored = [(score, candidate) for score, candidate in scored if partial or score >= FUZZY_CUTOFF]
+        if not scored:
+            return None
+        return self._by_name[max(scored)[1]]
+
+
+# ワーカープロセス内のインデックス
+_index: Optional[CategoryIndex] = None
+_loaded_at = 0.0
+# Bumped by invalidate(); a build started before the bump is not kept
+_generation = 0
+_flight = SingleFlight()
+
+
+async def _build(generation: int) -> CategoryIndex:
+    global _index, _loaded_at
+    index = CategoryIndex(await category_db.get_all_categories())
+    if generation == _generation:
+        _index = index
+        _loaded_at = time.monotonic()
+    return index
+
+
+async def _reload() -> CategoryIndex:
+    # 同時に来た再構築（TTL切れ・未知の名前）は1回にまとめる
+    generation = _generation
+    return await _flight.do(("categories", generation), lambda: _build(generation))
+
+
+def invalidate() -> None:
+    """
+    Rebuild the index on the next lookup. category_db calls it after creating, renaming or
+    deleting a category; other workers see the change after at most REFRESH_SECONDS.
+    """
+    global _index, _generation
+    _index = None
+    _generation += 1
+
+
+async def resolve_category(name: str) -> Optional[CategoryInDB]:
+    """
+    Resolve a category name from the cached index, rebuilding it when older than REFRESH_SECONDS.
+    A name that does not resolve rebuilds the index once (at most every MISS_REFRESH_SECONDS).
+    """
+    index = _index
+    age = time.monotonic() - _loaded_at
+    if index is None or age > REFRESH_SECONDS:
+        index = await _reload()
+        age = 0.0
+
+    category = index.resolve(name)
+    if category is None and age > MISS_REFRESH_SECONDS:
+        category = (await _reload()).resolve(name)
+    return category
@@ -0,0 +1,144 @@
+import asyncio
+import weakref
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+# Results cached for the current request (set by RequestScopeMiddleware)
+_request_cache: ContextVar[Optional[Dict[tuple, Any]]] = ContextVar("dataloader_request_cache", default=None)
+
+
+class _LoopState:
+    __slots__ = ("futures", "queue", "scheduled")
+
+    def __init__(self):
+        # 待ち中・実行中のキーごとの Future
+        self.futures: Dict[Hashable, asyncio.Future] = {}
+        self.queue: List[Hashable] = []
+        self.scheduled = False
+
+
+class DataLoader:
+    """
+    Collect the lookups made within one event loop tick into a single batch_fn call.
+
+    batch_fn(keys) returns {key: value}; keys it leaves out resolve to None.
+    Concurrent loads of the same key share one lookup, including loads that arrive
+    while its batch is running. Inside a request (see RequestScopeMiddleware) results
+    are also cached until the response is sent.
+    State is kept per event loop, since futures cannot cross loops.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        batch_fn: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+        max_batch_size: int = 1000
+    ):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self._states: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+        self.loads = 0
+        self.cache_hits = 0
+        self.shared = 0
+        self.batches = 0
+        self.keys = 0
+
+    def _state(self, loop: asyncio.AbstractEventLoop) -> _LoopState:
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+        return state
+
+    async def load(self, key: Hashable) -> Any:
+        """
+        Get the value of key, batched with the other loads of this tick.
+        """
+        self.loads += 1
+        cache = _request_cache.get()
+        if cache is not None and (self.name, key) in cache:
+            self.cache_hits += 1
+            return cache[(self.name, key)]
+
+        loop = asyncio.get_running_loop()
+        state = self._state(loop)
+        future = state.futures.get(key)
+        if future is not None:
+            self.shared += 1
+        else:
+            future = state.futures[key] = loop.create_future()
+            state.queue.append(key)
+            if not state.scheduled:
+                # 同じ tick 内の他の load が積まれてからまとめて発行する
+                state.scheduled = True
+                loop.call_soon(self._dispatch, loop, state)
+
+        # shield: a cancelled caller must not cancel the lookup shared with others
+        value = await asyncio.shield(future)
+        if cache is not None:
+            cache[(self.name, key)] = value
+        return value
+
+    def _dispatch(self, loop: asyncio.AbstractEventLoop, state: _LoopState) -> None:
+        queue, state.queue, state.scheduled = state.queue, [], False
+        for start in range(0, len(queue), self.max_batch_size):
+            loop.create_task(self._run_batch(state, queue[start:start + self.max_batch_size]))
+
+    async def _run_batch(self, state: _LoopState, keys: List[Hashable]) -> None:
+        self.batches += 1
+        self.keys += len(keys)
+        try:
+            values = await self.batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                future = state.futures.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+                # 誰も待っていない場合の "exception was never retrieved" を防ぐ
+                future.exception()
+            return
+        for key in keys:
+            future = state.futures.pop(key)
+            if not future.done():
+                future.set_result(values.get(key))
+
+    def clear(self, key: Hashable) -> None:
+        """
+        Forget the request-cached value of key (call after writing it).
+        """
+        cache = _request_cache.get()
+        if cache is not None:
+            cache.pop((self.name, key), None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters of this loader (per worker process).
+        """
+        return {
+            "name": self.name,
+            "loads": self.loads,
+            "cache_hits": self.cache_hits,
+            "shared": self.shared,
+            "batches": self.batches,
+            "keys": self.keys,
+            "avg_batch_size": self.keys / self.batches if self.batches else 0.0
+        }
+
+
+class RequestScopeMiddleware:
+    """
+    ASGI middleware giving every HTTP request its own DataLoader result cache.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request_cache.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_cache.reset(token)
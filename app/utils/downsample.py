@@ -0,0 +1,39 @@
+import math
+from typing import List, Sequence
+import numpy as np
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """
+    Largest-Triangle-Three-Buckets: indexes of at most threshold points that keep the shape of a line.
+
+    xs must be ascending. The first and last points are always kept; every bucket in
+    between keeps the point forming the largest triangle with the previously kept point
+    and the average of the next bucket, so peaks and dips survive the reduction.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    x = np.asarray(xs, dtype=float)
+    y = np.asarray(ys, dtype=float)
+    every = (n - 2) / (threshold - 2)
+
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # 次のバケットの平均点
+        avg_start = int(math.floor((i + 1) * every)) + 1
+        avg_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+
+        # 今のバケットから三角形の面積が最大の点を選ぶ
+        start = int(math.floor(i * every)) + 1
+        end = int(math.floor((i + 1) * every)) + 1
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected.append(a)
+
+    selected.append(n - 1)
+    return selected
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict
+
+
+class BoundedExecutor:
+    """
+    Thread pool for blocking calls (e.g. bcrypt) awaited from async handlers.
+    At most max_workers calls run at once; the rest wait in the pool's queue.
+    Counters are per worker process.
+    """
+
+    def __init__(self, max_workers: int, name: str):
+        self.max_workers = max_workers
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _run(self, submitted_at: float, fn: Callable[..., Any]) -> Any:
+        started_at = time.perf_counter()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_seconds += started_at - submitted_at
+        failed = True
+        try:
+            result = fn()
+            failed = False
+            return result
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.run_seconds += time.perf_counter() - started_at
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run fn(*args, **kwargs) in the pool without blocking the event loop.
+        """
+        with self._lock:
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queued)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            partial(self._run, time.perf_counter(), partial(fn, *args, **kwargs))
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Queue depth and timing counters of this pool.
+        """
+        with self._lock:
+            calls = self.completed + self.failed
+            return {
+                "name": self.name,
+                "max_workers": self.max_workers,
+                "queued": self.queued,
+                "running": self.running,
+                "max_queue_depth": self.max_queue_depth,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": self.wait_seconds / calls * 1000 if calls else 0.0,
+                "avg_run_ms": self.run_seconds / calls * 1000 if calls else 0.0
+            }
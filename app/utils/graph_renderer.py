@@ -0,0 +1,137 @@
+import io
+import math
+from datetime import datetime
+from typing import List, Tuple
+from xml.sax.saxutils import escape
+
+# Dots per inch of rendered PNGs; sizes are given in pixels
+DPI = 100
+
+# SVG の余白（タイトル・軸ラベル分）
+MARGIN_LEFT = 60
+MARGIN_RIGHT = 20
+MARGIN_TOP = 40
+MARGIN_BOTTOM = 70
+
+# Points are drawn as circles only up to this many (long histories become a plain line)
+MAX_MARKERS = 200
+
+LINE_COLOR = "#0000ff"
+
+
+def render_rating_history_png(
+    dates: List[datetime],
+    rates: List[float],
+    title: str,
+    width: int,
+    height: int
+) -> bytes:
+    """
+    Render a rating history line graph as PNG bytes.
+    Uses its own Figure (no pyplot global state), so it can run in worker threads.
+    """
+    # matplotlib は PNG が要求されたときだけ読み込む（起動時間・メモリ節約）
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(width / DPI, height / DPI), dpi=DPI)
+    ax = fig.subplots()
+    ax.plot(dates, rates, marker='o', linestyle='-', color='b')
+    ax.set_title(title)
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Rating")
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+
+    img_io = io.BytesIO()
+    fig.savefig(img_io, format='png')
+    return img_io.getvalue()
+
+
+def _nice_ticks(low: float, high: float, count: int = 5) -> List[float]:
+    """
+    About count evenly spaced round values (1, 2, 5 x 10^n apart) covering low..high.
+    """
+    if high <= low:
+        low, high = low - 10, high + 10
+    raw_step = (high - low) / count
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(m * magnitude for m in (1, 2, 5, 10) if m * magnitude >= raw_step)
+    first = math.floor(low / step) * step
+    last = math.ceil(high / step) * step
+    return [first + i * step for i in range(int(round((last - first) / step)) + 1)]
+
+
+def _scale(value: float, low: float, high: float, start: float, end: float) -> float:
+    if high == low:
+        return (start + end) / 2
+    return start + (value - low) / (high - low) * (end - start)
+
+
+def _x_label_indexes(n: int, max_labels: int) -> List[int]:
+    if n <= max_labels:
+        return list(range(n))
+    step = (n - 1) / (max_labels - 1)
+    return sorted({round(i * step) for i in range(max_labels)})
+
+
+def render_rating_history_svg(
+    dates: List[datetime],
+    rates: List[float],
+    title: str,
+    width: int,
+    height: int
+) -> bytes:
+    """
+    Render a rating history line graph as SVG bytes, without matplotlib.
+    Same layout as the PNG: points joined in date order, rating axis on the left, dates below.
+    """
+    left, right = MARGIN_LEFT, width - MARGIN_RIGHT
+    top, bottom = MARGIN_TOP, height - MARGIN_BOTTOM
+    font = 'font-family="sans-serif" font-size="12"'
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}">',
+        f'<rect width="{width}" height="{height}" fill="#ffffff"/>',
+        f'<text x="{width / 2:.1f}" y="{MARGIN_TOP / 2 + 6:.1f}" text-anchor="middle" '
+        f'font-family="sans-serif" font-size="14">{escape(title)}</text>',
+        f'<text x="{width / 2:.1f}" y="{height - 8}" text-anchor="middle" {font}>Date</text>',
+        f'<text x="14" y="{(top + bottom) / 2:.1f}" text-anchor="middle" {font} '
+        f'transform="rotate(-90 14 {(top + bottom) / 2:.1f})">Rating</text>',
+    ]
+
+    if rates:
+        ticks = _nice_ticks(min(rates), max(rates))
+        low, high = ticks[0], ticks[-1]
+        stamps = [date.timestamp() for date in dates]
+        points: List[Tuple[float, float]] = [
+            (_scale(stamp, stamps[0], stamps[-1], left, right), _scale(rate, low, high, bottom, top))
+            for stamp, rate in zip(stamps, rates)
+        ]
+
+        # 目盛りと補助線
+        for tick in ticks:
+            y = _scale(tick, low, high, bottom, top)
+            parts.append(f'<line x1="{left}" y1="{y:.1f}" x2="{right}" y2="{y:.1f}" stroke="#e0e0e0"/>')
+            parts.append(f'<text x="{left - 6}" y="{y + 4:.1f}" text-anchor="end" {font}>{tick:g}</text>')
+        for i in _x_label_indexes(len(dates), max(2, (right - left) // 80)):
+            x = points[i][0]
+            parts.append(
+                f'<text x="{x:.1f}" y="{bottom + 14}" text-anchor="end" {font} '
+                f'transform="rotate(-45 {x:.1f} {bottom + 14})">{dates[i]:%Y-%m-%d}</text>'
+            )
+
+        coords = " ".join(f"{x:.1f},{y:.1f}" for x, y in points)
+        parts.append(f'<polyline points="{coords}" fill="none" stroke="{LINE_COLOR}" stroke-width="1.5"/>')
+        if len(points) <= MAX_MARKERS:
+            parts.extend(f'<circle cx="{x:.1f}" cy="{y:.1f}" r="3" fill="{LINE_COLOR}"/>' for x, y in points)
+    else:
+        parts.append(
+            f'<text x="{(left + right) / 2:.1f}" y="{(top + bottom) / 2:.1f}" text-anchor="middle" '
+            f'{font} fill="#808080">No ratings yet</text>'
+        )
+
+    parts.append(f'<rect x="{left}" y="{top}" width="{right - left}" height="{bottom - top}" '
+                 f'fill="none" stroke="#000000"/>')
+    parts.append('</svg>')
+    return "\n".join(parts).encode("utf-8")
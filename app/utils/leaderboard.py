@@ -0,0 +1,285 @@
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+from decouple import config
+from app.database import category_db, rating_db
+from app.utils.singleflight import SingleFlight
+
+# Maximum height of the skip list (enough for well over 2**20 players)
+MAX_LEVEL = 24
+
+# Seconds before a category is reloaded from current_ratings. Other gunicorn
+# workers update their own copy, so this bounds cross-worker staleness.
+REFRESH_SECONDS = config("LEADERBOARD_REFRESH_SECONDS", default=30.0, cast=float)
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+class IndexableSkipList:
+    """
+    Sorted set of unique keys with O(log n) insert, remove, rank and select.
+    Each link stores how many positions it skips, so positions can be counted on the way down.
+    """
+
+    def __init__(self):
+        self._nil = _Node(None, 0)
+        self._head = _Node(None, MAX_LEVEL)
+        self._head.next = [self._nil] * MAX_LEVEL
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        return level
+
+    def insert(self, key) -> None:
+        """
+        Insert a key that is not already present.
+        """
+        chain = [None] * MAX_LEVEL
+        steps_at_level = [0] * MAX_LEVEL
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not self._nil and node.next[level].key < key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = self._random_level()
+        new_node = _Node(key, height)
+        steps = 0
+        for level in range(height):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, MAX_LEVEL):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key) -> None:
+        """
+        Remove a key that is present.
+        """
+        chain = [None] * MAX_LEVEL
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not self._nil and node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+
+        target = chain[0].next[0]
+        if target is self._nil or target.key != key:
+            raise KeyError(key)
+
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def count_less(self, key) -> int:
+        """
+        Number of keys strictly smaller than key.
+        """
+        position = 0
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.next[level] is not self._nil and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def select(self, index: int):
+        """
+        Key at a 0-based position.
+        """
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        remaining = index + 1
+        node = self._head
+        for level in reversed(range(MAX_LEVEL)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node.key
+
+
+class Leaderboard:
+    """
+    Ranking of one category, ordered by rate descending.
+    User IDs are interned to small ints so the skip list keys stay cheap to compare.
+    """
+
+    def __init__(self):
+        self._interned: Dict[str, int] = {}
+        self._user_ids: List[str] = []
+        self._rates: Dict[int, float] = {}
+        self._skiplist = IndexableSkipList()
+
+    def __len__(self) -> int:
+        return len(self._rates)
+
+    def _intern(self, user_id: str) -> int:
+        uid = self._interned.get(user_id)
+        if uid is None:
+            uid = len(self._user_ids)
+            self._interned[user_id] = uid
+            self._user_ids.append(user_id)
+        return uid
+
+    def update(self, user_id: str, rate: float) -> None:
+        """
+        Set the current rate of a user.
+        """
+        uid = self._intern(user_id)
+        old_rate = self._rates.get(uid)
+        if old_rate is not None:
+            self._skiplist.remove((-old_rate, uid))
+        self._rates[uid] = rate
+        self._skiplist.insert((-rate, uid))
+
+    def remove(self, user_id: str) -> None:
+        """
+        Drop a user from the ranking.
+        """
+        uid = self._interned.get(user_id)
+        if uid is None or uid not in self._rates:
+            return
+        self._skiplist.remove((-self._rates.pop(uid), uid))
+
+    def get_rate(self, user_id: str) -> Optional[float]:
+        """
+        Current rate of a user, or None if unranked.
+        """
+        uid = self._interned.get(user_id)
+        if uid is None:
+            return None
+        return self._rates.get(uid)
+
+    def _rank_of_rate(self, rate: float) -> int:
+        # 同じレートは同順位 (1, 1, 3)
+        return self._skiplist.count_less((-rate, -1)) + 1
+
+    def rank(self, user_id: str) -> Optional[int]:
+        """
+        Competition rank of a user (1-based), or None if unranked.
+        """
+        rate = self.get_rate(user_id)
+        if rate is None:
+            return None
+        return self._rank_of_rate(rate)
+
+    def entry_at(self, index: int) -> Tuple[int, str, float]:
+        """
+        (rank, user_id, rate) at a 0-based position.
+        """
+        neg_rate, uid = self._skiplist.select(index)
+        return self._rank_of_rate(-neg_rate), self._user_ids[uid], -neg_rate
+
+    def around(self, user_id: str, k: int) -> List[Tuple[int, str, float]]:
+        """
+        Entries ranked up to k places above and below a user, including the user.
+        """
+        uid = self._interned.get(user_id)
+        if uid is None or uid not in self._rates:
+            return []
+        position = self._skiplist.count_less((-self._rates[uid], uid))
+        start = max(0, position - k)
+        end = min(len(self), position + k + 1)
+        return [self.entry_at(index) for index in range(start, end)]
+
+
+# カテゴリIDごとのリーダーボード（ワーカープロセス内）
+_leaderboards: Dict[str, Leaderboard] = {}
+_loaded_at: Dict[str, float] = {}
+# Ratings recorded while a reload is running, by reloaded category (None: every category)
+_changes: Dict[Optional[str], List[Tuple[str, str, float]]] = {}
+_flight = SingleFlight()
+
+
+def _build(current_ratings) -> Dict[str, Leaderboard]:
+    leaderboards: Dict[str, Leaderboard] = {}
+    for current in current_ratings:
+        board = leaderboards.setdefault(current.category_id, Leaderboard())
+        board.update(current.user_id, current.rate)
+    return leaderboards
+
+
+async def _reload(category_id: Optional[str]) -> Dict[str, Leaderboard]:
+    # 読み込み中の書き込みは記録しておき、新しいリーダーボードにも反映する
+    changes = _changes[category_id] = []
+    try:
+        leaderboards = _build(await rating_db.get_current_ratings(category_id))
+        if category_id is not None:
+            leaderboards.setdefault(category_id, Leaderboard())
+        for changed_category_id, user_id, rate in changes:
+            leaderboards.setdefault(changed_category_id, Leaderboard()).update(user_id, rate)
+    finally:
+        del _changes[category_id]
+    return leaderboards
+
+
+async def _load_all() -> None:
+    leaderboards = await _reload(None)
+    now = time.monotonic()
+    _leaderboards.clear()
+    _leaderboards.update(leaderboards)
+    _loaded_at.clear()
+    _loaded_at.update({category_id: now for category_id in leaderboards})
+
+
+async def _load_category(category_id: str) -> None:
+    # 存在しないカテゴリのリーダーボードは持たない（任意のIDでメモリが増えないように）
+    if await category_db.get_category(category_id) is None:
+        _leaderboards.pop(category_id, None)
+        _loaded_at.pop(category_id, None)
+        return
+    leaderboards = await _reload(category_id)
+    _leaderboards[category_id] = leaderboards[category_id]
+    _loaded_at[category_id] = time.monotonic()
+
+
+async def load_leaderboards() -> None:
+    """
+    Build every category leaderboard from the current_ratings read model.
+    """
+    await _flight.do(None, _load_all)
+
+
+async def get_leaderboard(category_id: str) -> Optional[Leaderboard]:
+    """
+    Get the leaderboard of a category, reloading it when older than REFRESH_SECONDS.
+    Concurrent requests share one reload. Returns None for an unknown category.
+    """
+    loaded_at = _loaded_at.get(category_id)
+    if loaded_at is None or time.monotonic() - loaded_at > REFRESH_SECONDS:
+        await _flight.do(category_id, lambda: _load_category(category_id))
+    return _leaderboards.get(category_id)
+
+
+def record_rating(category_id: str, user_id: str, rate: float) -> None:
+    """
+    Apply a new rating written by this worker.
+    """
+    board = _leaderboards.get(category_id)
+    if board is not None:
+        board.update(user_id, rate)
+    for reloaded_category_id, changes in _changes.items():
+        if reloaded_category_id is None or reloaded_category_id == category_id:
+            changes.append((category_id, user_id, rate))
@@ -0,0 +1,38 @@
+from collections import deque
+from typing import Any, Dict
+
+
+class LatencyRecorder:
+    """
+    Percentiles over the most recent latency samples (in ms) of this worker process.
+    """
+
+    def __init__(self, window: int = 1000):
+        self._samples: "deque[float]" = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, ms: float) -> None:
+        """
+        Add one sample.
+        """
+        self._samples.append(ms)
+        self.count += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Count and p50/p95/p99/max of the recent samples.
+        """
+        samples = sorted(self._samples)
+        if not samples:
+            return {"count": self.count, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+
+        def percentile(p: float) -> float:
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        return {
+            "count": self.count,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": samples[-1]
+        }
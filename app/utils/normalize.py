@@ -0,0 +1,57 @@
+import re
+import unicodedata
+from typing import List, Set
+
+# 絵文字・記号・空白・句読点・異体字セレクタ・ZWJ は名前の比較に使わない
+_IGNORED_CATEGORIES = ("S", "P", "Z", "C", "M")
+
+# ASCII characters other than letters and digits (all of them fall in the categories above)
+_ASCII_IGNORED = re.compile(r"[^a-z0-9]")
+
+# Word boundaries inside names, intra names and email local parts
+_WORD_SEPARATORS = re.compile(r"[\s._\-+]+")
+
+# Version of the stored search terms: bump it whenever normalize_name or user_search_terms
+# change what they produce, so that user_db.ensure_search_terms recomputes existing users
+SEARCH_TERMS_VERSION = 2
+
+
+def normalize_name(name: str) -> str:
+    """
+    Fold a name for matching: NFKC, case folding, katakana to hiragana,
+    without emoji, symbols, punctuation or spaces.
+    """
+    if name.isascii():
+        # ASCII では英数字以外がすべて除外対象なので、Unicode の分類を引かずに済む
+        return _ASCII_IGNORED.sub("", name.lower())
+    folded = []
+    for char in unicodedata.normalize("NFKC", name).casefold():
+        if unicodedata.category(char).startswith(_IGNORED_CATEGORIES):
+            continue
+        # カタカナ → ひらがな
+        if "ァ" <= char <= "ヶ":
+            char = chr(ord(char) - 0x60)
+        folded.append(char)
+    return "".join(folded)
+
+
+def name_terms(*values: str) -> Set[str]:
+    """
+    Normalized forms of each value and of each of its words.
+    """
+    terms = {normalize_name(value) for value in values}
+    for value in values:
+        terms.update(normalize_name(word) for word in _WORD_SEPARATORS.split(value))
+    terms.discard("")
+    return terms
+
+
+def user_search_terms(name: str, intra_name: str, email: str) -> List[str]:
+    """
+    Normalized prefixes a user can be found by: the whole name, intra name and email,
+    and each word of the name, intra name and email local part.
+    """
+    terms = name_terms(name, intra_name, email.split("@", 1)[0])
+    terms.add(normalize_name(email))
+    terms.discard("")
+    return sorted(terms)
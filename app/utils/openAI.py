@@ -1,11 +1,62 @@
 from decouple import config
-from openai import OpenAI
-import requests
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+import httpx
 import json
+from functools import partial
+from typing import AsyncIterator, List, Optional, Tuple
+from app.database import rating_db, user_db, category_db
+from app.utils import category_index
+from app.utils.cache import TTLCache
+from app.utils.normalize import normalize_name
+from app.utils.singleflight import SingleFlight
+from app.utils.openai_transport import RecordReplayTransport
 
-# 環境変数からキーとURLを取得
-API_URL = config("API_URL")
-client = OpenAI(api_key=config("OPENAI_API_KEY"))
+# live: OpenAI に接続 / record: 応答をフィクスチャに保存 / replay: フィクスチャから応答（ネットワーク不要）
+OPENAI_TRANSPORT = config("OPENAI_TRANSPORT", default="live")
+
+
+def _transport() -> Optional[RecordReplayTransport]:
+    if OPENAI_TRANSPORT == "live":
+        return None
+    return RecordReplayTransport(
+        OPENAI_TRANSPORT,
+        fixtures_dir=config("OPENAI_FIXTURES_DIR", default="tests/fixtures/openai"),
+        latency=config("OPENAI_REPLAY_LATENCY", default=0.0, cast=float),
+        chunk_latency=config("OPENAI_REPLAY_CHUNK_LATENCY", default=0.0, cast=float)
+    )
+
+
+# 1ワーカーで1つのクライアントを使い回す（コネクションプール）
+client = AsyncOpenAI(
+    api_key=config("OPENAI_API_KEY", default="replay") if OPENAI_TRANSPORT == "replay" else config("OPENAI_API_KEY"),
+    timeout=config("OPENAI_TIMEOUT", default=30.0, cast=float),
+    http_client=DefaultAsyncHttpxClient(
+        transport=_transport(),
+        limits=httpx.Limits(
+            max_connections=config("OPENAI_MAX_CONNECTIONS", default=20, cast=int),
+            max_keepalive_connections=config("OPENAI_MAX_KEEPALIVE", default=10, cast=int)
+        )
+    )
+)
+
+# チャットのキャッシュ（ワーカーごと）
+# 同じ質問 → 最終応答（短いTTL）、同じツール呼び出し → ツールの出力
+reply_cache = TTLCache(
+    maxsize=config("CHAT_REPLY_CACHE_SIZE", default=256, cast=int),
+    ttl=config("CHAT_REPLY_CACHE_TTL", default=30.0, cast=float)
+)
+tool_cache = TTLCache(
+    maxsize=config("CHAT_TOOL_CACHE_SIZE", default=512, cast=int),
+    ttl=config("CHAT_TOOL_CACHE_TTL", default=300.0, cast=float)
+)
+
+reply_flight = SingleFlight()
+
+
+class ToolError(Exception):
+    """
+    A tool call failed; the message is the reply shown to the user (it is not cached).
+    """
 
 # Function callingで使う関数定義
 functions = [
@@ -39,73 +90,121 @@ functions = [
     }
 ]
 
-# カテゴリ名とIDのマッピング（固定ID）
-CATEGORY_IDS = {
-    "バスケットボール⛹️‍♀️": "6803cee775973e54f7023f84",
-    "typing": "6803cf37bd1ca27affcb0089"
-}
+async def call_get_category_ranking(category_name: str):
+    try:
+        category = await category_index.resolve_category(category_name)
+        if not category:
+            return f"不明なカテゴリ名です: {category_name}"
+
+        # ランキングが変わると ranking_version が上がり、古い出力は使われなくなる
+        version = await category_db.get_ranking_version(category.id)
+        key = ("get_category_ranking", category.id, version)
+        cached = tool_cache.get(key)
+        if cached is not None:
+            return cached
 
-def call_get_category_ranking(category_name: str):
-    category_id = CATEGORY_IDS.get(category_name)
-    if not category_id:
-        return f"不明なカテゴリ名です: {category_name}"
+        rankings = await rating_db.get_category_rankings(category.id, limit=10)  # 最大10件に制限
+        users = await user_db.get_users_by_ids([ranking.user_id for ranking in rankings])
 
-    try:
-        response = requests.get(f"{API_URL}/api/ranking/category/{category_id}")
-        response.raise_for_status()
-        data = response.json()[:10]  # 最大10件に制限
-
-        # ランキングを整形して返す
-        return "\n".join([
-            f"{item['rank']}位: {item['name']}（{item['rating']}）"
-            for item in data
-        ])
+        # ランキングを整形して返す（削除済みユーザーは除く）
+        result = "\n".join([
+            f"{ranking.rank}位: {users[ranking.user_id].name}（{ranking.rate}）"
+            for ranking in rankings
+            if ranking.user_id in users
+        ]) or f"{category.name} のランキングはまだありません。"
+        tool_cache.set(key, result)
+        return result
     except Exception as e:
-        return f"API取得中にエラーが発生しました: {str(e)}"
+        raise ToolError(f"ランキング取得中にエラーが発生しました: {str(e)}")
 
-def call_search_users(search_key: str):
+async def call_search_users(search_key: str):
     """
-    ユーザー検索APIを呼び出す関数
+    ユーザーを検索して整形する関数
     """
+    # search_users は正規化したキーで検索するので、同じ結果になるキーは1つにまとめる
+    key = ("search_users", normalize_name(search_key or ""))
+    cached = tool_cache.get(key)
+    if cached is not None:
+        return cached
+
     try:
-        # クエリパラメータとしてkeyを渡す
-        params = {"key": search_key}
-        response = requests.get(f"{API_URL}/api/user", params=params)
-        response.raise_for_status()
-        data = response.json()
+        users, _ = await user_db.search_users(search_key)
         
-        if not data:
-            return "該当するユーザーが見つかりませんでした。"
-        
-        # 検索結果を整形して返す
-        result = "検索結果:\n"
-        for i, user in enumerate(data, 1):
-            name = user.get("name", "名前なし")
-            intra_name = user.get("intra_name", "")
-            
-            
-            result += f"{i}. {name} (intra@{intra_name})\n"
-        
-        return result
+        if not users:
+            result = "該当するユーザーが見つかりませんでした。"
+        else:
+            # 検索結果を整形して返す
+            result = "検索結果:\n"
+            for i, user in enumerate(users, 1):
+                name = user.name or "名前なし"
+                intra_name = user.intra_name or ""
+                
+                
+                result += f"{i}. {name} (intra@{intra_name})\n"
     except Exception as e:
-        return f"ユーザー検索中にエラーが発生しました: {str(e)}"
+        raise ToolError(f"ユーザー検索中にエラーが発生しました: {str(e)}")
+
+    # 見つからなかった結果はキャッシュしない（直後に登録されたユーザーも見つかるように）
+    if users:
+        tool_cache.set(key, result)
+    return result
+
+MODEL = "gpt-3.5-turbo-1106"
+
+
+def _messages(content: str) -> List[dict]:
+    return [
+        {
+            "role": "system",
+            "content": "あなたはスポーツやスキルカテゴリのランキングを取得したり、ユーザー検索ができるアシスタントです。"
+        },
+        {
+            "role": "user",
+            "content": content
+        }
+    ]
+
 
-def openai_api(content: str) -> str:
+async def call_function(func_name: str, arguments: str) -> Optional[str]:
+    """
+    モデルが選んだ関数を実行する（未知の関数なら None）。失敗したら ToolError
+    """
+    if func_name == "get_category_ranking":
+        args = json.loads(arguments)
+        category_name = args.get("category_name")
+        return await call_get_category_ranking(category_name)
+    
+    elif func_name == "search_users":
+        args = json.loads(arguments)
+        search_key = args.get("search_key")
+        return await call_search_users(search_key)
+
+    return None
+
+
+async def openai_api(content: str) -> str:
     """
     OpenAI function calling を使ってカテゴリ名からランキングを取得またはユーザー検索を実行。
     """
-    chat_response = client.chat.completions.create(
-        model="gpt-3.5-turbo-1106",
-        messages=[
-            {
-                "role": "system",
-                "content": "あなたはスポーツやスキルカテゴリのランキングを取得したり、ユーザー検索ができるアシスタントです。"
-            },
-            {
-                "role": "user",
-                "content": content
-            }
-        ],
+    key = content.strip()
+    cached = reply_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # 同じ質問が同時に来たら OpenAI への問い合わせは1回にまとめる
+    try:
+        reply = await reply_flight.do(key, partial(_openai_reply, content))
+    except ToolError as e:
+        # エラーの応答はキャッシュしない（復旧後に同じ質問をすればやり直す）
+        return str(e)
+    reply_cache.set(key, reply)
+    return reply
+
+
+async def _openai_reply(content: str) -> str:
+    chat_response = await client.chat.completions.create(
+        model=MODEL,
+        messages=_messages(content),
         functions=functions,
         function_call="auto"
     )
@@ -114,18 +213,70 @@ def openai_api(content: str) -> str:
 
     # Function Call がトリガーされた場合
     if choice.finish_reason == "function_call":
-        func_name = choice.message.function_call.name
-        arguments = choice.message.function_call.arguments
-
-        if func_name == "get_category_ranking":
-            args = json.loads(arguments)
-            category_name = args.get("category_name")
-            return call_get_category_ranking(category_name)
-        
-        elif func_name == "search_users":
-            args = json.loads(arguments)
-            search_key = args.get("search_key")
-            return call_search_users(search_key)
+        reply = await call_function(choice.message.function_call.name, choice.message.function_call.arguments)
+        if reply is not None:
+            return reply
 
     # 通常のテキスト応答があった場合
-    return choice.message.content or "応答がありませんでした。"
\ No newline at end of file
+    return choice.message.content or "応答がありませんでした。"
+
+
+async def openai_api_stream(content: str) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    openai_api のストリーミング版。(event, data) を順に返す:
+    "token"（生成されたテキストの断片）、"tool"（関数呼び出しの開始・実行・完了・失敗）、最後に "reply"（最終的な応答）。
+    キャッシュにある質問は "reply" だけを返す。
+    """
+    key = content.strip()
+    cached = reply_cache.get(key)
+    if cached is not None:
+        yield "reply", {"text": cached, "cached": True}
+        return
+
+    stream = await client.chat.completions.create(
+        model=MODEL,
+        messages=_messages(content),
+        functions=functions,
+        function_call="auto",
+        stream=True
+    )
+
+    text, func_name, arguments = [], None, []
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            text.append(delta.content)
+            yield "token", {"text": delta.content}
+        if delta.function_call:
+            if delta.function_call.name and func_name is None:
+                func_name = delta.function_call.name
+                yield "tool", {"name": func_name, "status": "started"}
+            if delta.function_call.arguments:
+                arguments.append(delta.function_call.arguments)
+
+    if func_name:
+        yield "tool", {"name": func_name, "status": "running", "arguments": "".join(arguments)}
+        try:
+            reply = await call_function(func_name, "".join(arguments))
+        except ToolError as e:
+            yield "tool", {"name": func_name, "status": "failed"}
+            yield "reply", {"text": str(e)}
+            return
+        if reply is not None:
+            reply_cache.set(key, reply)
+            yield "tool", {"name": func_name, "status": "done"}
+            yield "reply", {"text": reply}
+            return
+
+    reply = "".join(text) or "応答がありませんでした。"
+    reply_cache.set(key, reply)
+    yield "reply", {"text": reply}
+
+
+def cache_stats() -> dict:
+    """
+    Hit rates of the chat caches. Each reply hit saves an OpenAI call, each tool hit a database round trip.
+    """
+    return {"reply": reply_cache.stats(), "tool": tool_cache.stats(), "single_flight": reply_flight.stats()}
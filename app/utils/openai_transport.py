@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import AsyncIterator, Optional
+import httpx
+
+# 記録・再生する応答ヘッダー
+_KEPT_HEADERS = ("content-type",)
+
+
+def fixture_key(request: httpx.Request) -> str:
+    """
+    Name of the fixture for a request: a hash of its method, path and JSON body.
+    """
+    try:
+        body = json.dumps(json.loads(request.content or b"null"), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        body = request.content.decode("utf-8", "replace")
+    digest = hashlib.sha256(f"{request.method} {request.url.path}\n{body}".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """
+    Body of a replayed response, split into SSE events with a delay before each one.
+    """
+
+    def __init__(self, body: bytes, chunk_latency: float):
+        self._body = body
+        self._chunk_latency = chunk_latency
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        if not self._chunk_latency:
+            yield self._body
+            return
+        for chunk in self._body.split(b"\n\n"):
+            if chunk:
+                await asyncio.sleep(self._chunk_latency)
+                yield chunk + b"\n\n"
+
+
+class RecordReplayTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport for the OpenAI client that records responses to fixture files or replays them.
+
+    record: send requests to the real API and save each response as <fixtures_dir>/<key>.json.
+    replay: answer from the fixture files without network access, after latency seconds
+            (and chunk_latency seconds between the events of a streamed response).
+            A request without a fixture gets a 404, which the client raises as NotFoundError.
+    """
+
+    def __init__(
+        self,
+        mode: str,
+        fixtures_dir: str,
+        latency: float = 0.0,
+        chunk_latency: float = 0.0,
+        upstream: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown transport mode: {mode}")
+        self.mode = mode
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self._upstream = upstream or (httpx.AsyncHTTPTransport() if mode == "record" else None)
+        self.replayed = 0
+        self.missing = 0
+
+    def _path(self, request: httpx.Request) -> str:
+        return os.path.join(self.fixtures_dir, f"{fixture_key(request)}.json")
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.mode == "record":
+            return await self._record(request)
+        return await self._replay(request)
+
+    async def _record(self, request: httpx.Request) -> httpx.Response:
+        response = await self._upstream.handle_async_request(request)
+        body = await response.aread()
+        await response.aclose()
+
+        fixture = {
+            "request": {
+                "method": request.method,
+                "path": request.url.path,
+                "body": json.loads(request.content) if request.content else None
+            },
+            "response": {
+                "status_code": response.status_code,
+                "headers": {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers},
+                "body": body.decode("utf-8")
+            }
+        }
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        with open(self._path(request), "w", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=2)
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=fixture["response"]["headers"],
+            content=body,
+            request=request
+        )
+
+    async def _replay(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        path = self._path(request)
+        if not os.path.exists(path):
+            self.missing += 1
+            return httpx.Response(
+                status_code=404,
+                json={"error": {"message": f"No recorded fixture {os.path.basename(path)}", "type": "fixture_missing"}},
+                request=request
+            )
+
+        with open(path, encoding="utf-8") as f:
+            fixture = json.load(f)["response"]
+        self.replayed += 1
+        return httpx.Response(
+            status_code=fixture["status_code"],
+            headers=fixture["headers"],
+            stream=_ReplayStream(fixture["body"].encode("utf-8"), self.chunk_latency),
+            request=request
+        )
+
+    async def aclose(self) -> None:
+        if self._upstream is not None:
+            await self._upstream.aclose()
@@ -0,0 +1,102 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one in-flight computation.
+
+    do() shares the running computation between callers. do_stale() additionally
+    keeps the last result per key, tagged with a version: while a newer version
+    is being computed in the background, callers get the previous result.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._results: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.calls = 0
+        self.shared = 0
+        self.fresh = 0
+        self.stale = 0
+        self.refresh_errors = 0
+
+    def _start(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+            return task
+
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return task
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn, or wait for the identical call already in flight.
+        """
+        self.calls += 1
+        # shield: a cancelled caller must not cancel the shared computation
+        return await asyncio.shield(self._start(key, fn))
+
+    def _refresh(self, key: Hashable, version: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        async def run():
+            try:
+                value = await fn()
+            except Exception:
+                self.refresh_errors += 1
+                raise
+            self._results[key] = (version, value)
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+            return value
+
+        return self._start((key, version), run)
+
+    @staticmethod
+    def _retrieve_exception(task: asyncio.Task) -> None:
+        # 裏で失敗した更新の例外を回収する（古い結果を返し続ける）
+        if not task.cancelled():
+            task.exception()
+
+    async def do_stale(self, key: Hashable, version: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Like do(), but serve the previous result while a newer version is refreshed in the background.
+        """
+        self.calls += 1
+        stored = self._results.get(key)
+        if stored is None:
+            return await asyncio.shield(self._refresh(key, version, fn))
+
+        stored_version, value = stored
+        self._results.move_to_end(key)
+        if stored_version == version:
+            self.fresh += 1
+            return value
+
+        # 古い結果を返しつつ、裏で1回だけ再計算する
+        self.stale += 1
+        task = self._refresh(key, version, fn)
+        task.add_done_callback(self._retrieve_exception)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters of this single-flight group.
+        """
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "fresh": self.fresh,
+            "stale": self.stale,
+            "refresh_errors": self.refresh_errors,
+            "in_flight": len(self._inflight),
+            "stored": len(self._results)
+        }
@@ -0,0 +1,147 @@
+import bisect
+import sys
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+from app.utils.normalize import name_terms, normalize_name
+
+# Typo tolerance: at most this many edits per FUZZY_CHARS characters of the key (and at least one)
+FUZZY_CHARS = 4
+
+# Keys shorter than this get prefix matches only (one edit would match almost everything)
+FUZZY_MIN_LENGTH = 3
+
+# Leading characters that must be typed right for a fuzzy match (keeps the trie walk small)
+FUZZY_PREFIX_LENGTH = 1
+
+# 正規化後の語に制御文字は残らないので、prefix + "\x00" は prefix で始まる最初の長い語より前に来る
+_AFTER_PREFIX = "\x00"
+
+
+class Suggestion(NamedTuple):
+    id: str
+    name: str
+    intra_name: str
+    user_image: Optional[str]
+
+
+class SuggestIndex:
+    """
+    Prefix index of user names and intra names for typeahead.
+
+    Terms (normalized whole names and their words) are kept in a sorted array of
+    (term, user_id) pairs, so a prefix is one bisect plus a short scan. The array
+    doubles as a trie (the children of a prefix are found by bisecting past each
+    next character), which is walked with an edit-distance row to tolerate typos.
+    """
+
+    def __init__(self, users: Iterable[Suggestion] = ()):
+        self._users: Dict[str, Suggestion] = {}
+        self._terms: Dict[str, Set[str]] = {}
+        self._keys: List[Tuple[str, str]] = []
+        for user in users:
+            self._users[user.id] = user
+            self._terms[user.id] = name_terms(user.name, user.intra_name)
+        # 初回構築はまとめてソートする
+        self._keys = sorted((term, user_id) for user_id, terms in self._terms.items() for term in terms)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def add(self, user: Suggestion) -> None:
+        """
+        Add a user, or replace the entry of a user whose name changed.
+        """
+        self.remove(user.id)
+        terms = name_terms(user.name, user.intra_name)
+        self._users[user.id] = user
+        self._terms[user.id] = terms
+        for term in terms:
+            bisect.insort(self._keys, (term, user.id))
+
+    def remove(self, user_id: str) -> None:
+        """
+        Remove a user (no-op for unknown IDs).
+        """
+        terms = self._terms.pop(user_id, None)
+        if terms is None:
+            return
+        del self._users[user_id]
+        for term in terms:
+            i = bisect.bisect_left(self._keys, (term, user_id))
+            if i < len(self._keys) and self._keys[i] == (term, user_id):
+                del self._keys[i]
+
+    def _prefix_matches(self, key: str, limit: int, found: Dict[str, None]) -> None:
+        i = bisect.bisect_left(self._keys, (key, ""))
+        while len(found) < limit and i < len(self._keys):
+            term, user_id = self._keys[i]
+            if not term.startswith(key):
+                break
+            found.setdefault(user_id)
+            i += 1
+
+    def _children(self, prefix: str) -> Iterator[str]:
+        """
+        Distinct characters that follow prefix in the stored terms.
+        """
+        keys = self._keys
+        i = bisect.bisect_left(keys, (prefix + _AFTER_PREFIX,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            char = keys[i][0][len(prefix)]
+            yield char
+            if ord(char) == sys.maxunicode:
+                return
+            i = bisect.bisect_left(keys, (prefix + chr(ord(char) + 1),))
+
+    def _fuzzy_prefixes(self, key: str, max_edits: int) -> List[Tuple[int, str]]:
+        """
+        Stored prefixes within max_edits of key (substitution, insertion, deletion or
+        swap of neighbours), found by walking the trie with one edit-distance row per node.
+        """
+        found = []
+        # (prefix, row, previous row) — row[j] is the distance between prefix and key[:j]
+        exact = key[:FUZZY_PREFIX_LENGTH]
+        row = [max(len(exact) - j, j - len(exact)) for j in range(len(key) + 1)]
+        stack = [(exact, row, None)]
+        while stack:
+            prefix, row, previous = stack.pop()
+            for char in self._children(prefix):
+                new_row = [row[0] + 1]
+                for j in range(1, len(key) + 1):
+                    cost = min(new_row[j - 1] + 1, row[j] + 1, row[j - 1] + (key[j - 1] != char))
+                    # 隣り合う2文字の入れ替え
+                    if previous is not None and j > 1 and key[j - 1] == prefix[-1] and key[j - 2] == char:
+                        cost = min(cost, previous[j - 2] + 1)
+                    new_row.append(cost)
+
+                if new_row[-1] <= max_edits:
+                    # この接頭辞で始まる語はすべて候補になる
+                    found.append((new_row[-1], prefix + char))
+                elif min(new_row) <= max_edits:
+                    stack.append((prefix + char, new_row, row))
+        return found
+
+    def _fuzzy_matches(self, key: str, limit: int, found: Dict[str, None]) -> None:
+        max_edits = max(1, len(key) // FUZZY_CHARS)
+        prefixes = self._fuzzy_prefixes(key, max_edits)
+        # 誤字が少なく、長さが近いものから
+        prefixes.sort(key=lambda match: (match[0], abs(len(match[1]) - len(key)), match[1]))
+        for _, prefix in prefixes:
+            if len(found) >= limit:
+                return
+            self._prefix_matches(prefix, limit, found)
+
+    def suggest(self, key: str, limit: int = 10) -> List[Suggestion]:
+        """
+        Users whose name, intra name or one of their words starts with key,
+        followed (when fewer than limit) by users whose terms are within a few typos of it.
+        """
+        key = normalize_name(key)
+        if not key:
+            return []
+
+        # dict で順序を保ったまま重複を除く
+        found: Dict[str, None] = {}
+        self._prefix_matches(key, limit, found)
+        if len(found) < limit and len(key) >= FUZZY_MIN_LENGTH:
+            self._fuzzy_matches(key, limit, found)
+        return [self._users[user_id] for user_id in found]
@@ -0,0 +1,90 @@
+"""
+Cost of the graph renderers: worker startup (import time, peak RSS) and time per image.
+
+Each startup case imports the graph router in a fresh interpreter, once as it is
+now (matplotlib loaded only for format=png) and once with matplotlib imported
+up front as the router used to. Needs no database:
+
+    python -m benchmarks.bench_graph_render
+"""
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from app.utils import graph_renderer
+
+RUNS = 5
+POINTS = (50, 1000)
+RENDERS = 10
+
+_STARTUP = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+{imports}
+elapsed = time.perf_counter() - t0
+print(json.dumps({{
+    "ms": elapsed * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "matplotlib": "matplotlib" in sys.modules
+}}))
+"""
+
+CASES = {
+    "lazy (svg default)": "import app.routers.graph",
+    "eager matplotlib": "import matplotlib.pyplot\nimport app.routers.graph",
+    "lazy + first png": (
+        "import app.routers.graph\n"
+        "from datetime import datetime\n"
+        "from app.utils.graph_renderer import render_rating_history_png\n"
+        "render_rating_history_png([datetime(2024, 1, 1)], [1500.0], 'warmup', 400, 300)"
+    ),
+}
+
+
+def startup(imports: str) -> dict:
+    runs = []
+    for _ in range(RUNS):
+        out = subprocess.run(
+            [sys.executable, "-c", _STARTUP.format(imports=imports)],
+            capture_output=True, text=True, check=True
+        )
+        runs.append(json.loads(out.stdout))
+    return {
+        "ms": statistics.median(run["ms"] for run in runs),
+        "rss_mb": statistics.median(run["rss_mb"] for run in runs),
+        "matplotlib": runs[0]["matplotlib"]
+    }
+
+
+def render_ms(render, n: int) -> float:
+    start = datetime(2024, 1, 1)
+    dates = [start + timedelta(hours=i) for i in range(n)]
+    rates = [1500 + (i * 37 % 101) - 50 for i in range(n)]
+    render(dates, rates, "Rating History", 1000, 600)  # warm up
+    times = []
+    for _ in range(RENDERS):
+        t0 = time.perf_counter()
+        render(dates, rates, "Rating History", 1000, 600)
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def main() -> None:
+    print(f"worker startup (median of {RUNS} fresh interpreters)")
+    for name, imports in CASES.items():
+        result = startup(imports)
+        print(f"  {name:<20} import {result['ms']:7.1f} ms  peak RSS {result['rss_mb']:6.1f} MB  "
+              f"matplotlib loaded: {result['matplotlib']}")
+
+    print(f"render time (median of {RENDERS}, 1000x600)")
+    for n in POINTS:
+        svg = render_ms(graph_renderer.render_rating_history_svg, n)
+        png = render_ms(graph_renderer.render_rating_history_png, n)
+        print(f"  {n:>5} points  svg {svg:7.2f} ms  png {png:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
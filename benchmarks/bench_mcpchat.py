@@ -0,0 +1,140 @@
+"""
+/api/mcpchat load test without network access: OpenAI responses are replayed
+from tests/fixtures/openai with LATENCY seconds of artificial latency
+(and CHUNK_LATENCY between streamed events).
+
+Reports p50/p99 latency (time to first event for streams) and requests/sec
+with the chat caches disabled and enabled. Run against a scratch database
+(the collections are dropped):
+
+    OPENAI_TRANSPORT=replay DB_NAME=icebreaker_bench python -m benchmarks.bench_mcpchat
+"""
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from app.database.connection import (
+    DB_NAME,
+    users_collection,
+    categories_collection,
+    ratings_collection,
+    current_ratings_collection,
+    matches_collection,
+)
+from app.database import rating_db
+from app.routers.mcpchat import create_mcpchat_endpoint
+from app.routers.result import MatchResultCreate, record_match_results
+from app.schemas.mcpchat import McpChatCreate
+from app.utils import openAI
+from app.utils.openai_transport import RecordReplayTransport
+
+FIXTURES_DIR = "tests/fixtures/openai"
+LATENCY = 0.3
+CHUNK_LATENCY = 0.02
+PROMPTS = ["typingのランキングを教えて", "バスケのランキングは？", "tuserを探して", "こんにちは"]
+REQUESTS = 400
+CONCURRENCY = 50
+
+
+async def seed() -> None:
+    """
+    Create the users and categories the recorded prompts refer to, with some results.
+    """
+    for collection in (users_collection, categories_collection, ratings_collection,
+                       current_ratings_collection, matches_collection):
+        await collection.drop()
+    await rating_db.ensure_current_ratings()
+
+    now = datetime.utcnow()
+    users = [
+        {"_id": ObjectId(), "name": f"bench{i}", "intra_name": "tuser" if i == 0 else f"bench{i}",
+         "email": f"bench{i}@example.com", "password": "x", "created_at": now, "updated_at": now}
+        for i in range(20)
+    ]
+    await users_collection.insert_many(users)
+    categories = [
+        {"_id": ObjectId(), "name": name, "created_at": now, "updated_at": now}
+        for name in ("typing⌨️", "バスケットボール⛹️‍♀️")
+    ]
+    await categories_collection.insert_many(categories)
+
+    results = []
+    for _ in range(200):
+        winner, loser = random.sample(users, 2)
+        results.append(MatchResultCreate(
+            winner_id=str(winner["_id"]),
+            loser_id=str(loser["_id"]),
+            category_id=str(random.choice(categories)["_id"]),
+            winner_point=21,
+            loser_point=random.randint(0, 19)
+        ))
+    await record_match_results(results)
+
+
+async def measure(stream: bool) -> tuple:
+    """
+    Return (latencies in ms, requests/sec).
+    """
+    from app.routers.mcpchat import create_mcpchat_stream_endpoint
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    latencies = []
+
+    async def one():
+        chat = McpChatCreate(datetime=datetime.utcnow(), content=random.choice(PROMPTS))
+        async with semaphore:
+            t0 = time.perf_counter()
+            if stream:
+                response = await create_mcpchat_stream_endpoint(chat)
+                first = True
+                async for _ in response.body_iterator:
+                    if first:
+                        latencies.append((time.perf_counter() - t0) * 1000)
+                        first = False
+            else:
+                await create_mcpchat_endpoint(chat)
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(REQUESTS)])
+    return latencies, REQUESTS / (time.perf_counter() - t0)
+
+
+def summary(latencies: list, throughput: float) -> str:
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return f"p50 {p50:8.2f} ms  p99 {p99:8.2f} ms  {throughput:8.0f} requests/sec"
+
+
+async def main() -> None:
+    if "bench" not in DB_NAME:
+        raise SystemExit(f"Refusing to drop collections in DB_NAME={DB_NAME!r}; use a *bench* database")
+
+    transport = RecordReplayTransport("replay", FIXTURES_DIR, latency=LATENCY, chunk_latency=CHUNK_LATENCY)
+    openAI.client = AsyncOpenAI(api_key="replay", http_client=DefaultAsyncHttpxClient(transport=transport))
+    await seed()
+
+    reply_size, tool_size = openAI.reply_cache.maxsize, openAI.tool_cache.maxsize
+    for cached in (False, True):
+        # maxsize 0: every entry is evicted as soon as it is stored
+        openAI.reply_cache.maxsize = reply_size if cached else 0
+        openAI.tool_cache.maxsize = tool_size if cached else 0
+        for stream in (False, True):
+            openAI.reply_cache.clear()
+            openAI.tool_cache.clear()
+            latencies, throughput = await measure(stream)
+            label = f"{'cached' if cached else 'uncached'} {'stream (ttfb)' if stream else 'reply'}"
+            print(f"{label:<24} {summary(latencies, throughput)}")
+
+    print(f"replayed {transport.replayed} responses, {transport.missing} without a fixture")
+    print(openAI.cache_stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
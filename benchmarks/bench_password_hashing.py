@@ -0,0 +1,67 @@
+"""
+Event loop stalls during a burst of sign-ins: bcrypt inline vs. in the password pool.
+
+A heartbeat task stands in for ranking/match reads on the same worker and
+records how late each tick runs while SIGNINS verifications are in flight.
+Needs no database:
+
+    python -m benchmarks.bench_password_hashing
+"""
+import asyncio
+import statistics
+import time
+
+from app.database import user_db
+
+SIGNINS = 20
+CONCURRENCY = 10
+TICK = 0.005
+
+
+async def heartbeat(lags: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - t0 - TICK) * 1000)
+
+
+async def burst(verify) -> tuple:
+    """
+    Return (heartbeat lags in ms, sign-ins/sec).
+    """
+    hashed = user_db.hash_password("password123")
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    lags, stop = [], asyncio.Event()
+    ticker = asyncio.ensure_future(heartbeat(lags, stop))
+
+    async def one():
+        async with semaphore:
+            assert await verify("password123", hashed)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(SIGNINS)])
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await ticker
+    return lags, SIGNINS / elapsed
+
+
+async def inline_verify(plain: str, hashed: str) -> bool:
+    return user_db.verify_password(plain, hashed)
+
+
+async def pooled_verify(plain: str, hashed: str) -> bool:
+    return await user_db.password_executor.run(user_db.verify_password, plain, hashed)
+
+
+async def main() -> None:
+    for name, verify in (("inline", inline_verify), ("pool", pooled_verify)):
+        lags, rate = await burst(verify)
+        lags.sort()
+        print(f"{name:<7} loop lag p50 {statistics.median(lags):7.2f} ms  "
+              f"max {lags[-1]:7.2f} ms  {rate:6.1f} sign-ins/sec")
+    print(user_db.password_executor.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
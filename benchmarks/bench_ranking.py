@@ -0,0 +1,116 @@
+"""
+Category ranking latency vs. size of the ratings history.
+
+Compares the old approach (scan every rating of the category and dedup per
+user in Python) with the current_ratings + $setWindowFields pipeline.
+
+Run against a scratch database (the collections are dropped):
+
+    DB_NAME=icebreaker_bench python -m benchmarks.bench_ranking
+"""
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.database.connection import DB_NAME, ratings_collection, current_ratings_collection
+from app.database import rating_db
+
+SIZES = [10_000, 100_000, 1_000_000]
+PLAYERS = 2_000
+PAGE_SIZE = 10
+REPEAT = 20
+BATCH = 10_000
+
+
+async def seed(category_id: ObjectId, n_ratings: int) -> None:
+    """
+    Insert n_ratings history documents spread over PLAYERS users.
+    """
+    await ratings_collection.drop()
+    await current_ratings_collection.drop()
+
+    users = [ObjectId() for _ in range(PLAYERS)]
+    start = datetime(2024, 1, 1)
+    batch = []
+    for i in range(n_ratings):
+        now = start + timedelta(seconds=i)
+        batch.append({
+            "user_id": random.choice(users),
+            "category_id": category_id,
+            "rate": random.gauss(1500, 150),
+            "date": now,
+            "created_at": now,
+            "updated_at": now
+        })
+        if len(batch) == BATCH:
+            await ratings_collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await ratings_collection.insert_many(batch, ordered=False)
+    await ratings_collection.create_index([("category_id", 1), ("rate", -1)])
+
+
+async def legacy_rankings(category_id: ObjectId) -> list:
+    """
+    The previous implementation: full history scan plus Python-side dedup.
+    """
+    cursor = ratings_collection.find({"category_id": category_id}).sort("rate", -1)
+    user_ratings = defaultdict(lambda: None)
+    async for rating in cursor:
+        user_id = str(rating["user_id"])
+        if user_ratings[user_id] is None or rating["rate"] > user_ratings[user_id]["rate"]:
+            user_ratings[user_id] = rating
+    ratings = list(user_ratings.values())
+    ratings.sort(key=lambda r: r["rate"], reverse=True)
+    return ratings[:PAGE_SIZE]
+
+
+async def timed(fn, *args, **kwargs) -> list:
+    """
+    Return the latencies (ms) of REPEAT calls.
+    """
+    samples = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        await fn(*args, **kwargs)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def summary(samples: list) -> str:
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50 {p50:9.2f} ms  p99 {p99:9.2f} ms"
+
+
+async def main() -> None:
+    if "bench" not in DB_NAME:
+        raise SystemExit(f"Refusing to drop collections in DB_NAME={DB_NAME!r}; use a *bench* database")
+
+    category_id = ObjectId()
+    print(f"{'ratings':>10}  {'method':<10}  latency")
+    for size in SIZES:
+        await seed(category_id, size)
+
+        t0 = time.perf_counter()
+        await rating_db.rebuild_current_ratings()
+        rebuild_ms = (time.perf_counter() - t0) * 1000
+
+        legacy = await timed(legacy_rankings, category_id)
+        pipeline = await timed(rating_db.get_category_rankings, str(category_id), limit=PAGE_SIZE)
+
+        print(f"{size:>10}  {'legacy':<10}  {summary(legacy)}")
+        print(f"{size:>10}  {'pipeline':<10}  {summary(pipeline)}  (one-off rebuild {rebuild_ms:.0f} ms)")
+
+    await ratings_collection.drop()
+    await current_ratings_collection.drop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,159 @@
+"""
+POST /api/result/ cost: the previous sequential call chain vs. the current handler,
+and POST /api/result/batch throughput.
+
+Reports p50/p99 latency of one result at a time and results/sec with
+CONCURRENCY results in flight, then results/sec when the same number of
+results is uploaded in batches of BATCH_SIZE. Run against a scratch database (the
+collections are dropped):
+
+    DB_NAME=icebreaker_bench python -m benchmarks.bench_record_result
+"""
+import asyncio
+import random
+import statistics
+import time
+from datetime import datetime
+
+from bson import ObjectId
+
+from app.database.connection import (
+    DB_NAME,
+    users_collection,
+    categories_collection,
+    ratings_collection,
+    current_ratings_collection,
+    matches_collection,
+)
+from app.database import rating_db
+from app.routers.result import MatchResultCreate, record_match_result, record_match_results
+from app.utils.rating_calculator import calculate_elo_rating_change, get_initial_rating
+
+PLAYERS = 200
+SEQUENTIAL = 500
+CONCURRENT = 2_000
+CONCURRENCY = 50
+BATCH_SIZE = 500
+
+
+async def seed() -> tuple:
+    """
+    Create PLAYERS users and one category.
+    """
+    for collection in (users_collection, categories_collection, ratings_collection,
+                       current_ratings_collection, matches_collection):
+        await collection.drop()
+    await rating_db.ensure_current_ratings()
+
+    now = datetime.utcnow()
+    users = [
+        {"_id": ObjectId(), "name": f"bench{i}", "intra_name": f"bench{i}", "email": f"bench{i}@example.com",
+         "password": "x", "created_at": now, "updated_at": now}
+        for i in range(PLAYERS)
+    ]
+    await users_collection.insert_many(users)
+    category_id = ObjectId()
+    await categories_collection.insert_one({"_id": category_id, "name": "bench", "created_at": now, "updated_at": now})
+    return [str(user["_id"]) for user in users], str(category_id)
+
+
+async def legacy_record(result: MatchResultCreate) -> None:
+    """
+    The previous handler: every read and write awaited one after another, with re-reads after inserts.
+    """
+    winner_id, loser_id, category_id = (ObjectId(result.winner_id), ObjectId(result.loser_id),
+                                        ObjectId(result.category_id))
+    await users_collection.find_one({"_id": winner_id})
+    await users_collection.find_one({"_id": loser_id})
+    await categories_collection.find_one({"_id": category_id})
+
+    now = datetime.utcnow()
+    inserted = await matches_collection.insert_one({
+        "winner_id": winner_id, "loser_id": loser_id, "category_id": category_id,
+        "winner_point": result.winner_point, "loser_point": result.loser_point,
+        "date": result.date, "created_at": now, "updated_at": now
+    })
+    await matches_collection.find_one({"_id": inserted.inserted_id})
+
+    winner = await current_ratings_collection.find_one({"user_id": winner_id, "category_id": category_id})
+    loser = await current_ratings_collection.find_one({"user_id": loser_id, "category_id": category_id})
+    new_winner_rate, new_loser_rate = calculate_elo_rating_change(
+        winner["rate"] if winner else get_initial_rating(),
+        loser["rate"] if loser else get_initial_rating()
+    )
+
+    for user_id, rate in ((winner_id, new_winner_rate), (loser_id, new_loser_rate)):
+        inserted = await ratings_collection.insert_one({
+            "user_id": user_id, "category_id": category_id, "rate": rate,
+            "date": result.date, "created_at": now, "updated_at": now
+        })
+        rating = await ratings_collection.find_one({"_id": inserted.inserted_id})
+        await rating_db.upsert_current_rating(rating)
+
+
+def random_result(users: list, category_id: str) -> MatchResultCreate:
+    winner_id, loser_id = random.sample(users, 2)
+    return MatchResultCreate(
+        winner_id=winner_id,
+        loser_id=loser_id,
+        category_id=category_id,
+        winner_point=21,
+        loser_point=random.randint(0, 19)
+    )
+
+
+async def measure(record, users: list, category_id: str) -> tuple:
+    """
+    Return (latencies in ms, results/sec under concurrency).
+    """
+    latencies = []
+    for _ in range(SEQUENTIAL):
+        result = random_result(users, category_id)
+        t0 = time.perf_counter()
+        await record(result)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one():
+        async with semaphore:
+            await record(random_result(users, category_id))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(CONCURRENT)])
+    throughput = CONCURRENT / (time.perf_counter() - t0)
+    return latencies, throughput
+
+
+def summary(latencies: list, throughput: float) -> str:
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return f"p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  {throughput:8.0f} results/sec"
+
+
+async def measure_batch(users: list, category_id: str) -> float:
+    """
+    Return results/sec when CONCURRENT results are uploaded BATCH_SIZE at a time.
+    """
+    t0 = time.perf_counter()
+    for _ in range(CONCURRENT // BATCH_SIZE):
+        await record_match_results([random_result(users, category_id) for _ in range(BATCH_SIZE)])
+    return CONCURRENT // BATCH_SIZE * BATCH_SIZE / (time.perf_counter() - t0)
+
+
+async def main() -> None:
+    if "bench" not in DB_NAME:
+        raise SystemExit(f"Refusing to drop collections in DB_NAME={DB_NAME!r}; use a *bench* database")
+
+    for name, record in (("before", legacy_record), ("after", record_match_result)):
+        users, category_id = await seed()
+        latencies, throughput = await measure(record, users, category_id)
+        print(f"{name:<7} {summary(latencies, throughput)}")
+
+    users, category_id = await seed()
+    print(f"batch   {await measure_batch(users, category_id):47.0f} results/sec ({BATCH_SIZE} per request)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,177 @@
+"""
+User search latency at 100k users: unanchored case-insensitive regexes vs. the search_terms prefix index.
+
+Also reports keys/documents examined for the first page (explain executionStats),
+the response size of one page, and the latency of deep pages of short prefixes.
+
+Run against a scratch database (the users collection is dropped):
+
+    DB_NAME=icebreaker_bench python -m benchmarks.bench_user_search
+"""
+import asyncio
+import random
+import statistics
+import string
+import time
+from datetime import datetime
+
+from bson import BSON
+
+from app.database.connection import DB_NAME, database, users_collection
+from app.database import indexes, user_db
+from app.utils.normalize import SEARCH_TERMS_VERSION, normalize_name, user_search_terms
+
+USERS = 100_000
+BATCH = 10_000
+REPEAT = 20
+KEYS = ["a", "ta", "tar", "yamada", "user12345", "zzzz"]
+# Short prefixes whose later pages are timed too
+DEEP_KEYS = ["a", "ta"]
+DEEP_PAGES = (1, 10, 100)
+FAMILY_NAMES = ["Yamada", "Tanaka", "Suzuki", "Sato", "Ito", "Watanabe", "Nakamura", "Kobayashi"]
+GIVEN_NAMES = ["Taro", "Hanako", "Kenji", "Yuki", "Sora", "Aoi", "Ren", "Mei"]
+# bcrypt の長さのダミーハッシュ
+PASSWORD = "$2b$12$" + "x" * 53
+
+
+async def seed() -> None:
+    """
+    Insert USERS users with search terms, then build the registered indexes.
+    """
+    await users_collection.drop()
+    now = datetime.utcnow()
+    batch = []
+    for i in range(USERS):
+        name = f"{random.choice(GIVEN_NAMES)} {random.choice(FAMILY_NAMES)}"
+        intra_name = f"user{i}" if i % 2 else "".join(random.choices(string.ascii_lowercase, k=8)) + str(i)
+        email = f"{intra_name}@example.com"
+        batch.append({
+            "name": name,
+            "intra_name": intra_name,
+            "email": email,
+            "password": PASSWORD,
+            "user_image": None,
+            "search_terms": user_search_terms(name, intra_name, email),
+            "search_terms_version": SEARCH_TERMS_VERSION,
+            "created_at": now,
+            "updated_at": now
+        })
+        if len(batch) == BATCH:
+            await users_collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await users_collection.insert_many(batch, ordered=False)
+    await indexes.ensure_indexes(["users"])
+
+
+def legacy_query(key: str) -> dict:
+    """
+    The previous filter: three unanchored, case-insensitive regexes.
+    """
+    return {"$or": [
+        {"name": {"$regex": key, "$options": "i"}},
+        {"intra_name": {"$regex": key, "$options": "i"}},
+        {"email": {"$regex": key, "$options": "i"}}
+    ]}
+
+
+async def legacy_search(key: str) -> list:
+    return await users_collection.find(legacy_query(key)).to_list(None)
+
+
+async def indexed_search(key: str) -> list:
+    users, _ = await user_db.search_users(key)
+    return users
+
+
+def indexed_command(key: str) -> dict:
+    """
+    The find command of the first search_users page, built by user_db itself.
+    """
+    query = user_db.search_query(normalize_name(key))
+    command = {
+        "find": "users",
+        "filter": query["filter"],
+        "projection": {**user_db.PUBLIC_PROJECTION, "search_terms": 1},
+        "hint": dict(query["hint"]),
+        "min": dict(query["min"]),
+        "limit": user_db.SEARCH_LIMIT + 1
+    }
+    if "max" in query:
+        command["max"] = dict(query["max"])
+    return command
+
+
+async def page_cursors(key: str, pages: int) -> list:
+    """
+    The after values of pages 1..pages (None for the first page).
+    """
+    cursors = [None]
+    while len(cursors) < pages:
+        _, after = await user_db.search_users(key, after=cursors[-1])
+        if after is None:
+            break
+        cursors.append(after)
+    return cursors
+
+
+async def examined(command: dict) -> tuple:
+    """
+    (keys examined, documents examined) of a find command.
+    """
+    explain = await database.command("explain", command, verbosity="executionStats")
+    stats = explain["executionStats"]
+    return stats["totalKeysExamined"], stats["totalDocsExamined"]
+
+
+async def timed(fn, key: str) -> list:
+    samples = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        await fn(key)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def summary(samples: list) -> str:
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50 {p50:8.2f} ms  p99 {p99:8.2f} ms"
+
+
+async def main() -> None:
+    if "bench" not in DB_NAME:
+        raise SystemExit(f"Refusing to drop collections in DB_NAME={DB_NAME!r}; use a *bench* database")
+
+    await seed()
+    print(f"{USERS} users")
+    print(f"{'key':<10}  {'method':<8}  {'latency':<30}  {'results':>7}  {'bytes':>9}  {'keys/docs examined':>20}")
+    for key in KEYS:
+        legacy = await legacy_search(key)
+        indexed = await indexed_search(key)
+        legacy_examined = await examined({"find": "users", "filter": legacy_query(key)})
+        indexed_examined = await examined(indexed_command(key))
+        legacy_bytes = sum(len(BSON.encode(user)) for user in legacy)
+        indexed_bytes = sum(len(user.model_dump_json()) for user in indexed)
+
+        print(f"{key:<10}  {'regex':<8}  {summary(await timed(legacy_search, key)):<30}  "
+              f"{len(legacy):>7}  {legacy_bytes:>9}  {'%d/%d' % legacy_examined:>20}")
+        print(f"{key:<10}  {'indexed':<8}  {summary(await timed(indexed_search, key)):<30}  "
+              f"{len(indexed):>7}  {indexed_bytes:>9}  {'%d/%d' % indexed_examined:>20}")
+
+    print(f"deep pages ({user_db.SEARCH_LIMIT} users per page)")
+    for key in DEEP_KEYS:
+        cursors = await page_cursors(key, max(DEEP_PAGES))
+        for page in DEEP_PAGES:
+            if page > len(cursors):
+                continue
+            after = cursors[page - 1]
+            samples = await timed(lambda k: user_db.search_users(k, after=after), key)
+            print(f"{key:<10}  page {page:<4} {summary(samples)}")
+
+    await users_collection.drop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+"""
+Stress test for concurrent Elo updates on a few hot players.
+
+WORKERS processes (like gunicorn -w 4) each fire their share of RESULTS
+match results at HOT_PLAYERS players through record_match_result. The
+stored history is then replayed sequentially, in the order the rating
+state versions define, and every rating (and the final current rating
+of each player) must match the replay exactly. Run against a scratch
+database (the collections are dropped):
+
+    DB_NAME=icebreaker_bench python -m benchmarks.stress_elo_contention
+"""
+import asyncio
+import multiprocessing
+import random
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.database.connection import (
+    DB_NAME,
+    users_collection,
+    categories_collection,
+    ratings_collection,
+    current_ratings_collection,
+    matches_collection,
+)
+from app.database import rating_db
+from app.utils.rating_calculator import calculate_elo_rating_change, get_initial_rating
+
+HOT_PLAYERS = 4
+RESULTS = 4_000
+WORKERS = 4
+CONCURRENCY = 100
+
+
+async def seed() -> tuple:
+    """
+    Create the hot players and one category.
+    """
+    for collection in (users_collection, categories_collection, ratings_collection,
+                       current_ratings_collection, matches_collection):
+        await collection.drop()
+    await rating_db.ensure_current_ratings()
+
+    now = datetime.utcnow()
+    users = [
+        {"_id": ObjectId(), "name": f"hot{i}", "intra_name": f"hot{i}", "email": f"hot{i}@example.com",
+         "password": "x", "created_at": now, "updated_at": now}
+        for i in range(HOT_PLAYERS)
+    ]
+    await users_collection.insert_many(users)
+    category_id = ObjectId()
+    await categories_collection.insert_one({"_id": category_id, "name": "stress", "created_at": now, "updated_at": now})
+    return [str(user["_id"]) for user in users], str(category_id)
+
+
+async def fire(users: list, category_id: str, count: int) -> tuple:
+    """
+    Record count results concurrently; returns (recorded, rejected by contention).
+    """
+    from app.routers.result import MatchResultCreate, record_match_result
+
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    recorded = rejected = 0
+
+    async def one():
+        nonlocal recorded, rejected
+        winner_id, loser_id = random.sample(users, 2)
+        async with semaphore:
+            try:
+                await record_match_result(MatchResultCreate(
+                    winner_id=winner_id,
+                    loser_id=loser_id,
+                    category_id=category_id,
+                    winner_point=21,
+                    loser_point=random.randint(0, 19)
+                ))
+                recorded += 1
+            except HTTPException as e:
+                if e.status_code != 409:
+                    raise
+                rejected += 1
+
+    await asyncio.gather(*[one() for _ in range(count)])
+    return recorded, rejected
+
+
+def worker(users: list, category_id: str, count: int, queue) -> None:
+    queue.put(asyncio.run(fire(users, category_id, count)))
+
+
+async def verify(category_id: str) -> list:
+    """
+    Replay the stored matches sequentially and return the mismatches found.
+    """
+    category_oid = ObjectId(category_id)
+    matches = {m["_id"]: m async for m in matches_collection.find({"category_id": category_oid})}
+    ratings_by_match = defaultdict(dict)
+    async for rating in ratings_collection.find({"category_id": category_oid}):
+        ratings_by_match[rating["match_id"]][rating["user_id"]] = rating
+
+    # Each player's results are ordered by their rating state version
+    pending = defaultdict(dict)
+    for match_id, ratings in ratings_by_match.items():
+        for user_id, rating in ratings.items():
+            pending[user_id][rating["version"]] = match_id
+
+    errors = []
+    applied = defaultdict(int)
+    rates = defaultdict(get_initial_rating)
+    ready = [
+        match_id for match_id, ratings in ratings_by_match.items()
+        if all(rating["version"] == 1 for rating in ratings.values())
+    ]
+    replayed = 0
+    while ready:
+        match_id = ready.pop()
+        match = matches[match_id]
+        winner, loser = match["winner_id"], match["loser_id"]
+        new_winner, new_loser = calculate_elo_rating_change(rates[winner], rates[loser])
+        stored = ratings_by_match[match_id]
+        if stored[winner]["rate"] != new_winner or stored[loser]["rate"] != new_loser:
+            errors.append(f"match {match_id}: stored ratings differ from replay")
+        rates[winner], rates[loser] = new_winner, new_loser
+        replayed += 1
+
+        # A player's next match becomes ready once the other player is also at the right version
+        for user_id in (winner, loser):
+            applied[user_id] += 1
+            next_match = pending[user_id].get(applied[user_id] + 1)
+            if next_match is None:
+                continue
+            if all(applied[other] + 1 == rating["version"]
+                   for other, rating in ratings_by_match[next_match].items()):
+                ready.append(next_match)
+
+    if replayed != len(matches):
+        errors.append(f"only {replayed} of {len(matches)} matches could be replayed in version order")
+
+    async for state in current_ratings_collection.find({"category_id": category_oid}):
+        if state["rate"] != rates[state["user_id"]]:
+            errors.append(f"user {state['user_id']}: current rating {state['rate']} != replay {rates[state['user_id']]}")
+        if state.get("claim") is not None:
+            errors.append(f"user {state['user_id']}: claim left behind")
+    return errors
+
+
+async def main() -> None:
+    if "bench" not in DB_NAME:
+        raise SystemExit(f"Refusing to drop collections in DB_NAME={DB_NAME!r}; use a *bench* database")
+
+    users, category_id = await seed()
+
+    t0 = time.perf_counter()
+    if WORKERS == 1:
+        outcomes = [await fire(users, category_id, RESULTS)]
+    else:
+        # spawn: each worker opens its own MongoDB client, like a gunicorn worker
+        context = multiprocessing.get_context("spawn")
+        queue = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(users, category_id, RESULTS // WORKERS, queue))
+            for _ in range(WORKERS)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+    elapsed = time.perf_counter() - t0
+
+    recorded = sum(r for r, _ in outcomes)
+    rejected = sum(r for _, r in outcomes)
+    print(f"{recorded} results recorded, {rejected} rejected by contention, "
+          f"{recorded / elapsed:.0f} results/sec")
+
+    errors = await verify(category_id)
+    for error in errors[:20]:
+        print(error)
+    print("FAIL" if errors else "PASS: stored ratings match a sequential replay")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,33 @@
 from fastapi import FastAPI
 from app.routers import user, category, rating, match, result, ranking, auth, graph, mcpchat
+from app.database import rating_db, user_db, indexes
+from app.utils import leaderboard
+from app.utils.dataloader import RequestScopeMiddleware
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import asyncio
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Prepare indexes and read models before serving requests.
+    """
+    await indexes.ensure_indexes()
+    await user_db.ensure_search_terms()
+    await user_db.load_suggest_index()
+    # 履歴から current_ratings を初回構築
+    await rating_db.ensure_current_ratings()
+    await leaderboard.load_leaderboards()
+    yield
+
+
 # FastAPIインスタンス（タイトルや説明込みで1つだけ作成）
 app = FastAPI(
     title="IceBreaker API",
     description="API for IceBreaker application",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORSミドルウェアを追加
@@ -23,6 +42,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# get_user / get_category の結果をリクエスト内でキャッシュする
+app.add_middleware(RequestScopeMiddleware)
+
 # 各ルーターを登録
 app.include_router(auth.router)
 app.include_router(user.router)
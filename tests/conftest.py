@@ -2,45 +2,213 @@ import pytest
 from fastapi.testclient import TestClient
 from motor.motor_asyncio import AsyncIOMotorClient
 import mongomock
+import mongomock.aggregate
 import asyncio
+import itertools
 from bson import ObjectId
+from pymongo import DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from datetime import datetime
 from typing import Dict, Any, Generator
 
-from app.database.connection import database as app_database
+from app.database import (
+    category_db, connection, indexes, match_db, rating_db, replay_db, result_db, user_db
+)
+from app.utils.normalize import SEARCH_TERMS_VERSION, user_search_terms
 from main import app
 
 
+def _set_window_fields(in_collection, database, options):
+    """
+    $setWindowFields for mongomock: $rank / $denseRank over a single sortBy key.
+    """
+    (key, direction), = options["sortBy"].items()
+    partitions: Dict[Any, list] = {}
+    for document in in_collection:
+        partition = repr(mongomock.aggregate._parse_expression(options.get("partitionBy"), document))
+        partitions.setdefault(partition, []).append(dict(document))
+
+    output = []
+    for documents in partitions.values():
+        documents.sort(key=lambda document: document.get(key), reverse=direction < 0)
+        previous, rank, dense_rank = object(), 0, 0
+        for position, document in enumerate(documents, 1):
+            if document.get(key) != previous:
+                previous, rank, dense_rank = document.get(key), position, dense_rank + 1
+            for name, spec in options["output"].items():
+                document[name] = rank if "$rank" in spec else dense_rank
+            output.append(document)
+    return output
+
+
+mongomock.aggregate._PIPELINE_HANDLERS["$setWindowFields"] = _set_window_fields
+
+
+class AsyncCursor:
+    """
+    Motor-style wrapper of a mongomock cursor (async iteration and to_list).
+    min/max on a hinted index return the documents in that index's order, as MongoDB does.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.index_min = None
+        self.index_max = None
+
+    def __getattr__(self, name):
+        attr = getattr(self.cursor, name)
+        if not callable(attr):
+            return attr
+
+        def chain(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # sort / skip / limit などはカーソル自身を返す
+            if result is self.cursor:
+                return self
+            return result
+        return chain
+
+    def min(self, spec):
+        self.index_min = spec
+        return self
+
+    def max(self, spec):
+        self.index_max = spec
+        return self
+
+    def _documents(self) -> list:
+        documents = list(self.cursor)
+        if self.index_min is None:
+            return documents
+
+        # インデックスの範囲を順に走査する（multikey の文書は最初のキーで1回だけ返る）
+        fields = [field for field, _ in self.index_min]
+        lower = tuple(value for _, value in self.index_min)
+        upper = tuple(value for _, value in self.index_max) if self.index_max else None
+        keyed = []
+        for document in documents:
+            values = [document.get(field) for field in fields]
+            for key in itertools.product(*[value if isinstance(value, list) else [value] for value in values]):
+                if lower <= key and (upper is None or key < upper):
+                    keyed.append((key, document))
+        keyed.sort(key=lambda item: item[0])
+        seen = set()
+        ordered = []
+        for _, document in keyed:
+            if document["_id"] not in seen:
+                seen.add(document["_id"])
+                ordered.append(document)
+        return ordered
+
+    def __aiter__(self):
+        self.iterator = iter(self._documents())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length=None):
+        documents = self._documents()
+        return documents if length is None else documents[:length]
+
+    async def close(self):
+        self.cursor.close()
+
+
+class BulkResult:
+    def __init__(self, result):
+        self.bulk_api_result = result
+        self.inserted_count = result["nInserted"]
+        self.matched_count = result["nMatched"]
+        self.modified_count = result["nModified"]
+        self.upserted_count = result["nUpserted"]
+
+
+class AsyncCollection:
+    """
+    Motor-style wrapper of a mongomock collection: queries are awaitable, find/aggregate return cursors.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    def aggregate(self, *args, **kwargs):
+        return AsyncCursor(self.collection.aggregate(*args, **kwargs))
+
+    async def bulk_write(self, requests, ordered=True, session=None):
+        # mongomock の bulk_write は今の pymongo の UpdateOne を受け付けないので1件ずつ適用する
+        result = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nUpserted": 0, "writeErrors": []}
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self.collection.insert_one(request._doc)
+                    result["nInserted"] += 1
+                elif isinstance(request, DeleteOne):
+                    self.collection.delete_one(request._filter)
+                else:
+                    write = {
+                        UpdateOne: self.collection.update_one,
+                        UpdateMany: self.collection.update_many,
+                        ReplaceOne: self.collection.replace_one
+                    }[type(request)]
+                    update = write(request._filter, request._doc, upsert=request._upsert)
+                    result["nMatched"] += update.matched_count
+                    result["nModified"] += update.modified_count
+                    result["nUpserted"] += update.upserted_id is not None
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkResult(result)
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            # mongomock はセッションを扱わない
+            kwargs.pop("session", None)
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncDatabase:
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, name):
+        return AsyncCollection(self.db[name])
+
+    def __getattr__(self, name):
+        return AsyncCollection(self.db[name])
+
+
 # Mock MongoDB client
 @pytest.fixture
-def mock_mongodb():
+def mock_mongodb(monkeypatch):
     """
-    Replace the MongoDB client with a mock for testing.
+    Replace the collections the db modules imported with mongomock ones for testing.
     """
-    # Create a mongomock client
     client = mongomock.MongoClient()
     db = client["test_db"]
-    
-    # Store original database
-    original_db = app_database
-    
-    # Replace with mock database
-    app_database.client = client
-    app_database.database = db
-    app_database.users_collection = db.users
-    app_database.categories_collection = db.categories
-    app_database.ratings_collection = db.ratings
-    app_database.matches_collection = db.matches
-    
+    async_db = AsyncDatabase(db)
+
+    for module in (connection, category_db, indexes, match_db, rating_db, replay_db, result_db, user_db):
+        for name in dir(module):
+            if name.endswith("_collection"):
+                monkeypatch.setattr(module, name, AsyncCollection(db[getattr(connection, name).name]))
+        if hasattr(module, "database"):
+            monkeypatch.setattr(module, "database", async_db)
+
     yield db
-    
-    # Restore original database
-    app_database.client = original_db.client
-    app_database.database = original_db.database
-    app_database.users_collection = original_db.users_collection
-    app_database.categories_collection = original_db.categories_collection
-    app_database.ratings_collection = original_db.ratings_collection
-    app_database.matches_collection = original_db.matches_collection
 
 
 @pytest.fixture
@@ -91,7 +259,11 @@ def test_user_in_db(mock_mongodb, test_user_data) -> Dict[str, Any]:
     user_data["created_at"] = datetime.utcnow()
     user_data["updated_at"] = datetime.utcnow()
     
-    mock_mongodb.users.insert_one(user_data)
+    mock_mongodb.users.insert_one({
+        **user_data,
+        "search_terms": user_search_terms(user_data["name"], user_data["intra_name"], user_data["email"]),
+        "search_terms_version": SEARCH_TERMS_VERSION
+    })
     
     user_data["_id"] = str(user_id)  # Convert ObjectId to string for API responses
     return user_data
@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime
+
+from app.database import category_db
+from app.schemas.category import CategoryInDB, CategoryUpdate
+from app.utils import category_index
+from app.utils.category_index import CategoryIndex, normalize_name
+
+
+def _category(category_id: str, name: str) -> CategoryInDB:
+    return CategoryInDB(_id=category_id, name=name, created_at=datetime.utcnow(), updated_at=datetime.utcnow())
+
+
+INDEX = CategoryIndex([
+    _category("1", "バスケットボール⛹️‍♀️"),
+    _category("2", "typing⌨️"),
+    _category("3", "卓球🏓"),
+])
+
+
+def test_normalize_name_folds_emoji_kana_and_case():
+    """
+    Test that emoji, width, kana and case differences are folded away.
+    """
+    assert normalize_name("バスケットボール⛹️‍♀️") == "ばすけっとぼーる"
+    assert normalize_name("ﾊﾞｽｹｯﾄﾎﾞｰﾙ") == "ばすけっとぼーる"
+    assert normalize_name("ＴＹＰＩＮＧ ⌨️") == "typing"
+
+
+def test_resolve_exact_and_partial_names():
+    """
+    Test resolving names written without emoji, in another script, or abbreviated.
+    """
+    assert INDEX.resolve("typing").id == "2"
+    assert INDEX.resolve("Typing⌨️").id == "2"
+    assert INDEX.resolve("ばすけっとぼーる").id == "1"
+    assert INDEX.resolve("バスケ").id == "1"
+    assert INDEX.resolve("卓球").id == "3"
+
+
+def test_resolve_fuzzy_and_unknown_names():
+    """
+    Test that a typo still resolves and an unrelated name does not.
+    """
+    assert INDEX.resolve("typnig").id == "2"
+    assert INDEX.resolve("サッカー") is None
+    assert INDEX.resolve("⚽") is None
+
+
+def test_reloads_are_shared_and_renames_invalidate(test_category_in_db, mock_mongodb, monkeypatch):
+    """
+    Test that concurrent lookups rebuild the index once and that renaming a category
+    through category_db makes the next lookup use the new name.
+    """
+    calls = []
+    get_all_categories = category_db.get_all_categories
+    
+    async def counted():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return await get_all_categories()
+    
+    monkeypatch.setattr(category_db, "get_all_categories", counted)
+    category_index.invalidate()
+    
+    async def lookups():
+        return await asyncio.gather(*[category_index.resolve_category("unknown sport") for _ in range(10)])
+    
+    assert asyncio.run(lookups()) == [None] * 10
+    assert len(calls) == 1
+    
+    name = test_category_in_db["name"]
+    assert asyncio.run(category_index.resolve_category(name)).id == test_category_in_db["_id"]
+    asyncio.run(category_db.update_category(test_category_in_db["_id"], CategoryUpdate(name="Curling")))
+    assert asyncio.run(category_index.resolve_category("curling")).id == test_category_in_db["_id"]
+    category_index.invalidate()
@@ -0,0 +1,83 @@
+import asyncio
+
+from app.utils.dataloader import DataLoader, RequestScopeMiddleware
+
+
+def _loader(batches: list, fail: bool = False) -> DataLoader:
+    async def batch_fn(keys):
+        batches.append(sorted(keys))
+        await asyncio.sleep(0)
+        if fail:
+            raise RuntimeError("db down")
+        return {key: key.upper() for key in keys if key != "missing"}
+    return DataLoader("test", batch_fn)
+
+
+def test_loads_in_one_tick_share_one_batch():
+    """
+    Test that concurrent loads are deduplicated into a single batch call.
+    """
+    batches = []
+    loader = _loader(batches)
+    
+    async def main():
+        return await asyncio.gather(*[loader.load(key) for key in ["a", "b", "a", "missing", "c"]])
+    
+    assert asyncio.run(main()) == ["A", "B", "A", None, "C"]
+    assert batches == [["a", "b", "c", "missing"]]
+    assert loader.stats()["shared"] == 1
+
+
+def test_load_joins_running_batch():
+    """
+    Test that a key requested while its batch is running does not start another one.
+    """
+    batches = []
+    loader = _loader(batches)
+    
+    async def main():
+        first = asyncio.ensure_future(loader.load("a"))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        return await asyncio.gather(first, loader.load("a"))
+    
+    assert asyncio.run(main()) == ["A", "A"]
+    assert batches == [["a"]]
+
+
+def test_batch_errors_reach_every_caller():
+    """
+    Test that a failing batch raises in each waiting load.
+    """
+    loader = _loader([], fail=True)
+    
+    async def main():
+        return await asyncio.gather(loader.load("a"), loader.load("b"), return_exceptions=True)
+    
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(main()))
+
+
+def test_request_scope_caches_until_cleared():
+    """
+    Test that repeated loads inside one request are served from the request cache.
+    """
+    batches = []
+    loader = _loader(batches)
+    seen = []
+    
+    async def app(scope, receive, send):
+        seen.append(await loader.load("a"))
+        seen.append(await loader.load("a"))
+        loader.clear("a")
+        seen.append(await loader.load("a"))
+    
+    async def main():
+        middleware = RequestScopeMiddleware(app)
+        await middleware({"type": "http"}, None, None)
+        await middleware({"type": "http"}, None, None)
+    
+    asyncio.run(main())
+    assert seen == ["A"] * 6
+    # 2 loads per request (the first and the one after clear)
+    assert len(batches) == 4
+    assert loader.stats()["cache_hits"] == 2
@@ -0,0 +1,34 @@
+from app.utils.downsample import lttb
+
+
+def test_lttb_keeps_ends_and_count():
+    """
+    Test that LTTB keeps threshold points including the first and last.
+    """
+    xs = list(range(1000))
+    ys = [(x * 37) % 101 for x in xs]
+    
+    indexes = lttb(xs, ys, 50)
+    
+    assert len(indexes) == 50
+    assert indexes[0] == 0
+    assert indexes[-1] == 999
+    assert indexes == sorted(set(indexes))
+
+
+def test_lttb_keeps_spikes():
+    """
+    Test that a single spike in a flat line survives downsampling.
+    """
+    xs = list(range(500))
+    ys = [0.0] * 500
+    ys[321] = 100.0
+    
+    assert 321 in lttb(xs, ys, 10)
+
+
+def test_lttb_short_series_unchanged():
+    """
+    Test that a series no longer than the threshold is returned whole.
+    """
+    assert lttb([1, 2, 3], [5, 6, 7], 10) == [0, 1, 2]
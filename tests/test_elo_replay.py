@@ -0,0 +1,54 @@
+import random
+
+import pytest
+
+from app.utils.elo_replay import replay_elo, schedule_waves
+from app.utils.rating_calculator import calculate_elo_rating_change
+
+
+def _replay_one_by_one(winners, losers, rates):
+    rates = list(rates)
+    new_winner_rates, new_loser_rates = [], []
+    for winner, loser in zip(winners, losers):
+        rates[winner], rates[loser] = calculate_elo_rating_change(rates[winner], rates[loser])
+        new_winner_rates.append(rates[winner])
+        new_loser_rates.append(rates[loser])
+    return new_winner_rates, new_loser_rates, rates
+
+
+def test_schedule_waves_keeps_player_order():
+    """
+    Test that matches sharing a player never share a wave and keep their order.
+    """
+    waves = schedule_waves([0, 2, 1, 3, 0], [1, 3, 2, 0, 2], 4)
+    
+    assert waves.tolist() == [0, 0, 1, 1, 2]
+
+
+@pytest.mark.parametrize("players", [2, 500])
+def test_replay_matches_sequential_elo(players):
+    """
+    Test the replay against calculate_elo_rating_change applied one match at a time.
+    """
+    random.seed(players)
+    winners = [random.randrange(players) for _ in range(5000)]
+    losers = [(winner + random.randrange(1, players)) % players for winner in winners]
+    initial_rates = [random.uniform(1200, 1800) for _ in range(players)]
+    
+    new_winner_rates, new_loser_rates, final_rates, waves = replay_elo(winners, losers, initial_rates)
+    expected_winner, expected_loser, expected_final = _replay_one_by_one(winners, losers, initial_rates)
+    
+    assert new_winner_rates.tolist() == pytest.approx(expected_winner, abs=1e-9)
+    assert new_loser_rates.tolist() == pytest.approx(expected_loser, abs=1e-9)
+    assert final_rates.tolist() == pytest.approx(expected_final, abs=1e-9)
+    assert waves <= len(winners)
+
+
+def test_replay_without_matches():
+    """
+    Test that an empty history leaves the starting ratings unchanged.
+    """
+    _, _, final_rates, waves = replay_elo([], [], [1500.0, 1600.0])
+    
+    assert final_rates.tolist() == [1500.0, 1600.0]
+    assert waves == 0
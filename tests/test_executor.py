@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from app.utils.executor import BoundedExecutor
+
+
+def test_run_returns_result_and_counts():
+    """
+    Test that calls run in the pool and are counted.
+    """
+    executor = BoundedExecutor(max_workers=2, name="test")
+    
+    async def main():
+        return await asyncio.gather(*[executor.run(pow, 2, n) for n in range(5)])
+    
+    assert asyncio.run(main()) == [1, 2, 4, 8, 16]
+    stats = executor.stats()
+    assert stats["completed"] == 5
+    assert stats["queued"] == 0
+    assert stats["running"] == 0
+    assert 1 <= stats["max_queue_depth"] <= 5
+
+
+def test_run_propagates_errors():
+    """
+    Test that an exception raised in the pool reaches the caller.
+    """
+    executor = BoundedExecutor(max_workers=1, name="test")
+    
+    with pytest.raises(ZeroDivisionError):
+        asyncio.run(executor.run(lambda: 1 / 0))
+    assert executor.stats()["failed"] == 1
+
+
+def test_blocking_call_does_not_stall_event_loop():
+    """
+    Test that other coroutines keep running while a blocking call is in the pool.
+    """
+    executor = BoundedExecutor(max_workers=1, name="test")
+    ticks = 0
+    
+    async def ticker(stop):
+        nonlocal ticks
+        while not stop.is_set():
+            ticks += 1
+            await asyncio.sleep(0.01)
+    
+    async def main():
+        stop = asyncio.Event()
+        task = asyncio.ensure_future(ticker(stop))
+        await executor.run(time.sleep, 0.2)
+        stop.set()
+        await task
+    
+    asyncio.run(main())
+    assert ticks >= 5
@@ -0,0 +1,63 @@
+import struct
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from app.utils.graph_renderer import render_rating_history_png, render_rating_history_svg
+
+SVG = "{http://www.w3.org/2000/svg}"
+
+
+def _png_size(png: bytes):
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    return struct.unpack(">II", png[16:24])
+
+
+def test_render_rating_history_png_size():
+    """
+    Test that the image has the requested size in pixels.
+    """
+    start = datetime(2024, 1, 1)
+    dates = [start + timedelta(days=i) for i in range(5)]
+    rates = [1500, 1516, 1502, 1520, 1535]
+
+    png = render_rating_history_png(dates, rates, "Rating History", 800, 400)
+
+    assert _png_size(png) == (800, 400)
+
+
+def test_render_rating_history_png_empty():
+    """
+    Test that a user without history still gets an (empty) graph.
+    """
+    png = render_rating_history_png([], [], "Rating History", 400, 300)
+
+    assert _png_size(png) == (400, 300)
+
+
+def test_render_rating_history_svg():
+    """
+    Test that the SVG has the requested size and one line point per rating.
+    """
+    start = datetime(2024, 1, 1)
+    dates = [start + timedelta(days=i) for i in range(5)]
+    rates = [1500, 1516, 1502, 1520, 1535]
+
+    root = ET.fromstring(render_rating_history_svg(dates, rates, "Rating <History>", 800, 400))
+
+    assert (root.get("width"), root.get("height")) == ("800", "400")
+    points = [tuple(map(float, p.split(","))) for p in root.find(f"{SVG}polyline").get("points").split()]
+    assert len(points) == 5
+    # 日付順に左から右へ、高いレートほど上へ
+    assert [x for x, _ in points] == sorted(x for x, _ in points)
+    assert min(points, key=lambda p: p[1]) == points[-1]
+    assert any(text.text == "Rating <History>" for text in root.iter(f"{SVG}text"))
+
+
+def test_render_rating_history_svg_empty_and_single():
+    """
+    Test that no history and a single rating both give a valid graph.
+    """
+    empty = ET.fromstring(render_rating_history_svg([], [], "Rating History", 400, 300))
+    assert empty.find(f"{SVG}polyline") is None
+
+    single = ET.fromstring(render_rating_history_svg([datetime(2024, 1, 1)], [1500], "Rating History", 400, 300))
+    assert len(single.find(f"{SVG}polyline").get("points").split()) == 1
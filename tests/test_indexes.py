@@ -0,0 +1,58 @@
+from app.database.indexes import INDEXES, find_collscans, query_shapes
+
+
+def test_find_collscans_in_winning_plan():
+    """
+    Test that a COLLSCAN under the winning plan is reported.
+    """
+    explain = {
+        "queryPlanner": {
+            "winningPlan": {
+                "stage": "SORT",
+                "inputStage": {"stage": "COLLSCAN", "direction": "forward"}
+            },
+            "rejectedPlans": []
+        }
+    }
+    
+    assert len(find_collscans(explain)) == 1
+
+
+def test_find_collscans_ignores_rejected_plans():
+    """
+    Test that COLLSCANs of rejected plans and index scans are not reported.
+    """
+    explain = {
+        "stages": [{
+            "$cursor": {
+                "queryPlanner": {
+                    "winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}},
+                    "rejectedPlans": [{"stage": "COLLSCAN"}]
+                }
+            }
+        }]
+    }
+    
+    assert find_collscans(explain) == []
+
+
+def test_query_shapes_target_registered_collections():
+    """
+    Test that every checked query shape reads a collection with registered indexes.
+    """
+    for name, command in query_shapes().items():
+        collection = command.get("find") or command.get("aggregate")
+        assert collection in INDEXES, name
+
+
+def test_query_shapes_use_the_db_builders():
+    """
+    Test that the checked shapes are the pipelines the db layer actually runs.
+    """
+    shapes = query_shapes()
+    
+    rankings = shapes["rating_db.get_category_rankings"]["pipeline"]
+    assert any("$setWindowFields" in stage for stage in rankings)
+    
+    history = shapes["replay_db.replay_ratings (history)"]["pipeline"]
+    assert history[-1]["$group"]["_id"] == {"user_id": "$user_id", "category_id": "$category_id"}
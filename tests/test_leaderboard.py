@@ -0,0 +1,98 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+from app.utils import leaderboard
+from app.utils.leaderboard import IndexableSkipList, Leaderboard
+
+
+def test_skiplist_matches_sorted_list():
+    """
+    Test rank and select against a plain sorted list under random inserts and removes.
+    """
+    random.seed(0)
+    skiplist = IndexableSkipList()
+    reference = []
+    
+    for _ in range(2000):
+        key = (random.randint(0, 300), random.randint(0, 1000))
+        if key in reference:
+            skiplist.remove(key)
+            reference.remove(key)
+        else:
+            skiplist.insert(key)
+            reference.append(key)
+        reference.sort()
+    
+    assert len(skiplist) == len(reference)
+    for index, key in enumerate(reference):
+        assert skiplist.select(index) == key
+        assert skiplist.count_less(key) == index
+
+
+def test_leaderboard_rank_and_around():
+    """
+    Test competition ranks, rate updates and neighbours of a user.
+    """
+    board = Leaderboard()
+    board.update("a", 1600.0)
+    board.update("b", 1550.0)
+    board.update("c", 1550.0)
+    board.update("d", 1500.0)
+    
+    assert board.rank("a") == 1
+    assert board.rank("b") == 2
+    assert board.rank("c") == 2
+    assert board.rank("d") == 4
+    assert board.rank("unknown") is None
+    
+    # Updating a rate moves the user
+    board.update("d", 1700.0)
+    assert board.rank("d") == 1
+    assert board.rank("a") == 2
+    assert len(board) == 4
+    
+    around = board.around("a", 1)
+    assert [user_id for _, user_id, _ in around][0:2] == ["d", "a"]
+    assert len(around) == 3
+    assert around[0] == (1, "d", 1700.0)
+    
+    board.remove("d")
+    assert board.rank("a") == 1
+    assert board.around("d", 1) == []
+
+
+def test_reload_is_shared_and_keeps_ratings_recorded_meanwhile(monkeypatch):
+    """
+    Test that concurrent stale requests share one reload and that ratings recorded
+    during it are applied to the reloaded leaderboard.
+    """
+    calls = []
+    
+    async def get_current_ratings(category_id=None):
+        calls.append(category_id)
+        await asyncio.sleep(0.01)
+        # この時点の読み込み結果には載っていない書き込み
+        leaderboard.record_rating("cat", "b", 1700.0)
+        leaderboard.record_rating("other", "c", 1600.0)
+        return [SimpleNamespace(category_id="cat", user_id="a", rate=1600.0)]
+    
+    async def get_category(category_id):
+        return SimpleNamespace(id=category_id)
+    
+    monkeypatch.setattr(leaderboard.rating_db, "get_current_ratings", get_current_ratings)
+    monkeypatch.setattr(leaderboard.category_db, "get_category", get_category)
+    monkeypatch.setattr(leaderboard, "_leaderboards", {})
+    monkeypatch.setattr(leaderboard, "_loaded_at", {})
+    
+    async def main():
+        return await asyncio.gather(*[leaderboard.get_leaderboard("cat") for _ in range(10)])
+    
+    boards = asyncio.run(main())
+    
+    assert calls == ["cat"]
+    assert all(board is boards[0] for board in boards)
+    assert boards[0].rank("b") == 1
+    assert boards[0].rank("a") == 2
+    assert boards[0].get_rate("c") is None
+    assert leaderboard._changes == {}
@@ -110,3 +110,39 @@ def test_get_category_matches(test_client: TestClient, test_match_in_db):
     assert isinstance(data, list)
     assert len(data) > 0
     assert any(match["_id"] == test_match_in_db["_id"] for match in data)
+
+
+def test_get_user_matches_expanded(test_client: TestClient, test_match_in_db, test_user_in_db, test_category_in_db):
+    """
+    Test that expand=users,category embeds summaries (null for a missing user).
+    """
+    user_id = test_match_in_db["winner_id"]
+    
+    response = test_client.get(f"/api/match/user/{user_id}?expand=users,category")
+    
+    assert response.status_code == 200
+    match = next(m for m in response.json() if m["_id"] == test_match_in_db["_id"])
+    assert match["winner"]["name"] == test_user_in_db["name"]
+    assert match["winner"]["intra_name"] == test_user_in_db["intra_name"]
+    assert "email" not in match["winner"]
+    # The loser fixture has no user document
+    assert match["loser"] is None
+    assert match["category"]["name"] == test_category_in_db["name"]
+
+
+def test_get_category_matches_expand(test_client: TestClient, test_match_in_db):
+    """
+    Test that only the requested expansions are embedded and unknown ones are rejected.
+    """
+    category_id = test_match_in_db["category_id"]
+    
+    response = test_client.get(f"/api/match/category/{category_id}?expand=category")
+    assert response.status_code == 200
+    match = response.json()[0]
+    assert "category" in match
+    assert "winner" not in match
+    
+    plain = test_client.get(f"/api/match/category/{category_id}")
+    assert "category" not in plain.json()[0]
+    
+    assert test_client.get(f"/api/match/category/{category_id}?expand=scores").status_code == 400
@@ -0,0 +1,199 @@
+import asyncio
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+import httpx
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from app.utils import openAI
+from app.utils.openai_transport import RecordReplayTransport
+
+FIXTURES_DIR = "tests/fixtures/openai"
+
+
+@pytest.fixture(autouse=True)
+def clear_chat_caches():
+    """
+    Start every test with empty chat caches.
+    """
+    openAI.reply_cache.clear()
+    openAI.tool_cache.clear()
+    openAI.category_index.invalidate()
+
+
+def _function_call_response(name: str, arguments: dict):
+    function_call = SimpleNamespace(name=name, arguments=json.dumps(arguments))
+    message = SimpleNamespace(function_call=function_call, content=None)
+    return SimpleNamespace(choices=[SimpleNamespace(finish_reason="function_call", message=message)])
+
+
+def test_mcpchat_search_users_in_process(test_client: TestClient, test_user_in_db, monkeypatch):
+    """
+    Test that the search_users tool reads users directly instead of calling the API over HTTP.
+    """
+    async def create(**kwargs):
+        return _function_call_response("search_users", {"search_key": test_user_in_db["intra_name"]})
+    
+    monkeypatch.setattr(openAI.client.chat.completions, "create", create)
+    
+    response = test_client.post(
+        "/api/mcpchat/",
+        json={"datetime": datetime.utcnow().isoformat(), "content": "tuser を探して"}
+    )
+    
+    assert response.status_code == 200
+    assert f"{test_user_in_db['name']} (intra@{test_user_in_db['intra_name']})" in response.json()["reply"]
+
+
+def test_mcpchat_stream_emits_tokens_then_reply(test_client: TestClient, monkeypatch):
+    """
+    Test that the streaming endpoint sends each token, the final reply, and timings as SSE.
+    """
+    async def chunks():
+        for text in ("こん", "にちは"):
+            delta = SimpleNamespace(content=text, function_call=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=None)])
+    
+    async def create(**kwargs):
+        assert kwargs["stream"] is True
+        return chunks()
+    
+    monkeypatch.setattr(openAI.client.chat.completions, "create", create)
+    
+    response = test_client.post(
+        "/api/mcpchat/stream",
+        json={"datetime": datetime.utcnow().isoformat(), "content": "こんにちは"}
+    )
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert [event for event, _ in events] == ["token", "token", "reply", "done"]
+    assert events[2][1]["text"] == "こんにちは"
+    assert events[3][1]["ttfb_ms"] <= events[3][1]["total_ms"]
+
+
+def test_mcpchat_repeated_prompt_served_from_cache(test_client: TestClient, test_user_in_db, monkeypatch):
+    """
+    Test that an identical prompt is answered from the reply cache without calling OpenAI again.
+    """
+    calls = []
+    
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return _function_call_response("search_users", {"search_key": test_user_in_db["intra_name"]})
+    
+    monkeypatch.setattr(openAI.client.chat.completions, "create", create)
+    
+    body = {"datetime": datetime.utcnow().isoformat(), "content": "tuser を探して"}
+    first = test_client.post("/api/mcpchat/", json=body)
+    second = test_client.post("/api/mcpchat/", json=body)
+    
+    assert first.json()["reply"] == second.json()["reply"]
+    assert len(calls) == 1
+    
+    stats = test_client.get("/api/mcpchat/stats").json()["cache"]
+    assert stats["reply"]["hits"] == 1
+
+
+def test_mcpchat_replays_recorded_completion(test_client: TestClient, test_user_in_db, monkeypatch):
+    """
+    Test the chat path end to end against a recorded function_call completion, without network access.
+    """
+    transport = RecordReplayTransport("replay", FIXTURES_DIR)
+    client = AsyncOpenAI(api_key="replay", http_client=DefaultAsyncHttpxClient(transport=transport))
+    monkeypatch.setattr(openAI, "client", client)
+    
+    response = test_client.post(
+        "/api/mcpchat/",
+        json={"datetime": datetime.utcnow().isoformat(), "content": "tuserを探して"}
+    )
+    
+    assert response.status_code == 200
+    assert f"{test_user_in_db['name']} (intra@tuser)" in response.json()["reply"]
+    assert transport.replayed == 1
+
+
+def test_replay_transport_without_fixture_returns_404():
+    """
+    Test that a request that was never recorded is answered with a 404 instead of going to the network.
+    """
+    transport = RecordReplayTransport("replay", FIXTURES_DIR)
+    
+    async def send():
+        async with httpx.AsyncClient(transport=transport, base_url="https://api.openai.com") as client:
+            return await client.post("/v1/chat/completions", json={"model": "never-recorded"})
+    
+    response = asyncio.run(send())
+    
+    assert response.status_code == 404
+    assert response.json()["error"]["type"] == "fixture_missing"
+    assert transport.missing == 1
+
+
+def test_search_users_tool_does_not_cache_misses(test_client: TestClient):
+    """
+    Test that a search with no results is not cached, so a user created right after is found.
+    """
+    miss = asyncio.run(openAI.call_search_users("latecomer"))
+    assert miss == "該当するユーザーが見つかりませんでした。"
+    
+    response = test_client.post("/api/user/", json={
+        "name": "Late Comer",
+        "intra_name": "latecomer",
+        "email": "latecomer@example.com",
+        "password": "password123"
+    })
+    assert response.status_code == 200
+    
+    found = asyncio.run(openAI.call_search_users("latecomer"))
+    assert "Late Comer (intra@latecomer)" in found
+    assert asyncio.run(openAI.call_search_users("latecomer")) == found
+    assert openAI.tool_cache.stats()["hits"] == 1
+
+
+def test_mcpchat_tool_failure_is_not_cached(test_category_in_db, test_client: TestClient, monkeypatch):
+    """
+    Test that a reply reporting a failed tool call is not cached, so the same prompt works once the DB recovers.
+    """
+    async def create(**kwargs):
+        return _function_call_response("get_category_ranking", {"category_name": test_category_in_db["name"]})
+    
+    get_category_rankings = openAI.rating_db.get_category_rankings
+    down = [True]
+    
+    async def flaky_rankings(*args, **kwargs):
+        if down[0]:
+            raise RuntimeError("db down")
+        return await get_category_rankings(*args, **kwargs)
+    
+    monkeypatch.setattr(openAI.client.chat.completions, "create", create)
+    monkeypatch.setattr(openAI.rating_db, "get_category_rankings", flaky_rankings)
+    
+    body = {"datetime": datetime.utcnow().isoformat(), "content": "ランキングを教えて"}
+    failed = test_client.post("/api/mcpchat/", json=body)
+    assert "エラーが発生しました" in failed.json()["reply"]
+    
+    down[0] = False
+    recovered = test_client.post("/api/mcpchat/", json=body)
+    assert "エラー" not in recovered.json()["reply"]
+    assert len(openAI.reply_cache) == 1
+
+
+def test_search_users_tool_cache_uses_normalized_key(test_client: TestClient, test_user_in_db):
+    """
+    Test that keys normalizing to the same search share one tool cache entry.
+    """
+    first = asyncio.run(openAI.call_search_users(test_user_in_db["intra_name"]))
+    hits = openAI.tool_cache.stats()["hits"]
+    second = asyncio.run(openAI.call_search_users(f" {test_user_in_db['intra_name'].upper()} "))
+    
+    assert first == second
+    assert openAI.tool_cache.stats()["hits"] == hits + 1
+    assert len(openAI.tool_cache) == 1
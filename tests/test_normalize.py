@@ -0,0 +1,26 @@
+from app.utils.normalize import user_search_terms
+
+
+def test_user_search_terms_words_and_whole_values():
+    """
+    Test that search terms hold the normalized whole values and their words.
+    """
+    terms = user_search_terms("Taro Yamada", "t-yamada", "Taro.Yamada@example.com")
+    
+    assert "taroyamada" in terms
+    assert "yamada" in terms
+    assert "tyamada" in terms
+    assert "taroyamadaexamplecom" in terms
+    # ドメインの単語では検索されない
+    assert "example" not in terms
+
+
+def test_user_search_terms_fold_kana_and_width():
+    """
+    Test that katakana and full-width letters are folded like search keys.
+    """
+    terms = user_search_terms("ヤマダ タロウ", "ｙａｍａｄａ", "y@example.com")
+    
+    assert "やまだ" in terms
+    assert "たろう" in terms
+    assert "yamada" in terms
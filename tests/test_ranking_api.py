@@ -73,6 +73,24 @@ def setup_rankings(mock_mongodb, test_user_in_db, test_category_in_db):
     # Insert ratings
     mock_mongodb.ratings.insert_many(ratings)
     
+    # Current ratings read model (one document per user)
+    mock_mongodb.current_ratings.insert_many([
+        {
+            "_id": ObjectId(),
+            "user_id": rating["user_id"],
+            "category_id": rating["category_id"],
+            "rate": rating["rate"],
+            "rating_id": rating["_id"],
+            "games_played": 1,
+            "version": 1,
+            "peak_rating": rating["rate"],
+            "last_match_date": rating["date"],
+            "created_at": rating["created_at"],
+            "updated_at": rating["updated_at"]
+        }
+        for rating in ratings
+    ])
+    
     return {
         "category_id": str(category_id),
         "users": [
@@ -115,3 +133,131 @@ def test_get_category_ranking(test_client: TestClient, setup_rankings):
     # Check that the third user is the one with the lowest rating
     assert data[2]["user_id"] == setup_rankings["users"][2]["id"]
     assert data[2]["rating"] == setup_rankings["users"][2]["rate"]
+    
+    # Current rating state is included
+    assert data[0]["games_played"] == 1
+    assert data[0]["peak_rating"] == setup_rankings["users"][0]["rate"]
+
+
+def test_get_category_ranking_ties(test_client: TestClient, mock_mongodb, setup_rankings):
+    """
+    Test that tied ratings share a rank.
+    """
+    category_id = setup_rankings["category_id"]
+    
+    # Tie the third user with the second one
+    mock_mongodb.current_ratings.update_one(
+        {"user_id": ObjectId(setup_rankings["users"][2]["id"])},
+        {"$set": {"rate": 1600.0}}
+    )
+    
+    response = test_client.get(f"/api/ranking/category/{category_id}")
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["rank"] for item in data] == [1, 2, 2]
+    assert [item["dense_rank"] for item in data] == [1, 2, 2]
+
+
+def test_get_category_ranking_pagination(test_client: TestClient, setup_rankings):
+    """
+    Test paging through a category ranking with limit and offset.
+    """
+    category_id = setup_rankings["category_id"]
+    
+    response = test_client.get(f"/api/ranking/category/{category_id}?limit=2&offset=1")
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 2
+    assert data[0]["rank"] == 2
+    assert data[0]["user_id"] == setup_rankings["users"][1]["id"]
+    assert data[1]["rank"] == 3
+    assert data[1]["user_id"] == setup_rankings["users"][2]["id"]
+    
+    # Invalid page size
+    response = test_client.get(f"/api/ranking/category/{category_id}?limit=0")
+    assert response.status_code == 422
+
+
+def test_get_user_rank(test_client: TestClient, setup_rankings):
+    """
+    Test getting the rank of a single user.
+    """
+    category_id = setup_rankings["category_id"]
+    user = setup_rankings["users"][1]
+    
+    response = test_client.get(f"/api/ranking/category/{category_id}/user/{user['id']}")
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["rank"] == 2
+    assert data["rating"] == user["rate"]
+    assert data["total_players"] == 3
+    
+    # Unranked user
+    response = test_client.get(f"/api/ranking/category/{category_id}/user/{ObjectId()}")
+    assert response.status_code == 404
+
+
+def test_get_ranking_around_user(test_client: TestClient, setup_rankings):
+    """
+    Test getting the players ranked around a user.
+    """
+    category_id = setup_rankings["category_id"]
+    user = setup_rankings["users"][2]
+    
+    response = test_client.get(f"/api/ranking/category/{category_id}/around/{user['id']}?k=1")
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["rank"] for item in data] == [2, 3]
+    assert data[1]["user_id"] == user["id"]
+    assert data[0]["name"] == setup_rankings["users"][1]["name"]
+
+
+def test_user_rank_in_unknown_category_keeps_no_leaderboard(test_client: TestClient, setup_rankings):
+    """
+    Test that rank lookups in unknown categories return 404 without keeping a leaderboard for them.
+    """
+    from app.utils import leaderboard
+    
+    user_id = setup_rankings["users"][0]["id"]
+    before = len(leaderboard._leaderboards)
+    
+    for _ in range(5):
+        response = test_client.get(f"/api/ranking/category/{ObjectId()}/user/{user_id}")
+        assert response.status_code == 404
+        response = test_client.get(f"/api/ranking/category/{ObjectId()}/around/{user_id}")
+        assert response.status_code == 404
+    
+    assert len(leaderboard._leaderboards) == before
+    assert len(leaderboard._loaded_at) == before
+
+
+def test_get_category_ranking_cache_invalidated_by_result(test_client: TestClient, mock_mongodb, setup_rankings):
+    """
+    Test that a recorded result invalidates the cached ranking of its category.
+    """
+    category_id = setup_rankings["category_id"]
+    bottom, top = setup_rankings["users"][2], setup_rankings["users"][0]
+    
+    first = test_client.get(f"/api/ranking/category/{category_id}").json()
+    assert first[0]["user_id"] == top["id"]
+    
+    response = test_client.post("/api/result/", json={
+        "winner_id": bottom["id"],
+        "loser_id": top["id"],
+        "category_id": category_id,
+        "winner_point": 21,
+        "loser_point": 3
+    })
+    assert response.status_code == 201
+    
+    second = test_client.get(f"/api/ranking/category/{category_id}").json()
+    new_rates = {item["user_id"]: item["rating"] for item in second}
+    assert new_rates[bottom["id"]] > bottom["rate"]
+    assert new_rates[top["id"]] < top["rate"]
+    
+    stats = test_client.get("/api/ranking/cache/stats").json()
+    assert stats["misses"] >= 2
@@ -34,6 +34,21 @@ def test_rating_in_db(mock_mongodb, test_rating_data):
     
     mock_mongodb.ratings.insert_one(rating_data)
     
+    # Keep the current_ratings read model in sync
+    mock_mongodb.current_ratings.insert_one({
+        "_id": ObjectId(),
+        "user_id": rating_data["user_id"],
+        "category_id": rating_data["category_id"],
+        "rate": rating_data["rate"],
+        "rating_id": rating_id,
+        "games_played": 1,
+        "version": 1,
+        "peak_rating": rating_data["rate"],
+        "last_match_date": datetime.fromisoformat(rating_data["date"]),
+        "created_at": rating_data["created_at"],
+        "updated_at": rating_data["updated_at"]
+    })
+    
     # Convert back to strings for API responses
     result = rating_data.copy()
     result["_id"] = str(rating_id)
@@ -85,6 +100,7 @@ def test_get_user_category_rating(test_client: TestClient, test_rating_in_db):
     assert data["user_id"] == user_id
     assert data["category_id"] == category_id
     assert data["rate"] == test_rating_in_db["rate"]
+    assert data["_id"] == test_rating_in_db["_id"]
 
 
 def test_update_rating(test_client: TestClient, test_rating_in_db):
@@ -103,3 +119,95 @@ def test_update_rating(test_client: TestClient, test_rating_in_db):
     assert data["rate"] == update_data["rate"]
     assert data["user_id"] == test_rating_in_db["user_id"]
     assert data["category_id"] == test_rating_in_db["category_id"]
+
+
+def test_get_rating_history_pages(test_client: TestClient, mock_mongodb, test_user_in_db, test_category_in_db):
+    """
+    Test paging through a rating history with limit and the X-Next-Cursor header.
+    """
+    user_id = test_user_in_db["_id"]
+    category_id = test_category_in_db["_id"]
+    mock_mongodb.ratings.insert_many([
+        {
+            "_id": ObjectId(),
+            "user_id": ObjectId(user_id),
+            "category_id": ObjectId(category_id),
+            "rate": 1500.0 + i,
+            "date": datetime(2024, 1, 1 + i),
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow()
+        }
+        for i in range(4)
+    ])
+    
+    first = test_client.get(f"/api/rating-history/{user_id}/{category_id}", params={"limit": 2})
+    assert first.status_code == 200
+    assert [r["rate"] for r in first.json()] == [1500.0, 1501.0]
+    
+    second = test_client.get(
+        f"/api/rating-history/{user_id}/{category_id}",
+        params={"limit": 2, "after": first.headers["X-Next-Cursor"]}
+    )
+    assert second.status_code == 200
+    assert [r["rate"] for r in second.json()] == [1502.0, 1503.0]
+    assert "X-Next-Cursor" not in second.headers
+    
+    invalid = test_client.get(
+        f"/api/rating-history/{user_id}/{category_id}",
+        params={"limit": 2, "after": "not-a-cursor"}
+    )
+    assert invalid.status_code == 400
+    
+    in_range = test_client.get(
+        f"/api/rating-history/{user_id}/{category_id}",
+        params={"from": "2024-01-02T00:00:00", "to": "2024-01-02T23:59:59"}
+    )
+    assert [r["rate"] for r in in_range.json()] == [1501.0]
+
+
+def test_graph_image_draws_latest_history(test_client: TestClient, mock_mongodb, test_user_in_db, test_category_in_db, monkeypatch):
+    """
+    Test that the cached graph image is drawn from the history up to the latest rating,
+    even when the shared history flight still holds an older result.
+    """
+    from app.routers import graph
+    
+    user_id = test_user_in_db["_id"]
+    category_id = test_category_in_db["_id"]
+    now = datetime.utcnow()
+    ratings = [
+        {
+            "_id": ObjectId(),
+            "user_id": ObjectId(user_id),
+            "category_id": ObjectId(category_id),
+            "rate": 1500.0 + i * 10,
+            "date": datetime(2024, 1, 1 + i),
+            "created_at": now,
+            "updated_at": now
+        }
+        for i in range(2)
+    ]
+    mock_mongodb.ratings.insert_many(ratings)
+    mock_mongodb.current_ratings.insert_one({
+        "user_id": ObjectId(user_id),
+        "category_id": ObjectId(category_id),
+        "rate": ratings[-1]["rate"],
+        "rating_id": ratings[-1]["_id"],
+        "games_played": 2,
+        "version": 2,
+        "peak_rating": ratings[-1]["rate"],
+        "last_match_date": ratings[-1]["date"],
+        "created_at": now,
+        "updated_at": now
+    })
+    
+    async def stale_history(*args, **kwargs):
+        return []
+    
+    monkeypatch.setattr(graph, "_get_rating_history", stale_history)
+    graph.graph_cache.clear()
+    
+    response = test_client.get(f"/api/rating-history/{user_id}/{category_id}/graph-image")
+    
+    assert response.status_code == 200
+    assert response.text.count("<circle") == 2
@@ -0,0 +1,99 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from bson import ObjectId
+from app.database import replay_db
+from app.utils.rating_calculator import calculate_elo_rating_change, get_initial_rating
+
+
+def _seed(db, matches: int = 5):
+    """
+    A category, three players, their matches and an outdated rating history.
+    """
+    category_id = ObjectId()
+    db.categories.insert_one({"_id": category_id, "name": "Replay"})
+    players = [ObjectId() for _ in range(3)]
+    start = datetime(2024, 1, 1)
+    for i in range(matches):
+        winner, loser = players[i % 3], players[(i + 1) % 3]
+        match_id = ObjectId()
+        db.matches.insert_one({
+            "_id": match_id, "winner_id": winner, "loser_id": loser, "category_id": category_id,
+            "winner_point": 21, "loser_point": 10, "date": start + timedelta(days=i)
+        })
+        for user_id in (winner, loser):
+            db.ratings.insert_one({
+                "_id": ObjectId(), "user_id": user_id, "category_id": category_id, "rate": 0.0,
+                "date": start + timedelta(days=i), "match_id": match_id
+            })
+    return category_id, players
+
+
+def _expected(db, category_id):
+    rates = {}
+    for match in db.matches.find({"category_id": category_id}).sort([("date", 1), ("_id", 1)]):
+        winner, loser = match["winner_id"], match["loser_id"]
+        rates[winner], rates[loser] = calculate_elo_rating_change(
+            rates.get(winner, get_initial_rating()), rates.get(loser, get_initial_rating())
+        )
+    return rates
+
+
+def test_replay_ratings_replaces_history_in_chunks(mock_mongodb, monkeypatch):
+    """
+    Test that a replay read in several chunks rebuilds the history and current ratings
+    and leaves no staging collection behind.
+    """
+    monkeypatch.setattr(replay_db, "REPLAY_CHUNK", 2)
+    category_id, players = _seed(mock_mongodb)
+    
+    summary = asyncio.run(replay_db.replay_ratings([str(category_id)]))
+    
+    assert summary["matches"] == 5
+    assert summary["ratings"] == 10
+    assert mock_mongodb.ratings.count_documents({}) == 10
+    assert mock_mongodb.ratings.count_documents({"rate": 0.0}) == 0
+    for user_id, rate in _expected(mock_mongodb, category_id).items():
+        current = mock_mongodb.current_ratings.find_one({"user_id": user_id, "category_id": category_id})
+        assert abs(current["rate"] - rate) < 1e-9
+        last = mock_mongodb.ratings.find_one({"user_id": user_id}, sort=[("date", -1)])
+        assert current["rating_id"] == last["_id"]
+    assert not [name for name in mock_mongodb.list_collection_names() if name.startswith("ratings_replay_")]
+
+
+def test_replay_ratings_keeps_history_when_interrupted(mock_mongodb, monkeypatch):
+    """
+    Test that a replay failing before the swap leaves the live history untouched.
+    """
+    category_id, _ = _seed(mock_mongodb)
+    
+    async def fail(*args, **kwargs):
+        raise RuntimeError("interrupted")
+    
+    monkeypatch.setattr(replay_db, "_swap_in", fail)
+    with pytest.raises(RuntimeError):
+        asyncio.run(replay_db.replay_ratings([str(category_id)]))
+    
+    assert mock_mongodb.ratings.count_documents({"rate": 0.0}) == 10
+    assert not [name for name in mock_mongodb.list_collection_names() if name.startswith("ratings_replay_")]
+
+
+def test_large_replay_swaps_without_a_transaction(mock_mongodb, monkeypatch):
+    """
+    Test that a replay larger than TRANSACTION_MAX_WRITES uses the insert-then-delete swap
+    even with MONGO_TRANSACTIONS.
+    """
+    class NoSessions:
+        async def start_session(self):
+            raise AssertionError("large replays must not open a transaction")
+    
+    monkeypatch.setattr(replay_db, "USE_TRANSACTIONS", True)
+    monkeypatch.setattr(replay_db, "TRANSACTION_MAX_WRITES", 5)
+    monkeypatch.setattr(replay_db, "client", NoSessions())
+    category_id, players = _seed(mock_mongodb)
+    
+    summary = asyncio.run(replay_db.replay_ratings([str(category_id)]))
+    
+    assert summary["ratings"] == 10
+    assert mock_mongodb.ratings.count_documents({}) == 10
+    assert mock_mongodb.ratings.count_documents({"rate": 0.0}) == 0
@@ -2,6 +2,7 @@ import pytest
 from fastapi.testclient import TestClient
 from bson import ObjectId
 from datetime import datetime
+from app.database import rating_db
 
 
 @pytest.fixture
@@ -78,3 +79,112 @@ def test_record_match_result(test_client: TestClient, mock_mongodb, test_result_
     assert match is not None
     assert match["winner_point"] == result_data["winner_point"]
     assert match["loser_point"] == result_data["loser_point"]
+    
+    # Check that the current ratings read model was updated
+    winner_current = mock_mongodb.current_ratings.find_one({
+        "user_id": ObjectId(result_data["winner_id"]),
+        "category_id": ObjectId(result_data["category_id"])
+    })
+    assert winner_current is not None
+    assert winner_current["rate"] == winner_rating["rate"]
+    assert winner_current["games_played"] == 1
+    assert winner_current["peak_rating"] == winner_rating["rate"]
+    assert winner_current["rating_id"] == winner_rating["_id"]
+    assert winner_current["version"] == 1
+    assert "claim" not in winner_current
+
+
+def test_record_match_result_claim_expired(test_client: TestClient, mock_mongodb, test_result_data, monkeypatch):
+    """
+    Test that a result whose rating claim expired (and was taken over) is rejected without writing anything.
+    """
+    result_data, loser_data = test_result_data
+    mock_mongodb.users.insert_one(loser_data)
+    
+    try_claim = rating_db._try_claim
+    
+    async def claim_then_expire(keys, token):
+        states = await try_claim(keys, token)
+        # 期限切れの間に他の結果が取得した状態にする
+        mock_mongodb.current_ratings.update_many({"claim": token}, {"$set": {"claim": ObjectId()}})
+        return states
+    
+    monkeypatch.setattr(rating_db, "_try_claim", claim_then_expire)
+    
+    response = test_client.post("/api/result/", json=result_data)
+    
+    assert response.status_code == 409
+    assert mock_mongodb.matches.count_documents({}) == 0
+    assert mock_mongodb.ratings.count_documents({}) == 0
+    assert mock_mongodb.current_ratings.count_documents({"games_played": {"$gt": 0}}) == 0
+
+
+def test_record_match_result_same_user(test_client: TestClient, test_result_data):
+    """
+    Test that a user cannot play against themselves.
+    """
+    result_data, _ = test_result_data
+    result_data["loser_id"] = result_data["winner_id"]
+    
+    response = test_client.post("/api/result/", json=result_data)
+    
+    assert response.status_code == 400
+
+
+def test_record_match_results_batch(test_client: TestClient, mock_mongodb, test_result_data):
+    """
+    Test recording an ordered batch of results with per-item errors.
+    """
+    result_data, loser_data = test_result_data
+    mock_mongodb.users.insert_one(loser_data)
+    
+    same_user = dict(result_data, loser_id=result_data["winner_id"])
+    unknown_category = dict(result_data, category_id=str(ObjectId()))
+    
+    response = test_client.post(
+        "/api/result/batch",
+        json=[result_data, same_user, unknown_category, result_data]
+    )
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["recorded"] == 2
+    assert data["failed"] == 2
+    assert [item["status"] for item in data["results"]] == [201, 400, 404, 201]
+    
+    # The second result starts from the ratings produced by the first
+    first, second = data["results"][0], data["results"][3]
+    assert second["winner"]["old_rating"] == first["winner"]["new_rating"]
+    assert second["loser"]["old_rating"] == first["loser"]["new_rating"]
+    
+    winner_current = mock_mongodb.current_ratings.find_one({
+        "user_id": ObjectId(result_data["winner_id"]),
+        "category_id": ObjectId(result_data["category_id"])
+    })
+    assert winner_current["rate"] == second["winner"]["new_rating"]
+    assert winner_current["games_played"] == 2
+    assert winner_current["version"] == 2
+    assert mock_mongodb.matches.count_documents({}) == 2
+
+
+def test_late_result_does_not_move_last_match_date_back(test_client: TestClient, mock_mongodb, test_result_data):
+    """
+    Test that a result recorded after a later-dated one keeps the later last_match_date,
+    while the rate follows the order in which results are recorded.
+    """
+    result_data, loser_data = test_result_data
+    mock_mongodb.users.insert_one(loser_data)
+    
+    later = {**result_data, "date": datetime(2024, 6, 2).isoformat()}
+    earlier = {**result_data, "date": datetime(2024, 6, 1).isoformat()}
+    assert test_client.post("/api/result/", json=later).status_code == 201
+    response = test_client.post("/api/result/", json=earlier)
+    assert response.status_code == 201
+    
+    current = mock_mongodb.current_ratings.find_one({
+        "user_id": ObjectId(result_data["winner_id"]),
+        "category_id": ObjectId(result_data["category_id"])
+    })
+    assert current["last_match_date"] == datetime(2024, 6, 2)
+    assert current["rate"] == response.json()["winner"]["new_rating"]
+    assert current["games_played"] == 2
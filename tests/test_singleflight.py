@@ -0,0 +1,59 @@
+import asyncio
+
+from app.utils.singleflight import SingleFlight
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    """
+    Test that concurrent calls with the same key run the computation once.
+    """
+    flight = SingleFlight()
+    calls = []
+    
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "ranking"
+    
+    async def main():
+        return await asyncio.gather(*[flight.do("key", compute) for _ in range(50)])
+    
+    results = asyncio.run(main())
+    
+    assert results == ["ranking"] * 50
+    assert len(calls) == 1
+    assert flight.stats()["shared"] == 49
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_single_flight_stale_while_revalidate():
+    """
+    Test that the previous result is served while a newer version is refreshed once.
+    """
+    flight = SingleFlight()
+    calls = []
+    
+    def compute(value):
+        async def run():
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+        return run
+    
+    async def main():
+        first = await flight.do_stale("key", 1, compute("v1"))
+        fresh = await flight.do_stale("key", 1, compute("unused"))
+        # Version 2: every caller gets v1 while one refresh runs
+        stale = await asyncio.gather(*[flight.do_stale("key", 2, compute("v2")) for _ in range(10)])
+        await asyncio.sleep(0.05)
+        refreshed = await flight.do_stale("key", 2, compute("unused"))
+        return first, fresh, stale, refreshed
+    
+    first, fresh, stale, refreshed = asyncio.run(main())
+    
+    assert first == "v1"
+    assert fresh == "v1"
+    assert stale == ["v1"] * 10
+    assert refreshed == "v2"
+    assert calls == ["v1", "v2"]
+    assert flight.stats()["stale"] == 10
@@ -1,6 +1,8 @@
 import pytest
 from fastapi.testclient import TestClient
 from bson import ObjectId
+from app.utils.normalize import SEARCH_TERMS_VERSION
+from main import app
 
 
 def test_create_user(test_client: TestClient):
@@ -96,3 +98,108 @@ def test_search_users(test_client: TestClient, test_user_in_db):
     data = response.json()
     assert len(data) > 0
     assert any(user["_id"] == test_user_in_db["_id"] for user in data)
+
+
+def test_search_users_pages_without_passwords(test_client: TestClient, test_user_in_db):
+    """
+    Test that search matches word prefixes case-insensitively, pages with
+    X-Next-Cursor and never returns password hashes.
+    """
+    for i in range(3):
+        response = test_client.post("/api/user/", json={
+            "name": f"Paged User{i}",
+            "intra_name": f"paged{i}",
+            "email": f"paged{i}@example.com",
+            "password": "password123"
+        })
+        assert response.status_code == 200
+    
+    first = test_client.get("/api/user/?key=PAGED&limit=2")
+    assert first.status_code == 200
+    assert len(first.json()) == 2
+    assert all("password" not in user for user in first.json())
+    
+    second = test_client.get(f"/api/user/?key=PAGED&limit=2&after={first.headers['X-Next-Cursor']}")
+    assert second.status_code == 200
+    assert len(second.json()) == 1
+    assert "X-Next-Cursor" not in second.headers
+    
+    # Every user matches through several terms but is returned once
+    seen, after = [], None
+    while True:
+        params = {"key": "paged", "limit": 1, **({"after": after} if after else {})}
+        page = test_client.get("/api/user/", params=params)
+        seen.extend(user["intra_name"] for user in page.json())
+        after = page.headers.get("X-Next-Cursor")
+        if after is None:
+            break
+    assert seen == ["paged0", "paged1", "paged2"]
+    
+    invalid = test_client.get("/api/user/?key=PAGED&limit=2&after=not-a-cursor")
+    assert invalid.status_code == 400
+    
+    # Second word of the name
+    response = test_client.get("/api/user/?key=user1")
+    assert [user["intra_name"] for user in response.json()] == ["paged1"]
+
+
+def test_search_terms_recomputed_when_stale(mock_mongodb, test_user_in_db):
+    """
+    Test that users stored with terms of an older version are recomputed at startup.
+    """
+    mock_mongodb.users.update_one(
+        {"_id": ObjectId(test_user_in_db["_id"])},
+        {"$set": {"search_terms": ["stale"]}, "$unset": {"search_terms_version": ""}}
+    )
+    
+    # The app recomputes stale terms on startup
+    with TestClient(app) as client:
+        response = client.get(f"/api/user/?key={test_user_in_db['intra_name']}")
+        assert [user["_id"] for user in response.json()] == [test_user_in_db["_id"]]
+    
+    stored = mock_mongodb.users.find_one({"_id": ObjectId(test_user_in_db["_id"])})
+    assert "stale" not in stored["search_terms"]
+    assert stored["search_terms_version"] == SEARCH_TERMS_VERSION
+
+
+def test_suggest_users(test_user_in_db, test_client: TestClient):
+    """
+    Test typeahead suggestions, including a user created after startup and a typo.
+    (test_user_in_db comes first so that it is in the index loaded at startup.)
+    """
+    response = test_client.post("/api/user/", json={
+        "name": "Suggest Target",
+        "intra_name": "starget",
+        "email": "starget@example.com",
+        "password": "password123"
+    })
+    assert response.status_code == 200
+    created_id = response.json()["_id"]
+    
+    response = test_client.get("/api/user/suggest?key=targ")
+    assert response.status_code == 200
+    assert [user["_id"] for user in response.json()] == [created_id]
+    assert "email" not in response.json()[0]
+    
+    # 1文字違いでも見つかる
+    response = test_client.get("/api/user/suggest?key=tusre")
+    assert test_user_in_db["_id"] in [user["_id"] for user in response.json()]
+
+
+def test_get_users_batch(test_client: TestClient, test_user_in_db):
+    """
+    Test batch lookup: input order is kept, unknown IDs are null and listed as missing.
+    """
+    unknown_id = str(ObjectId())
+    user_ids = [unknown_id, test_user_in_db["_id"], "invalid", test_user_in_db["_id"]]
+    
+    response = test_client.post("/api/user/batch", json=user_ids)
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["users"][0] is None
+    assert data["users"][1]["_id"] == test_user_in_db["_id"]
+    assert data["users"][2] is None
+    assert data["users"][3]["_id"] == test_user_in_db["_id"]
+    assert "password" not in data["users"][1]
+    assert data["missing"] == [unknown_id, "invalid"]
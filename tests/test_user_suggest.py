@@ -0,0 +1,53 @@
+from app.utils.user_suggest import SuggestIndex, Suggestion
+
+
+def _index():
+    return SuggestIndex([
+        Suggestion("1", "Tanaka Hanako", "htanaka", None),
+        Suggestion("2", "Yamada Taro", "tyamada", None),
+        Suggestion("3", "ヤマモト ケン", "kyamamoto", None),
+    ])
+
+
+def _ids(suggestions):
+    return [suggestion.id for suggestion in suggestions]
+
+
+def test_suggest_prefix_of_name_words_and_intra_name():
+    """
+    Test that a key matches the start of the name, any of its words or the intra_name.
+    """
+    index = _index()
+    
+    assert _ids(index.suggest("tana")) == ["1"]
+    assert _ids(index.suggest("HTAN")) == ["1"]
+    assert _ids(index.suggest("taro")) == ["2"]
+    assert _ids(index.suggest("やまも")) == ["3"]
+    assert set(_ids(index.suggest("yama"))) == {"2"}
+
+
+def test_suggest_tolerates_typos():
+    """
+    Test that a missing, wrong or swapped character still finds the user.
+    """
+    index = _index()
+    
+    assert _ids(index.suggest("tnaka")) == ["1"]
+    assert _ids(index.suggest("yamoda")) == ["2"]
+    assert _ids(index.suggest("hnaako")) == ["1"]
+    assert index.suggest("zzzzz") == []
+
+
+def test_suggest_follows_add_and_remove():
+    """
+    Test that renamed and removed users are reflected immediately.
+    """
+    index = _index()
+    
+    index.add(Suggestion("2", "Suzuki Ichiro", "tyamada", None))
+    assert _ids(index.suggest("suzu")) == ["2"]
+    assert "2" not in _ids(index.suggest("yamada"))
+    
+    index.remove("1")
+    assert index.suggest("tanaka") == []
+    assert len(index) == 2